@@ -1,13 +1,51 @@
 import redis
+import redis.asyncio
+import asyncio
 import json
 import hashlib
 import logging
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
 from functools import wraps
+from typing import Any, Awaitable, Callable, Iterable, List, Optional, Tuple
 from config import settings
+from cache.local_cache import LocalCache
 
 logger = logging.getLogger(__name__)
 
+# get_or_compute() result status
+CACHE_HIT = "hit"      # Fresh value from the cache
+CACHE_STALE = "stale"  # Past its soft TTL - served while one caller refreshes it
+CACHE_MISS = "miss"    # Computed by this call
+
+# Tag sets outlive every entry they point at; dangling members are harmless
+TAG_TTL_SECONDS = 86400
+
+# Keys deleted per UNLINK call during invalidation
+DELETE_BATCH_SIZE = 500
+
+# Compare-and-delete so a lock is only released by the process holding it
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# L1 entries are dropped via pub/sub when any process rewrites or deletes them
+INVALIDATION_CHANNEL = "cache:invalidate"
+SUBSCRIBE_RETRY_SECONDS = 30
+
 class RedisCache:
+    """
+    Two-tier JSON cache: a per-process L1 in front of Redis. `client` is the
+    blocking client used by the sync API and the pub/sub thread; coroutines
+    go through `aclient`, a redis.asyncio client, so they never block the
+    event loop on a Redis round trip.
+    """
+
     def __init__(self):
         self.client = redis.Redis(
             host=settings.REDIS_HOST,
@@ -15,40 +53,478 @@ class RedisCache:
             db=settings.REDIS_DB,
             decode_responses=True
         )
+        self._aclient = None
+        self._aclient_loop = None
+        self.local = LocalCache(settings.CACHE_L1_MAX_ENTRIES, settings.CACHE_L1_MAX_BYTES)
+        self.l1_ttl = settings.CACHE_L1_TTL_SECONDS
+        self._instance_id = uuid.uuid4().hex
+        self._subscriber = None
+        self._subscriber_guard = threading.Lock()
+        self._subscribe_retry_at = 0.0
         self._hits = 0
         self._misses = 0
+        self._stale_hits = 0
+        self._l1_hits = 0
+        self._l2_hits = 0
+        self._l2_misses = 0
+        # Per-process single-flight: key -> [lock, number of users]
+        self._key_locks = {}
+        self._key_locks_guard = threading.Lock()
+        self._refreshing = set()
+        # aget_or_compute() equivalents, for coroutines on the event loop
+        self._async_key_locks = {}
+        self._background_tasks = set()
+        self._invalidations = 0
+        self._invalidation_ms_total = 0.0
+        self._last_invalidation_ms = None
+
+    @property
+    def aclient(self) -> redis.asyncio.Redis:
+        # Its connections belong to the loop that opened them
+        loop = asyncio.get_running_loop()
+        if self._aclient_loop is not loop:
+            self._aclient_loop = loop
+            self._aclient = redis.asyncio.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=settings.REDIS_DB,
+                decode_responses=True
+            )
+        return self._aclient
+
+    async def aclose(self):
+        if self._aclient is not None:
+            await self._aclient.aclose()
+            self._aclient = None
+            self._aclient_loop = None
 
     def get(self, key: str):
-        value = self.client.get(key)
-        if value:
+        """Returned values may be shared with the L1 cache - do not mutate them"""
+        value = self._fetch(key)
+        if value is not None:
             self._hits += 1
             logger.info(f"Cache hit for {key}")
-            return json.loads(value)
+            return value
         self._misses += 1
         logger.info(f"Cache miss for {key} — fetching from chain")
         return None
 
-    def set(self, key: str, value: dict, ttl: int):
-        self.client.setex(key, ttl, json.dumps(value))
+    def set(self, key: str, value: dict, ttl: int, tags: Iterable[str] = ()):
+        self._store(key, json.dumps(value), ttl, tags)
 
     def delete(self, key: str):
-        self.client.delete(key)
+        self._unlink([key])
+
+    def invalidate_tag(self, tag: str) -> int:
+        """Delete every entry written with this tag - O(entries for the tag), no keyspace scan"""
+        started = time.perf_counter()
+        tag_key = f"tag:{tag}"
+        deleted = self._delete_batched(self.client.sscan_iter(tag_key, count=DELETE_BATCH_SIZE))
+        self.client.delete(tag_key)
+        self._record_invalidation(started)
+        logger.info(f"Cache cleared for tag: {tag} ({deleted} keys deleted)")
+        return deleted
+
+    def delete_pattern(self, pattern: str) -> int:
+        """Cache invalidation by pattern — e.g., 'portfolio:0xABC*'. Incremental SCAN, never KEYS"""
+        started = time.perf_counter()
+        deleted = self._delete_batched(self.client.scan_iter(match=pattern, count=DELETE_BATCH_SIZE))
+        self._record_invalidation(started)
+        logger.info(f"Cache cleared for pattern: {pattern} ({deleted} keys deleted)")
+        return deleted
+
+    def get_or_compute(self, key: str, compute: Callable[[], dict], ttl: int,
+                       stale_ttl: Optional[int] = None, lock_timeout: int = 30,
+                       tags: Iterable[str] = ()) -> Tuple[dict, str]:
+        """
+        Return (value, status) for key, calling compute() only when needed.
+
+        Entries are fresh for `ttl` seconds, then served stale for up to
+        `stale_ttl` more (default: ttl) while a single caller recomputes them
+        in the background. On a miss only one caller per key computes - per
+        process via a local lock, across processes via a Redis lock - and
+        everyone else waits for its result instead of hitting the RPC node.
+        The key is added to each tag's set so invalidate_tag() can find it.
+        """
+        if stale_ttl is None:
+            stale_ttl = ttl
+
+        entry = self._read_entry(key)
+        if entry is not None:
+            if entry["exp"] > time.time():
+                self._hits += 1
+                logger.info(f"Cache hit for {key}")
+                return entry["v"], CACHE_HIT
+            self._stale_hits += 1
+            logger.info(f"Stale cache hit for {key} — refreshing in background")
+            self._refresh_in_background(key, compute, ttl, stale_ttl, lock_timeout, tags)
+            return entry["v"], CACHE_STALE
+
+        self._misses += 1
+        with self._local_lock(key):
+            # Another thread may have filled it while we waited for the lock
+            entry = self._read_entry(key)
+            if entry is not None:
+                return entry["v"], CACHE_HIT
+
+            token = self._acquire_lock(key, lock_timeout)
+            if token is None:
+                # Another process is computing it - wait for its result
+                entry = self._wait_for_entry(key, lock_timeout)
+                if entry is not None:
+                    return entry["v"], CACHE_HIT
+
+            logger.info(f"Cache miss for {key} — fetching from chain")
+            try:
+                value = compute()
+                self._write_entry(key, value, ttl, stale_ttl, tags)
+            finally:
+                if token is not None:
+                    self._release_lock(key, token)
+            return value, CACHE_MISS
+
+    async def aget_or_compute(self, key: str, compute: Callable[[], Awaitable[dict]], ttl: int,
+                              stale_ttl: Optional[int] = None, lock_timeout: int = 30,
+                              tags: Iterable[str] = ()) -> Tuple[dict, str]:
+        """
+        get_or_compute() for coroutine computes. Same freshness, single-flight
+        and tagging rules, but waiting happens on the event loop and stale
+        entries are refreshed by a background task instead of a thread.
+        """
+        if stale_ttl is None:
+            stale_ttl = ttl
+
+        entry = await self._aread_entry(key)
+        if entry is not None:
+            if entry["exp"] > time.time():
+                self._hits += 1
+                logger.info(f"Cache hit for {key}")
+                return entry["v"], CACHE_HIT
+            self._stale_hits += 1
+            logger.info(f"Stale cache hit for {key} — refreshing in background")
+            self._refresh_async(key, compute, ttl, stale_ttl, lock_timeout, tags)
+            return entry["v"], CACHE_STALE
+
+        self._misses += 1
+        async with self._async_local_lock(key):
+            entry = await self._aread_entry(key)
+            if entry is not None:
+                return entry["v"], CACHE_HIT
+
+            token = await self._aacquire_lock(key, lock_timeout)
+            if token is None:
+                entry = await self._await_entry(key, lock_timeout)
+                if entry is not None:
+                    return entry["v"], CACHE_HIT
+
+            logger.info(f"Cache miss for {key} — fetching from chain")
+            try:
+                value = await compute()
+                await self._awrite_entry(key, value, ttl, stale_ttl, tags)
+            finally:
+                if token is not None:
+                    await self._arelease_lock(key, token)
+            return value, CACHE_MISS
+
+    def _fetch(self, key: str) -> Optional[Any]:
+        """Decoded value from L1, falling back to Redis (which then fills L1)"""
+        value = self._fetch_local(key)
+        if value is not None:
+            return value
+        self._ensure_subscriber()
+        return self._fill_local(key, self.client.get(key))
+
+    async def _afetch(self, key: str) -> Optional[Any]:
+        value = self._fetch_local(key)
+        if value is not None:
+            return value
+        if not self._subscribed():
+            await asyncio.to_thread(self._ensure_subscriber)
+        return self._fill_local(key, await self.aclient.get(key))
+
+    def _fetch_local(self, key: str) -> Optional[Any]:
+        value = self.local.get(key)
+        if value is not None:
+            self._l1_hits += 1
+        return value
+
+    def _fill_local(self, key: str, raw: Optional[str]) -> Optional[Any]:
+        if not raw:
+            self._l2_misses += 1
+            return None
+        self._l2_hits += 1
+        value = json.loads(raw)
+        self.local.set(key, value, len(raw), self.l1_ttl)
+        return value
+
+    def _read_entry(self, key: str) -> Optional[dict]:
+        return _unwrap(self._fetch(key))
+
+    async def _aread_entry(self, key: str) -> Optional[dict]:
+        return _unwrap(await self._afetch(key))
+
+    def _write_entry(self, key: str, value: dict, ttl: int, stale_ttl: int, tags: Iterable[str] = ()):
+        entry = {"v": value, "exp": time.time() + ttl}
+        self._store(key, json.dumps(entry), max(1, ttl + stale_ttl), tags)
+
+    async def _awrite_entry(self, key: str, value: dict, ttl: int, stale_ttl: int, tags: Iterable[str] = ()):
+        entry = {"v": value, "exp": time.time() + ttl}
+        await self._astore(key, json.dumps(entry), max(1, ttl + stale_ttl), tags)
+
+    def _store(self, key: str, raw: str, ttl: int, tags: Iterable[str]):
+        """SETEX the key, record it in each tag set and announce it, in one round trip"""
+        pipe = self.client.pipeline(transaction=False)
+        self._queue_store(pipe, key, raw, ttl, tags)
+        pipe.execute()
+        self.local.set(key, json.loads(raw), len(raw), min(self.l1_ttl, ttl))
+
+    async def _astore(self, key: str, raw: str, ttl: int, tags: Iterable[str]):
+        pipe = self.aclient.pipeline(transaction=False)
+        self._queue_store(pipe, key, raw, ttl, tags)
+        await pipe.execute()
+        self.local.set(key, json.loads(raw), len(raw), min(self.l1_ttl, ttl))
 
-    def delete_pattern(self, pattern: str):
-        """Cache invalidation by pattern — e.g., 'portfolio:0xABC*'"""
-        keys = self.client.keys(pattern)
-        if keys:
-            self.client.delete(*keys)
-            logger.info(f"Cache cleared for pattern: {pattern} ({len(keys)} keys deleted)")
+    def _queue_store(self, pipe, key: str, raw: str, ttl: int, tags: Iterable[str]):
+        pipe.setex(key, ttl, raw)
+        for tag in tags:
+            pipe.sadd(f"tag:{tag}", key)
+            pipe.expire(f"tag:{tag}", TAG_TTL_SECONDS)
+        # Other processes drop their L1 copy; ours gets the new value directly
+        pipe.publish(INVALIDATION_CHANNEL, self._invalidation_message([key]))
+
+    def _delete_batched(self, keys: Iterable[str]) -> int:
+        deleted = 0
+        batch = []
+        for key in keys:
+            batch.append(key)
+            if len(batch) >= DELETE_BATCH_SIZE:
+                deleted += self._unlink(batch)
+                batch = []
+        if batch:
+            deleted += self._unlink(batch)
+        return deleted
+
+    def _unlink(self, keys: List[str]) -> int:
+        for key in keys:
+            self.local.delete(key)
+        self._publish_invalidation(keys)
+        return self.client.unlink(*keys)
+
+    def _publish_invalidation(self, keys: List[str]):
+        self.client.publish(INVALIDATION_CHANNEL, self._invalidation_message(keys))
+
+    def _invalidation_message(self, keys: List[str]) -> str:
+        return json.dumps({"origin": self._instance_id, "keys": keys})
+
+    def _on_invalidation(self, message: dict):
+        try:
+            payload = json.loads(message["data"])
+        except (TypeError, ValueError, KeyError):
+            return
+        if payload.get("origin") == self._instance_id:
+            return
+        for key in payload.get("keys", ()):
+            self.local.delete(key)
+
+    def _subscribed(self) -> bool:
+        return self._subscriber is not None and self._subscriber.is_alive()
+
+    def _ensure_subscriber(self):
+        """Start the pub/sub listener, restarting it (with a clean L1) if its connection died"""
+        if self._subscribed():
+            return
+        with self._subscriber_guard:
+            now = time.monotonic()
+            if self._subscribed() or now < self._subscribe_retry_at:
+                return
+            self._subscribe_retry_at = now + SUBSCRIBE_RETRY_SECONDS
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{INVALIDATION_CHANNEL: self._on_invalidation})
+                self._subscriber = pubsub.run_in_thread(sleep_time=1, daemon=True)
+            except redis.RedisError as e:
+                logger.warning(f"Cache invalidation listener unavailable: {e}")
+                return
+            # Messages may have been missed while we were not listening
+            self.local.clear()
+
+    def _record_invalidation(self, started: float):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._invalidations += 1
+        self._invalidation_ms_total += elapsed_ms
+        self._last_invalidation_ms = elapsed_ms
+
+    @property
+    def invalidation_stats(self) -> dict:
+        return {
+            "invalidations": self._invalidations,
+            "avg_invalidation_ms": round(self._invalidation_ms_total / self._invalidations, 3) if self._invalidations else None,
+            "last_invalidation_ms": round(self._last_invalidation_ms, 3) if self._last_invalidation_ms is not None else None
+        }
+
+    @contextmanager
+    def _local_lock(self, key: str):
+        with self._key_locks_guard:
+            slot = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            slot[1] += 1
+        try:
+            with slot[0]:
+                yield
+        finally:
+            with self._key_locks_guard:
+                slot[1] -= 1
+                if slot[1] == 0:
+                    del self._key_locks[key]
+
+    @asynccontextmanager
+    async def _async_local_lock(self, key: str):
+        slot = self._async_key_locks.setdefault(key, [asyncio.Lock(), 0])
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0:
+                del self._async_key_locks[key]
+
+    def _acquire_lock(self, key: str, timeout: int) -> Optional[str]:
+        token = uuid.uuid4().hex
+        if self.client.set(f"lock:{key}", token, nx=True, px=timeout * 1000):
+            return token
+        return None
+
+    def _release_lock(self, key: str, token: str):
+        self.client.eval(RELEASE_LOCK_SCRIPT, 1, f"lock:{key}", token)
+
+    async def _aacquire_lock(self, key: str, timeout: int) -> Optional[str]:
+        token = uuid.uuid4().hex
+        if await self.aclient.set(f"lock:{key}", token, nx=True, px=timeout * 1000):
+            return token
+        return None
+
+    async def _arelease_lock(self, key: str, token: str):
+        await self.aclient.eval(RELEASE_LOCK_SCRIPT, 1, f"lock:{key}", token)
+
+    @asynccontextmanager
+    async def locked(self, name: str, timeout: int = 30):
+        """Hold the cross-process lock for name, waiting up to timeout seconds to get it"""
+        deadline = time.monotonic() + timeout
+        token = await self._aacquire_lock(name, timeout)
+        while token is None:
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Timed out waiting for lock {name}")
+            await asyncio.sleep(0.05)
+            token = await self._aacquire_lock(name, timeout)
+        try:
+            yield
+        finally:
+            await self._arelease_lock(name, token)
+
+    def _wait_for_entry(self, key: str, timeout: int) -> Optional[dict]:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            entry = self._read_entry(key)
+            if entry is not None:
+                return entry
+            if not self.client.exists(f"lock:{key}"):
+                return None  # Holder gave up without writing a value
+            time.sleep(0.05)
+        return None
+
+    async def _await_entry(self, key: str, timeout: int) -> Optional[dict]:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            entry = await self._aread_entry(key)
+            if entry is not None:
+                return entry
+            if not await self.aclient.exists(f"lock:{key}"):
+                return None  # Holder gave up without writing a value
+            await asyncio.sleep(0.05)
+        return None
+
+    def _refresh_async(self, key: str, compute: Callable[[], Awaitable[dict]], ttl: int,
+                       stale_ttl: int, lock_timeout: int, tags: Iterable[str] = ()):
+        with self._key_locks_guard:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        async def refresh():
+            token = None
+            try:
+                token = await self._aacquire_lock(key, lock_timeout)
+                if token is None:
+                    return  # Another process is already refreshing it
+                await self._awrite_entry(key, await compute(), ttl, stale_ttl, tags)
+            except Exception as e:
+                logger.warning(f"Background refresh failed for {key}: {e}")
+            finally:
+                if token is not None:
+                    await self._arelease_lock(key, token)
+                with self._key_locks_guard:
+                    self._refreshing.discard(key)
+
+        task = asyncio.get_running_loop().create_task(refresh())
+        # The loop only keeps weak references to tasks
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    def _refresh_in_background(self, key: str, compute: Callable[[], dict], ttl: int,
+                               stale_ttl: int, lock_timeout: int, tags: Iterable[str] = ()):
+        with self._key_locks_guard:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        token = self._acquire_lock(key, lock_timeout)
+        if token is None:
+            # Another process is already refreshing it
+            with self._key_locks_guard:
+                self._refreshing.discard(key)
+            return
+
+        def refresh():
+            try:
+                self._write_entry(key, compute(), ttl, stale_ttl, tags)
+            except Exception as e:
+                logger.warning(f"Background refresh failed for {key}: {e}")
+            finally:
+                self._release_lock(key, token)
+                with self._key_locks_guard:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name=f"cache-refresh:{key}", daemon=True).start()
 
     def make_key(self, prefix: str, *args) -> str:
         """Create a consistent cache key from arguments"""
         raw = f"{prefix}:{':'.join(str(a) for a in args)}"
         return hashlib.md5(raw.encode()).hexdigest()[:16]
 
+    @property
+    def tier_stats(self) -> dict:
+        lookups = self._l1_hits + self._l2_hits + self._l2_misses
+        l2_lookups = self._l2_hits + self._l2_misses
+        return {
+            "l1_hits": self._l1_hits,
+            "l2_hits": self._l2_hits,
+            "l2_misses": self._l2_misses,
+            "l1_hit_ratio": round(self._l1_hits / lookups, 4) if lookups else None,
+            "l2_hit_ratio": round(self._l2_hits / l2_lookups, 4) if l2_lookups else None,
+            "l1_entries": len(self.local),
+            "l1_bytes": self.local.size_bytes
+        }
+
     @property
     def hit_rate(self) -> float:
-        total = self._hits + self._misses
-        return (self._hits / total * 100) if total > 0 else 0.0
+        hits = self._hits + self._stale_hits
+        total = hits + self._misses
+        return (hits / total * 100) if total > 0 else 0.0
+
+def _unwrap(entry: Optional[Any]) -> Optional[dict]:
+    # Values written by set() have no envelope - treat them as a miss
+    if not isinstance(entry, dict) or "exp" not in entry or "v" not in entry:
+        return None
+    return entry
 
 cache = RedisCache()
@@ -12,6 +12,19 @@ class Settings(BaseSettings):
     CACHE_TTL_SHORT: int = 60
     CACHE_TTL_MEDIUM: int = 300
     CACHE_TTL_LONG: int = 3600
+    CACHE_L1_MAX_ENTRIES: int = 2048
+    CACHE_L1_MAX_BYTES: int = 32 * 1024 * 1024
+    CACHE_L1_TTL_SECONDS: float = 5
+    LOG_SCAN_CHUNK_SIZE: int = 5000
+    LOG_SCAN_CONCURRENCY: int = 8
+    HTTP_POOL_SIZE: int = 100
+    HTTP_TIMEOUT_SECONDS: float = 30
+    RPC_MAX_CONCURRENCY: int = 16
+    GRAPH_MAX_CONCURRENCY: int = 4
+    COINGECKO_MAX_CONCURRENCY: int = 2
+    PRICE_TTL_SECONDS: int = 60
+    PRICE_MAX_STALE_SECONDS: int = 900
+    PRICE_REFRESH_SECONDS: float = 10
     ADMIN_SECRET: str = "changeme"
     ETHERSCAN_API_KEY: str = ""
 
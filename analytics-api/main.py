@@ -1,14 +1,18 @@
+import asyncio
 import time
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, Header, HTTPException
 from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-from routers import portfolio, gas, summary
+from routers import portfolio, gas, summary, token_flows
 from cache.redis_client import cache
 from config import settings
+from services.price_oracle import price_oracle
+from services.upstreams import upstreams, w3
 
 # Logging
 logging.basicConfig(
@@ -22,7 +26,18 @@ limiter = Limiter(key_func=get_remote_address)
 
 ADMIN_SECRET = settings.ADMIN_SECRET
 
-app = FastAPI(title="Web3 Analytics API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Keep prices of recently valued tokens fresh so portfolio reads never wait on CoinGecko
+    refresher = asyncio.create_task(price_oracle.run_refresher())
+    yield
+    refresher.cancel()
+    # Close pooled upstream connections
+    await upstreams.aclose()
+    await w3.provider.disconnect()
+    await cache.aclose()
+
+app = FastAPI(title="Web3 Analytics API", version="1.0.0", lifespan=lifespan)
 
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
@@ -41,6 +56,7 @@ app.add_middleware(TimingMiddleware)
 app.include_router(portfolio.router)
 app.include_router(gas.router)
 app.include_router(summary.router)
+app.include_router(token_flows.router)
 
 @app.get("/health")
 def health():
@@ -54,14 +70,25 @@ async def global_exception_handler(request: Request, exc: Exception):
     )
 
 @app.delete("/cache/{address}")
-def invalidate_cache(address: str, x_admin_key: str = Header(None)):
+def invalidate_cache(address: str, include_untagged: bool = False, x_admin_key: str = Header(None)):
     if x_admin_key != ADMIN_SECRET:
         raise HTTPException(status_code=403, detail="Unauthorized")
-    patterns = [f"portfolio:{address.lower()}*", f"gas:{address.lower()}*", f"flows:{address.lower()}*"]
-    for p in patterns:
-        cache.delete_pattern(p)
-    return {"message": f"Cache cleared for {address}"}
+    # Every entry for an address is recorded in its tag set when written
+    deleted = cache.invalidate_tag(f"address:{address.lower()}")
+    if include_untagged:
+        # Entries written without tags - incremental SCAN over the keyspace
+        patterns = [f"portfolio:{address.lower()}*", f"gas:{address.lower()}*", f"flows:{address.lower()}*"]
+        for p in patterns:
+            deleted += cache.delete_pattern(p)
+    return {"message": f"Cache cleared for {address}", "keys_deleted": deleted}
 
 @app.get("/cache/stats")
 def cache_stats():
-    return {"hit_rate_percent": round(cache.hit_rate, 2), "hits": cache._hits, "misses": cache._misses}
+    return {
+        "hit_rate_percent": round(cache.hit_rate, 2),
+        "hits": cache._hits,
+        "stale_hits": cache._stale_hits,
+        "misses": cache._misses,
+        **cache.tier_stats,
+        **cache.invalidation_stats
+    }
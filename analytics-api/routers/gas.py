@@ -8,4 +8,4 @@ router = APIRouter()
 async def gas_spent(address: str, days: int = Query(default=30, ge=1, le=365)):
     if not validate_address(address):
         raise HTTPException(status_code=400, detail="Invalid Ethereum address")
-    return get_gas_history(address, days)
+    return await get_gas_history(address, days)
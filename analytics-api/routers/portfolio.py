@@ -8,4 +8,4 @@ router = APIRouter()
 async def portfolio(address: str):
     if not validate_address(address):
         raise HTTPException(status_code=400, detail="Invalid Ethereum address")
-    return get_full_portfolio(address)
+    return await get_full_portfolio(address)
@@ -1,21 +1,33 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, HTTPException, Query
+from web3 import Web3
+from utils.validators import validate_address
+from services.block_time import block_times
 from services.portfolio_service import get_full_portfolio
 from services.gas_service import get_gas_history
 from services.token_flow_service import get_token_flows
+from services.request_scope import request_scope
 import asyncio
 
 router = APIRouter()
 
 @router.get("/analytics/summary/{address}")
 async def full_summary(address: str):
-    # Run all three services concurrently using asyncio
-    portfolio, gas, flows = await asyncio.gather(
-        asyncio.to_thread(get_full_portfolio, address),
-        asyncio.to_thread(get_gas_history, address, 30),
-        asyncio.to_thread(get_token_flows, address, 30)
-    )
+    if not validate_address(address):
+        raise HTTPException(status_code=400, detail="Invalid Ethereum address")
+    address = Web3.to_checksum_address(address)
+
+    # All three run on the event loop; upstream semaphores bound their concurrency.
+    # The scope pins them to one chain head and shares identical RPC calls
+    with request_scope():
+        block_number, _ = await block_times.head()
+        portfolio, gas, flows = await asyncio.gather(
+            get_full_portfolio(address),
+            get_gas_history(address, 30),
+            get_token_flows(address, 30)
+        )
     return {
         "address": address,
+        "block_number": block_number,
         "portfolio": portfolio,
         "gas_analysis": gas,
         "token_flows": flows
@@ -28,7 +40,7 @@ async def gas_spent(
     page: int = Query(default=1, ge=1),
     page_size: int = Query(default=30, ge=1, le=100)
 ):
-    data = get_gas_history(address, days)
+    data = dict(await get_gas_history(address, days))  # Cached value is shared - copy before paging
     breakdown = data["daily_breakdown"]
     start = (page - 1) * page_size
     end = start + page_size
@@ -1,8 +1,11 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query
+from utils.validators import validate_address
 from services.token_flow_service import get_token_flows
 
 router = APIRouter()
 
-@app.get("/token-flows/{address}")
-async def token_flows(address: str, days: int = 30):
-    return get_token_flows(address, days)
+@router.get("/analytics/token-flows/{address}")
+async def token_flows(address: str, days: int = Query(default=30, ge=1, le=365)):
+    if not validate_address(address):
+        raise HTTPException(status_code=400, detail="Invalid Ethereum address")
+    return await get_token_flows(address, days)
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import time
+from datetime import date, datetime, timedelta, timezone
+import redis
+from cache.redis_client import cache
+from services.request_scope import current_scope
+from services.upstreams import w3
+
+logger = logging.getLogger(__name__)
+
+# Sorted set of finalized blocks: member = block number, score = timestamp
+INDEX_KEY = "blocktime:samples"
+
+# Only blocks this far behind the head are indexed - a reorg could still change the rest
+FINALITY_DEPTH = 64
+
+# Roughly one slot; the head is re-read at most this often
+HEAD_TTL_SECONDS = 12
+
+
+class BlockTimeResolver:
+    """
+    Resolve Unix timestamps to block numbers.
+
+    Searches between the closest indexed samples on either side of the
+    timestamp, interpolating on block time (with a bisection step whenever
+    interpolation stops halving the range). Every finalized header fetched
+    on the way is added to a Redis sorted set shared by all processes, so
+    lookups near an earlier one need a call or two and repeats need none.
+    """
+
+    def __init__(self, w3, client=None, finality_depth: int = FINALITY_DEPTH, head_ttl: float = HEAD_TTL_SECONDS):
+        self.w3 = w3
+        self._client = client
+        self.finality_depth = finality_depth
+        self.head_ttl = head_ttl
+        self._head = None
+        self._head_read_at = 0.0
+        self._head_lock = asyncio.Lock()
+
+    @property
+    def client(self):
+        # The shared async client belongs to the running loop, so it is looked up per call
+        return self._client if self._client is not None else cache.aclient
+
+    async def head(self) -> tuple:
+        """
+        (block_number, timestamp) of the latest block, cached for head_ttl
+        seconds. Pinned for the lifetime of a request scope.
+        """
+        scope = current_scope()
+        if scope is not None:
+            return await scope.share("head", self._latest)
+        return await self._latest()
+
+    async def _latest(self) -> tuple:
+        async with self._head_lock:
+            if self._head is None or time.monotonic() - self._head_read_at >= self.head_ttl:
+                block = await self.w3.eth.get_block("latest")
+                self._head = (block["number"], block["timestamp"])
+                self._head_read_at = time.monotonic()
+            return self._head
+
+    async def block_at(self, timestamp: int) -> int:
+        """First block with a timestamp >= timestamp (head + 1 if it is in the future)"""
+        head_number, head_timestamp = await self.head()
+        if timestamp > head_timestamp:
+            return head_number + 1
+
+        fetched = {}
+        lo = await self._closest(timestamp, below=True)
+        if lo is None:
+            lo = (0, await self._fetch_timestamp(0))
+            fetched[0] = lo[1]
+            if lo[1] >= timestamp:
+                await self._remember(fetched, head_number)
+                return 0
+        hi = await self._closest(timestamp, below=False) or (head_number, head_timestamp)
+
+        halve = False
+        while hi[0] - lo[0] > 1:
+            span = hi[0] - lo[0]
+            if halve:
+                guess = lo[0] + span // 2
+            else:
+                guess = lo[0] + (timestamp - lo[1]) * span // max(1, hi[1] - lo[1])
+            guess = min(max(guess, lo[0] + 1), hi[0] - 1)
+
+            sample = (guess, await self._fetch_timestamp(guess))
+            fetched[guess] = sample[1]
+            if sample[1] < timestamp:
+                lo = sample
+            else:
+                hi = sample
+            # Interpolation can creep one block at a time near the answer
+            halve = not halve and (hi[0] - lo[0]) * 2 > span
+
+        await self._remember(fetched, head_number)
+        return hi[0]
+
+    async def start_date(self, days: int) -> date:
+        """First UTC date of a period made of the last `days` calendar days, today included"""
+        _, head_timestamp = await self.head()
+        return _utc_date(head_timestamp) - timedelta(days=days - 1)
+
+    async def period_start(self, days: int) -> int:
+        """First block of the last `days` UTC calendar days - aligned so daily rollups line up"""
+        return await self.block_at(_midnight(await self.start_date(days)))
+
+    async def day_boundaries(self, days: int) -> list:
+        """
+        Block ranges of the last `days` UTC calendar days, oldest first, as
+        dicts with date, from_block and to_block. Today's range ends at the head.
+        """
+        head_number, _ = await self.head()
+        first_day = await self.start_date(days)
+        starts = [first_day + timedelta(days=offset) for offset in range(days)]
+        first_blocks = await asyncio.gather(*(self.block_at(_midnight(day)) for day in starts))
+
+        boundaries = []
+        for index, start in enumerate(starts):
+            to_block = first_blocks[index + 1] - 1 if index + 1 < len(starts) else head_number
+            boundaries.append({
+                "date": start.isoformat(),
+                "from_block": first_blocks[index],
+                "to_block": to_block
+            })
+        return boundaries
+
+    async def _fetch_timestamp(self, block_number: int) -> int:
+        return (await self.w3.eth.get_block(block_number))["timestamp"]
+
+    async def _closest(self, timestamp: int, below: bool):
+        try:
+            if below:
+                found = await self.client.zrevrangebyscore(INDEX_KEY, f"({timestamp}", "-inf", start=0, num=1, withscores=True)
+            else:
+                found = await self.client.zrangebyscore(INDEX_KEY, timestamp, "+inf", start=0, num=1, withscores=True)
+        except redis.RedisError as e:
+            logger.warning(f"Block-time index unavailable: {e}")
+            return None
+        if not found:
+            return None
+        member, score = found[0]
+        return int(member), int(score)
+
+    async def _remember(self, samples: dict, head_number: int):
+        finalized = {
+            str(number): timestamp
+            for number, timestamp in samples.items()
+            if number <= head_number - self.finality_depth
+        }
+        if not finalized:
+            return
+        try:
+            await self.client.zadd(INDEX_KEY, finalized)
+        except redis.RedisError as e:
+            # The index is only an accelerator - the answer is still correct
+            logger.warning(f"Could not store block timestamps: {e}")
+
+def _utc_date(timestamp: int) -> date:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).date()
+
+def _midnight(day: date) -> int:
+    """Unix timestamp of 00:00 UTC on a date"""
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
+
+block_times = BlockTimeResolver(w3)
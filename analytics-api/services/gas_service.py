@@ -1,58 +1,163 @@
-import requests
+import asyncio
+from datetime import datetime, timedelta, timezone
 from cache.redis_client import cache
 from config import settings
+from services.block_time import block_times
+from services.upstreams import GRAPH, upstreams
 
 GRAPH_URL = f"https://gateway.thegraph.com/api/{settings.GRAPH_API_KEY}/subgraphs/id/YOUR_SUBGRAPH_ID"
 
-def get_gas_history(address: str, days: int = 30) -> dict:
+# Per-address daily rollup hash: "watermark" -> last block included,
+# "d:YYYY-MM-DD" -> "tx_count:wei_spent"
+ROLLUP_KEY = "gas:rollup:{address}"
+
+# Longest period the API serves - rollup days older than this are dropped
+MAX_ROLLUP_DAYS = 365
+
+# Rollups nobody reads for this long expire and are rebuilt on the next query
+ROLLUP_IDLE_TTL = 30 * 86400
+
+GRAPH_PAGE_SIZE = 1000
+
+async def get_gas_history(address: str, days: int = 30) -> dict:
     cache_key = f"gas:{address.lower()}:{days}d"
-    cached = cache.get(cache_key)
-    if cached:
-        return cached
+    result, _ = await cache.aget_or_compute(  # Historical — cache 1 hour
+        cache_key, lambda: build_gas_history(address, days), ttl=3600, tags=[f"address:{address.lower()}"]
+    )
+    return result
+
+async def build_gas_history(address: str, days: int = 30) -> dict:
+    from_block, start_day, rollup = await asyncio.gather(
+        block_times.period_start(days), block_times.start_date(days), update_gas_rollup(address)
+    )
+    start_day = start_day.isoformat()
+    daily = sorted((day, totals) for day, totals in rollup.items() if day >= start_day)
+
+    tx_count = sum(count for _, (count, _) in daily)
+    total_wei_spent = sum(wei for _, (_, wei) in daily)
+
+    result = {
+        "address": address,
+        "period_days": days,
+        "from_block": from_block,
+        "total_eth_spent": total_wei_spent / 1e18,
+        "transaction_count": tx_count,
+        "daily_breakdown": [
+            {"date": day, "transactions": count, "eth_spent": wei / 1e18}
+            for day, (count, wei) in daily
+        ],
+        "average_gas_per_tx_eth": (total_wei_spent / tx_count / 1e18) if tx_count else 0
+    }
+    return result
 
-    # Use The Graph to fetch outgoing transactions
+async def update_gas_rollup(address: str) -> dict:
+    """
+    Bring the address's daily gas rollup up to date and return it as
+    {date: (tx_count, wei_spent)}. Only transactions above the stored
+    watermark are fetched from The Graph, so after the first query each
+    refresh reads just the blocks mined since the last one.
+    """
+    address = address.lower()
+    key = ROLLUP_KEY.format(address=address)
+
+    async with cache.locked(key, timeout=60):
+        stored = await cache.aclient.hgetall(key)
+        if "watermark" in stored:
+            watermark = int(stored["watermark"])
+        else:
+            watermark = await block_times.period_start(MAX_ROLLUP_DAYS) - 1
+        rollup = {
+            field[2:]: tuple(int(part) for part in value.split(":"))
+            for field, value in stored.items() if field.startswith("d:")
+        }
+
+        changed = set()
+        while True:
+            txs = await _fetch_outgoing(address, watermark)
+            if len(txs) == GRAPH_PAGE_SIZE:
+                # The page may end part-way through a block - leave that block for the next page
+                last_block = int(txs[-1]["blockNumber"])
+                page = [tx for tx in txs if int(tx["blockNumber"]) < last_block]
+                if not page:
+                    # A full page inside one block: read all of that block before moving past it
+                    page = await _fetch_block_outgoing(address, last_block)
+            else:
+                page = txs
+            for tx in page:
+                day = datetime.fromtimestamp(int(tx["timestamp"]), tz=timezone.utc).date().isoformat()
+                count, wei = rollup.get(day, (0, 0))
+                rollup[day] = (count + 1, wei + int(tx["gasUsed"]) * int(tx["gasPrice"]))
+                changed.add(day)
+            if page:
+                watermark = int(page[-1]["blockNumber"])
+            if len(txs) < GRAPH_PAGE_SIZE:
+                break
+
+        cutoff = (datetime.now(timezone.utc).date() - timedelta(days=MAX_ROLLUP_DAYS)).isoformat()
+        expired = [day for day in rollup if day < cutoff]
+        for day in expired:
+            del rollup[day]
+            changed.discard(day)
+
+        pipe = cache.aclient.pipeline()
+        mapping = {f"d:{day}": f"{rollup[day][0]}:{rollup[day][1]}" for day in changed}
+        mapping["watermark"] = watermark
+        pipe.hset(key, mapping=mapping)
+        if expired:
+            pipe.hdel(key, *(f"d:{day}" for day in expired))
+        pipe.expire(key, ROLLUP_IDLE_TTL)
+        await pipe.execute()
+
+    return rollup
+
+async def _fetch_outgoing(address: str, after_block: int) -> list:
+    """Up to GRAPH_PAGE_SIZE outgoing transactions above after_block, oldest first"""
     query = """
     {
       transactions(
-        first: 1000,
-        where: { from: "%s" },
+        first: %d,
+        where: { from: "%s", blockNumber_gt: %d },
         orderBy: blockNumber,
-        orderDirection: desc
+        orderDirection: asc
       ) {
         hash
         gasUsed
         gasPrice
         blockNumber
         timestamp
-        value
       }
     }
-    """ % address.lower()
-
-    response = requests.post(GRAPH_URL, json={"query": query})
-    txs = response.json().get("data", {}).get("transactions", [])
-
-    # Aggregate by day
-    daily_gas = {}
-    total_wei_spent = 0
+    """ % (GRAPH_PAGE_SIZE, address, after_block)
 
-    for tx in txs:
-        gas_cost_wei = int(tx["gasUsed"]) * int(tx["gasPrice"])
-        total_wei_spent += gas_cost_wei
-        day = tx["timestamp"][:10]  # YYYY-MM-DD
-        daily_gas[day] = daily_gas.get(day, 0) + gas_cost_wei
+    response = await upstreams.request(GRAPH, "POST", GRAPH_URL, json={"query": query})
+    return (response.json().get("data") or {}).get("transactions", [])
 
-    result = {
-        "address": address,
-        "period_days": days,
-        "total_eth_spent": total_wei_spent / 1e18,
-        "transaction_count": len(txs),
-        "daily_breakdown": [
-            {"date": d, "eth_spent": v / 1e18}
-            for d, v in sorted(daily_gas.items())
-        ],
-        "average_gas_per_tx_eth": (total_wei_spent / len(txs) / 1e18) if txs else 0
-    }
+async def _fetch_block_outgoing(address: str, block: int) -> list:
+    """Every outgoing transaction in one block, paged by id"""
+    txs = []
+    after_id = ""
+    while True:
+        query = """
+        {
+          transactions(
+            first: %d,
+            where: { from: "%s", blockNumber: %d, id_gt: "%s" },
+            orderBy: id,
+            orderDirection: asc
+          ) {
+            id
+            hash
+            gasUsed
+            gasPrice
+            blockNumber
+            timestamp
+          }
+        }
+        """ % (GRAPH_PAGE_SIZE, address, block, after_id)
 
-    cache.set(cache_key, result, ttl=3600)  # Historical — cache 1 hour
-    return result
+        response = await upstreams.request(GRAPH, "POST", GRAPH_URL, json={"query": query})
+        page = (response.json().get("data") or {}).get("transactions", [])
+        txs.extend(page)
+        if len(page) < GRAPH_PAGE_SIZE:
+            return txs
+        after_id = page[-1]["id"]
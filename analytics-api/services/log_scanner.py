@@ -0,0 +1,133 @@
+import asyncio
+
+import httpx
+
+# Substrings providers use when a getLogs range returns too much data or
+# takes too long (Alchemy, Infura, QuickNode, Geth, Erigon, ...)
+TOO_MANY_RESULTS_MARKERS = (
+    "more than",
+    "too many",
+    "limit exceeded",
+    "size exceeded",
+    "response size",
+    "block range",
+    "range is too",
+    "query timeout",
+    "timed out",
+)
+
+# JSON-RPC "limit exceeded"
+LIMIT_EXCEEDED_CODE = -32005
+
+
+def is_too_many_results(error):
+    """True if the provider rejected a getLogs call because the range was too big"""
+    if isinstance(error, httpx.TimeoutException):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        # Alchemy answers oversized ranges with a bare 400
+        return error.response.status_code in (400, 413)
+    # web3 v6 raises ValueError(error_dict); v7 keeps it on rpc_response
+    details = error.args[0] if error.args else None
+    rpc_response = getattr(error, "rpc_response", None)
+    if isinstance(rpc_response, dict):
+        details = rpc_response.get("error", details)
+    if isinstance(details, dict):
+        if details.get("code") == LIMIT_EXCEEDED_CODE:
+            return True
+        message = str(details.get("message", ""))
+    else:
+        message = str(error)
+    message = message.lower()
+    return any(marker in message for marker in TOO_MANY_RESULTS_MARKERS)
+
+
+class _RangePlanner:
+    """
+    Hands out block ranges to workers, sized by the current chunk size.
+    Workers are coroutines on one loop, so no locking is needed.
+    """
+
+    def __init__(self, from_block, to_block, chunk_size, min_chunk, max_chunk):
+        self.cursor = from_block
+        self.to_block = to_block
+        self.chunk_size = chunk_size
+        self.min_chunk = min_chunk
+        self.max_chunk = max_chunk
+        self.pending = []  # Bisected halves, retried before new ranges
+        self.failed = False
+
+    def next(self):
+        if self.failed:
+            return None
+        if self.pending:
+            return self.pending.pop()
+        if self.cursor > self.to_block:
+            return None
+        start = self.cursor
+        end = min(self.to_block, start + self.chunk_size - 1)
+        self.cursor = end + 1
+        return start, end
+
+    def succeeded(self, start, end):
+        # Only grow once a chunk at least as big as the current size worked
+        if end - start + 1 >= self.chunk_size:
+            self.chunk_size = min(self.max_chunk, self.chunk_size * 2)
+
+    def bisect(self, start, end):
+        middle = (start + end) // 2
+        self.chunk_size = max(self.min_chunk, min(self.chunk_size, end - start + 1) // 2)
+        self.pending.append((middle + 1, end))
+        self.pending.append((start, middle))
+
+    def fail(self):
+        self.failed = True
+
+
+class LogScanner:
+    """
+    eth_getLogs over large block ranges.
+
+    The range is split into chunks fetched by up to `concurrency` worker
+    coroutines (the RPC semaphore still caps what reaches the node). A chunk
+    the provider rejects as too large is bisected and retried, and the
+    chunk size shrinks with it; every successful full-size chunk doubles
+    it again, up to max_chunk.
+    """
+
+    def __init__(self, w3, chunk_size=5000, min_chunk=1, max_chunk=100000, concurrency=8):
+        self.w3 = w3
+        self.chunk_size = chunk_size
+        self.min_chunk = min_chunk
+        self.max_chunk = max_chunk
+        self.concurrency = concurrency
+
+    async def get_logs(self, filter_params, from_block, to_block):
+        """Logs matching filter_params in [from_block, to_block], in chain order"""
+        if to_block < from_block:
+            return []
+        planner = _RangePlanner(from_block, to_block, self.chunk_size, self.min_chunk, self.max_chunk)
+
+        workers = max(1, min(self.concurrency, (to_block - from_block) // self.chunk_size + 1))
+        chunks = await asyncio.gather(*(self._work(planner, filter_params) for _ in range(workers)))
+
+        logs = [log for chunk in chunks for log in chunk]
+        logs.sort(key=lambda log: (log["blockNumber"], log["logIndex"]))
+        return logs
+
+    async def _work(self, planner, filter_params):
+        logs = []
+        while True:
+            span = planner.next()
+            if span is None:
+                return logs
+            start, end = span
+            try:
+                logs.extend(await self.w3.eth.get_logs({**filter_params, "fromBlock": start, "toBlock": end}))
+            except Exception as e:
+                if start < end and is_too_many_results(e):
+                    planner.bisect(start, end)
+                    continue
+                planner.fail()
+                raise
+            planner.succeeded(start, end)
@@ -0,0 +1,113 @@
+import asyncio
+from eth_abi import encode, decode
+from web3 import AsyncWeb3, Web3
+
+# Multicall3 is deployed at the same address on mainnet and most EVM chains
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+MULTICALL3_ABI = [
+    {"name":"aggregate3","type":"function","stateMutability":"payable",
+     "inputs":[{"name":"calls","type":"tuple[]","components":[
+         {"name":"target","type":"address"},
+         {"name":"allowFailure","type":"bool"},
+         {"name":"callData","type":"bytes"}]}],
+     "outputs":[{"name":"returnData","type":"tuple[]","components":[
+         {"name":"success","type":"bool"},
+         {"name":"returnData","type":"bytes"}]}]},
+]
+
+BALANCE_OF_SELECTOR = bytes.fromhex("70a08231")       # balanceOf(address)
+GET_ETH_BALANCE_SELECTOR = bytes.fromhex("4d2301cc")  # getEthBalance(address)
+DECIMALS_SELECTOR = bytes.fromhex("313ce567")         # decimals()
+SYMBOL_SELECTOR = bytes.fromhex("95d89b41")           # symbol()
+
+ETH = "ETH"
+
+
+def _decode_uint(result):
+    success, data = result
+    if not success or len(data) < 32:
+        return None
+    return int.from_bytes(data[:32], "big")
+
+
+def _decode_symbol(result):
+    success, data = result
+    if not success or not data:
+        return None
+    try:
+        return decode(["string"], data)[0]
+    except Exception:
+        # Some older tokens (e.g. MKR) return bytes32 instead of string
+        return data[:32].rstrip(b"\x00").decode("utf-8", errors="ignore") or None
+
+
+class Multicall:
+    """Aggregates many read-only calls into a single eth_call via Multicall3"""
+
+    def __init__(self, w3: AsyncWeb3, batch_size: int = 500):
+        self.w3 = w3
+        self.contract = w3.eth.contract(address=MULTICALL3_ADDRESS, abi=MULTICALL3_ABI)
+        # Calls per eth_call - keeps huge token lists under the node's gas cap
+        self.batch_size = batch_size
+
+    async def aggregate(self, calls: list, block_identifier="latest") -> list:
+        """
+        Run (target, calldata) calls through aggregate3 with allowFailure set.
+        Returns a list of (success, return_data) in call order. Batches are
+        sent concurrently.
+        """
+        batches = [
+            [(Web3.to_checksum_address(target), True, data) for target, data in calls[start:start + self.batch_size]]
+            for start in range(0, len(calls), self.batch_size)
+        ]
+        results = await asyncio.gather(*(
+            self.contract.functions.aggregate3(batch).call(block_identifier=block_identifier)
+            for batch in batches
+        ))
+        return [result for batch in results for result in batch]
+
+    async def get_balances(self, owners: list, tokens: list, block_identifier=None) -> tuple:
+        """
+        Read the ETH balance and every token balance for each owner.
+
+        All calls are pinned to one block (the latest, unless given) so the
+        result is consistent even when it spans several eth_calls. Returns
+        (block_number, balances) where balances[owner] maps ETH and each
+        token address to a raw integer balance, or None if the call reverted.
+        """
+        if block_identifier is None:
+            block_identifier = await self.w3.eth.block_number
+
+        calls = []
+        for owner in owners:
+            arg = encode(["address"], [Web3.to_checksum_address(owner)])
+            calls.append((MULTICALL3_ADDRESS, GET_ETH_BALANCE_SELECTOR + arg))
+            calls.extend((token, BALANCE_OF_SELECTOR + arg) for token in tokens)
+
+        results = iter(await self.aggregate(calls, block_identifier))
+
+        balances = {}
+        for owner in owners:
+            row = {ETH: _decode_uint(next(results))}
+            for token in tokens:
+                row[token] = _decode_uint(next(results))
+            balances[owner] = row
+
+        return block_identifier, balances
+
+    async def get_token_metadata(self, tokens: list) -> dict:
+        """Read decimals() and symbol() for each token in one aggregate call"""
+        calls = []
+        for token in tokens:
+            calls.append((token, DECIMALS_SELECTOR))
+            calls.append((token, SYMBOL_SELECTOR))
+
+        results = iter(await self.aggregate(calls))
+
+        metadata = {}
+        for token in tokens:
+            decimals = _decode_uint(next(results))
+            symbol = _decode_symbol(next(results))
+            metadata[token] = {"decimals": decimals, "symbol": symbol}
+        return metadata
@@ -1,12 +1,13 @@
 from web3 import Web3
 from cache.redis_client import cache
-from config import settings
-import requests
+from services.block_time import block_times
+from services.multicall import Multicall, ETH
+from services.price_oracle import WETH, price_oracle
+from services.upstreams import w3
+import asyncio
 import logging
 logger = logging.getLogger(__name__)
 
-COINGECKO_API = "https://api.coingecko.com/api/v3"
-
 # Common ERC-20 tokens to check (expand this list)
 KNOWN_TOKENS = {
     "USDC": "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48",
@@ -15,65 +16,70 @@ KNOWN_TOKENS = {
     "WETH": "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2",
 }
 
-ERC20_ABI = [
-    {"name":"balanceOf","type":"function","inputs":[{"name":"account","type":"address"}],"outputs":[{"name":"","type":"uint256"}],"stateMutability":"view"},
-    {"name":"decimals","type":"function","inputs":[],"outputs":[{"name":"","type":"uint8"}],"stateMutability":"view"},
-    {"name":"symbol","type":"function","inputs":[],"outputs":[{"name":"","type":"string"}],"stateMutability":"view"},
-]
+multicall = Multicall(w3)
 
-w3 = Web3(Web3.HTTPProvider(settings.RPC_URL))
+# decimals()/symbol() never change - read once per process, not per request
+_token_metadata = {}
 
-def get_eth_price_usd() -> float:
-    cache_key = "eth_price_usd"
-    cached = cache.get(cache_key)
-    if cached:
-        return cached["price"]
-    response = requests.get(f"{COINGECKO_API}/simple/price?ids=ethereum&vs_currencies=usd")
-    price = response.json()["ethereum"]["usd"]
-    cache.set(cache_key, {"price": price}, ttl=60)  # 1 minute
-    return price
+async def get_token_metadata(token_addresses: list) -> dict:
+    missing = [t for t in token_addresses if t not in _token_metadata]
+    if missing:
+        for token, meta in (await multicall.get_token_metadata(missing)).items():
+            # Don't memoize failed reads - retry them on the next request
+            if meta["decimals"] is not None:
+                _token_metadata[token] = meta
+    return {t: _token_metadata[t] for t in token_addresses if t in _token_metadata}
 
-def get_token_balance(address: str, token_address: str) -> dict:
-    contract = w3.eth.contract(
-        address=Web3.to_checksum_address(token_address),
-        abi=ERC20_ABI
-    )
-    raw_balance = contract.functions.balanceOf(Web3.to_checksum_address(address)).call()
-    decimals = contract.functions.decimals().call()
-    symbol = contract.functions.symbol().call()
-    human_balance = raw_balance / (10 ** decimals)
-    return {"symbol": symbol, "balance": human_balance, "raw": raw_balance}
+async def get_portfolio_balances(addresses: list, block_identifier=None) -> tuple:
+    """ETH and KNOWN_TOKENS balances for many addresses in one pinned-block multicall"""
+    checksums = [Web3.to_checksum_address(a) for a in addresses]
+    return await multicall.get_balances(checksums, list(KNOWN_TOKENS.values()), block_identifier)
 
-def get_full_portfolio(address: str) -> dict:
+async def get_full_portfolio(address: str) -> dict:
     cache_key = f"portfolio:{address.lower()}"
-    cached = cache.get(cache_key)
-    if cached:
-        return cached
+    result, _ = await cache.aget_or_compute(
+        cache_key, lambda: build_full_portfolio(address), ttl=300, tags=[f"address:{address.lower()}"]
+    )
+    return result
 
+async def build_full_portfolio(address: str) -> dict:
     checksum_addr = Web3.to_checksum_address(address)
-    eth_balance_wei = w3.eth.get_balance(checksum_addr)
-    eth_balance = w3.from_wei(eth_balance_wei, 'ether')
-    eth_price = get_eth_price_usd()
+    # The chain head shared with the rest of the request, if there is a request scope
+    head_block, _ = await block_times.head()
+    # Every price comes from the oracle's cache - ETH is valued as WETH
+    (block_number, balances), metadata, prices = await asyncio.gather(
+        get_portfolio_balances([checksum_addr], head_block),
+        get_token_metadata(list(KNOWN_TOKENS.values())),
+        price_oracle.get_prices([WETH] + list(KNOWN_TOKENS.values()))
+    )
+    raw_balances = balances[checksum_addr]
+    if raw_balances[ETH] is None:
+        # Raising keeps a made-up 0 ETH balance out of the cache
+        raise RuntimeError("Could not read the ETH balance")
+    eth_balance = w3.from_wei(raw_balances[ETH], 'ether')
+    eth_price = prices[WETH]
 
     holdings = [{
         "token": "ETH",
         "balance": float(eth_balance),
         "price_usd": eth_price,
-        "value_usd": float(eth_balance) * eth_price
+        "value_usd": float(eth_balance) * eth_price if eth_price is not None else None
     }]
 
     for symbol, token_addr in KNOWN_TOKENS.items():
-        try:
-            token_data = get_token_balance(address, token_addr)
-            if token_data["balance"] > 0:
-                holdings.append({
-                    "token": symbol,
-                    "balance": token_data["balance"],
-                    "price_usd": None,   # Add CoinGecko lookup here
-                    "value_usd": None
-                })
-        except Exception:
-            continue
+        raw = raw_balances.get(token_addr)
+        meta = metadata.get(token_addr)
+        if raw is None or meta is None:
+            continue  # balanceOf or decimals() reverted
+        balance = raw / (10 ** meta["decimals"])
+        if balance > 0:
+            price = prices[token_addr.lower()]
+            holdings.append({
+                "token": symbol,
+                "balance": balance,
+                "price_usd": price,
+                "value_usd": balance * price if price is not None else None
+            })
 
     total_usd = sum(h["value_usd"] for h in holdings if h["value_usd"])
 
@@ -81,7 +87,7 @@ def get_full_portfolio(address: str) -> dict:
         "address": address,
         "total_value_usd": total_usd,
         "holdings": holdings,
-        "token_count": len(holdings)
+        "token_count": len(holdings),
+        "block_number": block_number
     }
-    cache.set(cache_key, result, ttl=300)
     return result
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import logging
+import time
+import httpx
+import redis
+from cache.redis_client import cache
+from config import settings
+from services.upstreams import COINGECKO, upstreams
+
+logger = logging.getLogger(__name__)
+
+COINGECKO_TOKEN_PRICE_URL = "https://api.coingecko.com/api/v3/simple/token_price/ethereum"
+
+# ETH is priced as WETH, so one token_price call covers every holding
+WETH = "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2"
+
+# Redis hash shared by every process: token address -> {"usd": price, "at": fetched_at}
+SHARED_KEY = "prices:usd"
+
+# Tokens read this recently are refreshed ahead of expiry
+PRICE_HOT_SECONDS = 600
+PRICE_REFRESH_AHEAD_SECONDS = 15
+
+# Contract addresses per token_price request
+PRICE_BATCH_SIZE = 100
+
+class PriceOracle:
+    """
+    USD prices for ERC-20 tokens from CoinGecko's simple/token_price.
+
+    Prices are kept in process and in a Redis hash shared by all workers.
+    A read never waits on CoinGecko for a token it has seen before: prices
+    past their TTL are served while a background task refreshes them, and
+    run_refresher() re-fetches recently read tokens shortly before they
+    expire. Only a token's very first read is fetched inline. Every fetch
+    asks for all the tokens it needs in one request per PRICE_BATCH_SIZE
+    addresses.
+    """
+
+    def __init__(self, client=None, ttl: int = settings.PRICE_TTL_SECONDS,
+                 max_stale: int = settings.PRICE_MAX_STALE_SECONDS, hot_seconds: int = PRICE_HOT_SECONDS,
+                 refresh_ahead: int = PRICE_REFRESH_AHEAD_SECONDS, batch_size: int = PRICE_BATCH_SIZE):
+        self._client = client
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.hot_seconds = hot_seconds
+        self.refresh_ahead = refresh_ahead
+        self.batch_size = batch_size
+        self._prices = {}     # token -> (usd, fetched_at)
+        self._last_read = {}  # token -> time of the last get_prices() asking for it
+        self._attempted = {}  # token -> time of the last fetch asking for it
+        self._refreshing = set()
+        self._background_tasks = set()
+
+    @property
+    def client(self):
+        # The shared async client belongs to the running loop, so it is looked up per call
+        return self._client if self._client is not None else cache.aclient
+
+    async def get_prices(self, tokens: list) -> dict:
+        """{token address (lowercase): USD price or None} for each token"""
+        now = time.time()
+        tokens = list(dict.fromkeys(t.lower() for t in tokens))
+        for token in tokens:
+            self._last_read[token] = now
+
+        known = await self._lookup(tokens)
+        cold = [t for t in tokens if t not in known or now - known[t][1] > self.max_stale]
+        # Unpriced tokens (or an unreachable CoinGecko) are retried once per TTL, not per read
+        inline = [t for t in cold if now - self._attempted.get(t, 0) > self.ttl]
+        if inline:
+            known.update(await self._fetch(inline))
+
+        expired = [t for t in tokens if t in known and now - known[t][1] > self.ttl and t not in cold]
+        if expired:
+            self._refresh_in_background(expired)
+
+        return {t: known[t][0] if t in known and now - known[t][1] <= self.max_stale else None for t in tokens}
+
+    async def eth_price(self):
+        return (await self.get_prices([WETH]))[WETH]
+
+    async def refresh_hot(self) -> int:
+        """Re-fetch recently read prices that expire within refresh_ahead seconds"""
+        now = time.time()
+        hot = [t for t, read_at in self._last_read.items() if now - read_at <= self.hot_seconds]
+        for token in [t for t in self._last_read if t not in hot]:
+            del self._last_read[token]
+            self._attempted.pop(token, None)
+        known = await self._lookup(hot)
+        due = [t for t in hot if t not in known or now - known[t][1] > self.ttl - self.refresh_ahead]
+        if due:
+            await self._fetch(due)
+        return len(due)
+
+    async def run_refresher(self, interval: float = settings.PRICE_REFRESH_SECONDS):
+        """Call refresh_hot() every `interval` seconds until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh_hot()
+            except Exception as e:
+                logger.warning(f"Price refresh failed: {e}")
+
+    async def _lookup(self, tokens: list) -> dict:
+        """Newest known (usd, fetched_at) per token, from this process or the shared hash"""
+        known = {t: self._prices[t] for t in tokens if t in self._prices}
+        now = time.time()
+        outdated = [t for t in tokens if t not in known or now - known[t][1] > self.ttl]
+        if not outdated:
+            return known
+        try:
+            shared = await self.client.hmget(SHARED_KEY, outdated)
+        except redis.RedisError as e:
+            logger.warning(f"Shared price cache unavailable: {e}")
+            return known
+        for token, raw in zip(outdated, shared):
+            if not raw:
+                continue
+            entry = json.loads(raw)
+            if token not in known or entry["at"] > known[token][1]:
+                known[token] = self._prices[token] = (entry["usd"], entry["at"])
+        return known
+
+    async def _fetch(self, tokens: list) -> dict:
+        """Fetch and store prices, batches concurrently. Returns {token: (usd, fetched_at)}"""
+        for token in tokens:
+            self._attempted[token] = time.time()
+        batches = [tokens[start:start + self.batch_size] for start in range(0, len(tokens), self.batch_size)]
+        bodies = await asyncio.gather(*(self._fetch_batch(batch) for batch in batches))
+
+        fetched = {}
+        now = time.time()
+        for batch, body in zip(batches, bodies):
+            for token in batch:
+                usd = body.get(token, {}).get("usd")
+                if usd is not None:
+                    fetched[token] = (usd, now)
+        await self._store(fetched)
+        return fetched
+
+    async def _fetch_batch(self, batch: list) -> dict:
+        try:
+            response = await upstreams.request(
+                COINGECKO, "GET", COINGECKO_TOKEN_PRICE_URL,
+                params={"contract_addresses": ",".join(batch), "vs_currencies": "usd"}
+            )
+            return response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning(f"Price fetch failed for {len(batch)} tokens: {e}")
+            return {}
+
+    async def _store(self, prices: dict):
+        if not prices:
+            return
+        self._prices.update(prices)
+        try:
+            await self.client.hset(SHARED_KEY, mapping={
+                token: json.dumps({"usd": usd, "at": at}) for token, (usd, at) in prices.items()
+            })
+        except redis.RedisError as e:
+            logger.warning(f"Could not share prices: {e}")
+
+    def _refresh_in_background(self, tokens: list):
+        tokens = [t for t in tokens if t not in self._refreshing]
+        if not tokens:
+            return
+        self._refreshing.update(tokens)
+
+        async def refresh():
+            try:
+                await self._fetch(tokens)
+            finally:
+                self._refreshing.difference_update(tokens)
+
+        task = asyncio.get_running_loop().create_task(refresh())
+        # The loop only keeps weak references to tasks
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+price_oracle = PriceOracle()
@@ -0,0 +1,70 @@
+import asyncio
+import json
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Read-only JSON-RPC methods whose identical calls within one request may share a response
+SHAREABLE_METHODS = {
+    "eth_blockNumber",
+    "eth_chainId",
+    "eth_getBalance",
+    "eth_getCode",
+    "eth_getTransactionCount",
+    "eth_call",
+    "eth_getBlockByNumber",
+    "eth_getLogs",
+}
+
+_current: ContextVar[Optional["RequestScope"]] = ContextVar("request_scope", default=None)
+
+class RequestScope:
+    """
+    Work shared by everything one API request runs concurrently.
+
+    The first caller of a key starts the work; later callers with the same
+    key await the same task, whether it is still in flight or done. The
+    RPC provider keys calls by method and params, and the block-time
+    resolver keys the chain head, so every sub-query of the request sees
+    one block height and identical calls reach the node once.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def share(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._tasks[key] = task
+        else:
+            self.shared += 1
+        # One caller being cancelled must not cancel the others' result
+        return await asyncio.shield(task)
+
+@contextmanager
+def request_scope():
+    """Run the enclosed awaits (and tasks they start) in one RequestScope"""
+    scope = RequestScope()
+    token = _current.set(scope)
+    try:
+        yield scope
+    finally:
+        _current.reset(token)
+        if scope.shared:
+            logger.info(f"Request scope shared {scope.shared} of {scope.calls} calls")
+
+def current_scope() -> Optional[RequestScope]:
+    return _current.get()
+
+def rpc_key(method: str, params: Any) -> Optional[tuple]:
+    """Scope key for a JSON-RPC call, or None if it must not be shared"""
+    if method not in SHAREABLE_METHODS:
+        return None
+    return ("rpc", method, json.dumps(params, sort_keys=True, default=str))
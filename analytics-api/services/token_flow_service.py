@@ -1,42 +1,40 @@
-import requests
+import asyncio
 from cache.redis_client import cache
 from config import settings
 from web3 import Web3
+from services.block_time import block_times
+from services.log_scanner import LogScanner
+from services.upstreams import w3
 
-w3 = Web3(Web3.HTTPProvider(settings.RPC_URL))
+scanner = LogScanner(w3, chunk_size=settings.LOG_SCAN_CHUNK_SIZE, concurrency=settings.LOG_SCAN_CONCURRENCY)
 TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
 
-def get_token_flows(address: str, days: int = 30) -> dict:
+async def get_token_flows(address: str, days: int = 30) -> dict:
     cache_key = f"flows:{address.lower()}:{days}d"
-    cached = cache.get(cache_key)
-    if cached:
-        return cached
+    result, _ = await cache.aget_or_compute(
+        cache_key, lambda: build_token_flows(address, days), ttl=1800, tags=[f"address:{address.lower()}"]
+    )
+    return result
 
+async def build_token_flows(address: str, days: int = 30) -> dict:
     checksum = Web3.to_checksum_address(address)
-    blocks_back = days * 7200  # ~7200 blocks/day on Ethereum
-    current_block = w3.eth.block_number
-    from_block = max(0, current_block - blocks_back)
+    (current_block, _), from_block = await asyncio.gather(block_times.head(), block_times.period_start(days))
 
     # Get incoming transfers (address is the `to` topic)
     address_padded = "0x" + checksum[2:].zfill(64)
 
-    inbound_logs = w3.eth.get_logs({
-        "fromBlock": from_block,
-        "toBlock": "latest",
-        "topics": [TRANSFER_TOPIC, None, address_padded]
-    })
-
-    outbound_logs = w3.eth.get_logs({
-        "fromBlock": from_block,
-        "toBlock": "latest",
-        "topics": [TRANSFER_TOPIC, address_padded, None]
-    })
+    # Chunked, parallel getLogs - the scanner bisects ranges the provider rejects
+    inbound_logs, outbound_logs = await asyncio.gather(
+        scanner.get_logs({"topics": [TRANSFER_TOPIC, None, address_padded]}, from_block, current_block),
+        scanner.get_logs({"topics": [TRANSFER_TOPIC, address_padded, None]}, from_block, current_block)
+    )
 
     def process_logs(logs, direction):
         flows = {}
         for log in logs:
             token = log["address"]
-            value = int(log["data"], 16)
+            # HexBytes; ERC-721 Transfers carry no data
+            value = int.from_bytes(bytes(log["data"])[:32], "big")
             if token not in flows:
                 flows[token] = {"token_address": token, "direction": direction, "total_raw": 0, "tx_count": 0}
             flows[token]["total_raw"] += value
@@ -55,6 +53,4 @@ def get_token_flows(address: str, days: int = 30) -> dict:
         "inflows": inflows,
         "outflows": outflows
     }
-
-    cache.set(cache_key, result, ttl=1800)
     return result
@@ -0,0 +1,123 @@
+import asyncio
+from typing import Any, List, Tuple
+import aiohttp
+import httpx
+from web3 import AsyncWeb3
+from web3.providers.rpc import AsyncHTTPProvider
+from config import settings
+from services.request_scope import current_scope, rpc_key
+
+RPC = "rpc"
+GRAPH = "graph"
+COINGECKO = "coingecko"
+
+# Requests in flight per upstream service, across every request the process serves
+UPSTREAM_LIMITS = {
+    RPC: settings.RPC_MAX_CONCURRENCY,
+    GRAPH: settings.GRAPH_MAX_CONCURRENCY,
+    COINGECKO: settings.COINGECKO_MAX_CONCURRENCY,
+}
+
+class Upstreams:
+    """
+    One pooled httpx.AsyncClient for The Graph and CoinGecko (JSON-RPC goes
+    through PooledHTTPProvider), plus a semaphore per upstream service.
+    Concurrency towards the RPC node, The Graph and CoinGecko is bounded by
+    those semaphores rather than by a thread pool, so a burst of requests
+    queues on the event loop instead of exhausting threads or the
+    provider's rate limit.
+    """
+
+    def __init__(self, limits: dict = UPSTREAM_LIMITS, pool_size: int = settings.HTTP_POOL_SIZE,
+                 timeout: float = settings.HTTP_TIMEOUT_SECONDS):
+        self.limits = limits
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._client = None
+        self._semaphores = {}
+        self._loop = None
+
+    def _bind(self):
+        # The client and semaphores belong to the loop that created them
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                timeout=httpx.Timeout(self.timeout)
+            )
+            self._semaphores = {name: asyncio.Semaphore(limit) for name, limit in self.limits.items()}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        self._bind()
+        return self._client
+
+    def semaphore(self, upstream: str) -> asyncio.Semaphore:
+        self._bind()
+        return self._semaphores[upstream]
+
+    async def request(self, upstream: str, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request through the shared pool, waiting for a slot on `upstream`"""
+        async with self.semaphore(upstream):
+            response = await self.client.request(method, url, **kwargs)
+        response.raise_for_status()
+        return response
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+upstreams = Upstreams()
+
+class PooledHTTPProvider(AsyncHTTPProvider):
+    """
+    AsyncHTTPProvider whose calls wait for a slot on the RPC semaphore. Each
+    event loop gets one keep-alive aiohttp session, handed to web3 through
+    cache_async_session(), so web3 still makes the requests and applies its
+    exception retry configuration. Inside a request scope, identical
+    read-only calls share one upstream request.
+    """
+
+    def __init__(self, endpoint_uri=None, pool_size: int = settings.HTTP_POOL_SIZE,
+                 timeout: float = settings.HTTP_TIMEOUT_SECONDS, **kwargs):
+        kwargs.setdefault("request_kwargs", {"timeout": aiohttp.ClientTimeout(total=timeout)})
+        super().__init__(endpoint_uri, **kwargs)
+        self.pool_size = pool_size
+        self._session_loop = None
+        self._session_ready = None
+
+    async def _pooled_session(self):
+        session = aiohttp.ClientSession(
+            raise_for_status=True, connector=aiohttp.TCPConnector(limit=self.pool_size)
+        )
+        return await self.cache_async_session(session)
+
+    async def _ensure_session(self):
+        # Cached before the first call on a loop - web3 would otherwise open a non-pooled one
+        loop = asyncio.get_running_loop()
+        if self._session_loop is not loop:
+            self._session_loop = loop
+            self._session_ready = loop.create_task(self._pooled_session())
+        await asyncio.shield(self._session_ready)
+
+    async def make_request(self, method, params):
+        scope = current_scope()
+        key = rpc_key(method, params) if scope is not None else None
+        if key is None:
+            return await self._send(method, params)
+        return await scope.share(key, lambda: self._send(method, params))
+
+    async def _send(self, method, params):
+        await self._ensure_session()
+        async with upstreams.semaphore(RPC):
+            return await super().make_request(method, params)
+
+    async def make_batch_request(self, batch_requests: List[Tuple[str, Any]]):
+        await self._ensure_session()
+        async with upstreams.semaphore(RPC):
+            return await super().make_batch_request(batch_requests)
+
+w3 = AsyncWeb3(PooledHTTPProvider(settings.RPC_URL))
@@ -1,10 +1,41 @@
+import asyncio
+import pytest
+from eth_abi import decode, encode
 from fastapi.testclient import TestClient
+from web3 import AsyncWeb3, Web3
+from web3.providers.async_base import AsyncBaseProvider
 from main import app
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
+from services import portfolio_service
+from services.multicall import Multicall, ETH, GET_ETH_BALANCE_SELECTOR
 
 client = TestClient(app)
 
 VITALIK = "0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045"
+USDC = "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48"
+DAI = "0x6B175474E89094C44Da98b954EedeAC495271d0F"
+
+class FakeMulticallNode(AsyncBaseProvider):
+    """Answers aggregate3 eth_calls from {(ETH or token, owner): balance}; missing entries revert"""
+    def __init__(self, balances):
+        super().__init__()
+        self.balances = balances
+        self.calls = []
+
+    async def make_request(self, method, params):
+        if method == "eth_chainId":
+            return {"jsonrpc": "2.0", "id": 1, "result": "0x1"}
+        self.calls.append(params)
+        data = bytes.fromhex(params[0]["data"][2:])
+        (calls,) = decode(["(address,bool,bytes)[]"], data[4:])
+        results = []
+        for target, allow_failure, calldata in calls:
+            assert allow_failure
+            owner = Web3.to_checksum_address(decode(["address"], calldata[4:])[0])
+            key = ETH if calldata[:4] == GET_ETH_BALANCE_SELECTOR else Web3.to_checksum_address(target)
+            balance = self.balances.get((key, owner))
+            results.append((True, encode(["uint256"], [balance])) if balance is not None else (False, b""))
+        return {"jsonrpc": "2.0", "id": 1, "result": "0x" + encode(["(bool,bytes)[]"], [results]).hex()}
 
 def test_health():
     res = client.get("/health")
@@ -27,3 +58,23 @@ def test_portfolio_structure():
         data = res.json()
         assert "holdings" in data
         assert "total_value_usd" in data
+
+def test_multicall_reads_balances_pinned_to_one_block():
+    node = FakeMulticallNode({(ETH, VITALIK): 2 * 10 ** 18, (USDC, VITALIK): 5 * 10 ** 6})
+    multicall = Multicall(AsyncWeb3(node), batch_size=2)
+
+    block_number, balances = asyncio.run(multicall.get_balances([VITALIK], [USDC, DAI], block_identifier=100))
+    assert block_number == 100
+    assert balances[VITALIK] == {ETH: 2 * 10 ** 18, USDC: 5 * 10 ** 6, DAI: None}
+    assert len(node.calls) == 2
+    assert all(params[1] == hex(100) for params in node.calls)
+
+def test_failed_eth_balance_is_not_reported_as_zero():
+    tokens = list(portfolio_service.KNOWN_TOKENS.values())
+    balances = {VITALIK: {ETH: None, **{token: 0 for token in tokens}}}
+    with patch.object(portfolio_service.block_times, "head", AsyncMock(return_value=(100, 0))), \
+            patch.object(portfolio_service, "get_portfolio_balances", AsyncMock(return_value=(100, balances))), \
+            patch.object(portfolio_service, "get_token_metadata", AsyncMock(return_value={})), \
+            patch.object(portfolio_service.price_oracle, "get_prices", AsyncMock(return_value={t.lower(): 1.0 for t in tokens})):
+        with pytest.raises(RuntimeError):
+            asyncio.run(portfolio_service.build_full_portfolio(VITALIK))
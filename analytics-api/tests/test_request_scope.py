@@ -0,0 +1,63 @@
+import asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from web3 import AsyncWeb3
+from services.request_scope import request_scope
+from services.upstreams import PooledHTTPProvider
+
+VITALIK = "0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045"
+
+def make_node(calls, failures=0):
+    """Fake JSON-RPC node answering 0x10; the first `failures` requests get a 503"""
+    async def handler(request):
+        body = await request.json()
+        calls.append(body["method"])
+        if len(calls) <= failures:
+            return web.Response(status=503)
+        await asyncio.sleep(0.01)
+        return web.json_response({"jsonrpc": "2.0", "id": body["id"], "result": "0x10"})
+    app = web.Application()
+    app.router.add_post("/", handler)
+    return TestServer(app)
+
+async def run(calls, scoped):
+    async with make_node(calls) as node:
+        w3 = AsyncWeb3(PooledHTTPProvider(str(node.make_url("/"))))
+
+        async def sub_query():
+            return await asyncio.gather(w3.eth.block_number, w3.eth.get_balance(VITALIK, 16))
+
+        try:
+            if scoped:
+                with request_scope() as scope:
+                    results = await asyncio.gather(sub_query(), sub_query(), sub_query())
+                return results, scope
+            return await asyncio.gather(sub_query(), sub_query(), sub_query()), None
+        finally:
+            await w3.provider.disconnect()
+
+def test_scope_shares_identical_calls():
+    calls = []
+    results, scope = asyncio.run(run(calls, scoped=True))
+    assert results == [[16, 16]] * 3
+    assert sorted(calls) == ["eth_blockNumber", "eth_getBalance"]
+    assert scope.shared == 4
+
+def test_calls_outside_a_scope_are_not_shared():
+    calls = []
+    asyncio.run(run(calls, scoped=False))
+    assert len(calls) == 6
+
+def test_web3_retries_still_apply():
+    calls = []
+
+    async def block_number():
+        async with make_node(calls, failures=1) as node:
+            w3 = AsyncWeb3(PooledHTTPProvider(str(node.make_url("/"))))
+            try:
+                return await w3.eth.block_number
+            finally:
+                await w3.provider.disconnect()
+
+    assert asyncio.run(block_number()) == 16
+    assert calls == ["eth_blockNumber", "eth_blockNumber"]
@@ -1,12 +1,16 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 from web3 import Web3
-import os
-from api.cache.redis_client import cache
+from api.cache.redis_client import cache, CACHE_MISS, CACHE_STALE
 from api.middleware.auth import require_api_key
+from api.services.provider import get_web3
+from api.models import Transaction, Wallet
+from api.services.gas_enrichment import pending_gas_query
+from api.services.rollups import gas_by_day
+from api.services.block_time import BlockTimeResolver
 
 gas_bp = Blueprint('gas', __name__)
-RPC_URL = os.getenv("WEB3_PROVIDER_URI")
-w3 = Web3(Web3.HTTPProvider(RPC_URL))
+w3 = get_web3()
+block_times = BlockTimeResolver(w3)
 TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
 
 def validate_address(address):
@@ -26,32 +30,76 @@ def get_gas_spent(address):
     days = max(1, min(days, 365))
 
     cache_key = f"gas:{address.lower()}:{days}d"
-    cached = cache.get(cache_key)
-    if cached:
-        cached["cached"] = True
-        return jsonify(cached)
+    app = current_app._get_current_object()
+
+    def compute():
+        # May run on a background refresh thread - the block-time index needs the app context
+        with app.app_context():
+            return build_gas_spent(address, days)
 
     try:
-        checksum = Web3.to_checksum_address(address)
-        blocks_back = days * 7200
-        current_block = w3.eth.block_number
-        from_block = max(0, current_block - blocks_back)
-
-        # Get all transactions sent by this address via eth_getLogs is not ideal for tx history
-        # We'll use a block scan approach with nonce to estimate count
-        nonce = w3.eth.get_transaction_count(checksum)
-        
-        result = {
-            "address": address,
-            "period_days": days,
-            "total_transactions_sent": nonce,
-            "note": "Full gas history requires The Graph API. Add GRAPH_API_KEY to .env for detailed breakdown.",
-            "current_block": current_block,
-            "from_block": from_block,
-            "cached": False
-        }
-        cache.set(cache_key, result, ttl=3600)
-        return jsonify(result)
+        result, status = cache.get_or_compute(
+            cache_key, compute, ttl=3600, tags=[f"address:{address.lower()}"]
+        )
+        return jsonify({**result, "cached": status != CACHE_MISS, "stale": status == CACHE_STALE})
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+def build_gas_spent(address, days):
+    checksum = Web3.to_checksum_address(address)
+    current_block, _ = block_times.head()
+    from_block = block_times.period_start(days)
+
+    # Tracked wallets have receipt gas rolled up per day locally
+    wallet = Wallet.query.filter_by(address=checksum).first()
+    if wallet is not None:
+        return build_tracked_gas_spent(wallet, days, block_times.start_date(days), from_block, current_block)
+
+    # Get all transactions sent by this address via eth_getLogs is not ideal for tx history
+    # We'll use a block scan approach with nonce to estimate count
+    nonce = w3.eth.get_transaction_count(checksum)
+
+    return {
+        "address": address,
+        "period_days": days,
+        "total_transactions_sent": nonce,
+        "note": "Full gas history requires The Graph API. Add GRAPH_API_KEY to .env for detailed breakdown.",
+        "current_block": current_block,
+        "from_block": from_block
+    }
+
+def build_tracked_gas_spent(wallet, days, start_day, from_block, current_block):
+    # Range sum over at most `days` pre-aggregated rows
+    rollups = gas_by_day(wallet.id, start_day)
+    count = sum(day.tx_count for day in rollups)
+    gas_used = sum(day.gas_used for day in rollups)
+    gas_fee = sum(int(day.gas_fee) for day in rollups)
+    pending_receipts = pending_gas_query().filter(
+        Transaction.wallet_id == wallet.id,
+        Transaction.block_number >= from_block
+    ).count()
+
+    total_eth = float(Web3.from_wei(gas_fee, 'ether'))
+    return {
+        "address": wallet.address,
+        "period_days": days,
+        "total_transactions_sent": count,
+        "total_gas_used": gas_used,
+        "total_eth_spent": total_eth,
+        "average_gas_per_tx_eth": total_eth / count if count else 0,
+        "daily_breakdown": [
+            {
+                "date": day.day.isoformat(),
+                "transactions": day.tx_count,
+                "gas_used": day.gas_used,
+                "eth_spent": float(Web3.from_wei(int(day.gas_fee), 'ether'))
+            }
+            for day in rollups
+        ],
+        # Outgoing transactions still waiting for their receipt - not counted above yet
+        "pending_receipts": pending_receipts,
+        "synced_through_block": wallet.last_synced_block,
+        "current_block": current_block,
+        "from_block": from_block
+    }
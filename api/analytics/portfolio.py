@@ -1,14 +1,15 @@
 from flask import Blueprint, jsonify, request
 from web3 import Web3
-import requests
-import os
-from api.cache.redis_client import cache
+from api.cache.redis_client import cache, CACHE_MISS, CACHE_STALE
 from api.middleware.auth import require_api_key
+from api.services.provider import get_web3
+from api.services.multicall import Multicall, ETH
+from api.services.price_oracle import WETH, price_oracle
 
 portfolio_bp = Blueprint('portfolio', __name__)
 
-RPC_URL = os.getenv("WEB3_PROVIDER_URI")
-w3 = Web3(Web3.HTTPProvider(RPC_URL))
+w3 = get_web3()
+multicall = Multicall(w3)
 
 KNOWN_TOKENS = {
     "USDC": ("0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48", 6),
@@ -17,11 +18,6 @@ KNOWN_TOKENS = {
     "WETH": ("0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2", 18),
 }
 
-ERC20_ABI = [
-    {"name":"balanceOf","type":"function","inputs":[{"name":"account","type":"address"}],"outputs":[{"name":"","type":"uint256"}],"stateMutability":"view"},
-    {"name":"decimals","type":"function","inputs":[],"outputs":[{"name":"","type":"uint8"}],"stateMutability":"view"},
-]
-
 def validate_address(address: str) -> bool:
     try:
         Web3.to_checksum_address(address)
@@ -36,62 +32,58 @@ def get_portfolio(address):
         return jsonify({"error": "Invalid Ethereum address"}), 400
 
     cache_key = f"portfolio:{address.lower()}"
-    cached = cache.get(cache_key)
-    if cached:
-        cached["cached"] = True
-        return jsonify(cached)
 
     try:
-        checksum = Web3.to_checksum_address(address)
-        eth_wei = w3.eth.get_balance(checksum)
-        eth_balance = float(w3.from_wei(eth_wei, 'ether'))
+        result, status = cache.get_or_compute(
+            cache_key, lambda: build_portfolio(address), ttl=300, tags=[f"address:{address.lower()}"]
+        )
+        return jsonify({**result, "cached": status != CACHE_MISS, "stale": status == CACHE_STALE})
 
-        # Get ETH price
-        eth_price = 0
-        try:
-            price_resp = requests.get(
-                "https://api.coingecko.com/api/v3/simple/price?ids=ethereum&vs_currencies=usd",
-                timeout=5
-            )
-            eth_price = price_resp.json()["ethereum"]["usd"]
-        except Exception:
-            pass
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        holdings = [{
-            "token": "ETH",
-            "balance": eth_balance,
-            "price_usd": eth_price,
-            "value_usd": eth_balance * eth_price
-        }]
+def build_portfolio(address):
+    checksum = Web3.to_checksum_address(address)
 
-        for symbol, (token_addr, decimals) in KNOWN_TOKENS.items():
-            try:
-                contract = w3.eth.contract(
-                    address=Web3.to_checksum_address(token_addr),
-                    abi=ERC20_ABI
-                )
-                raw = contract.functions.balanceOf(checksum).call()
-                balance = raw / (10 ** decimals)
-                if balance > 0.001:
-                    holdings.append({
-                        "token": symbol,
-                        "balance": balance,
-                        "price_usd": None,
-                        "value_usd": None
-                    })
-            except Exception:
-                continue
+    # ETH + every token balance in one eth_call, pinned to one block
+    token_addresses = [token_addr for token_addr, _ in KNOWN_TOKENS.values()]
+    block_number, balances = multicall.get_balances([checksum], token_addresses)
+    raw_balances = balances[checksum]
+    if raw_balances[ETH] is None:
+        # Raising keeps a made-up 0 ETH balance out of the cache
+        raise RuntimeError("Could not read the ETH balance")
+    eth_balance = float(w3.from_wei(raw_balances[ETH], 'ether'))
 
-        total_usd = sum(h["value_usd"] for h in holdings if h["value_usd"])
-        result = {
-            "address": address,
-            "total_value_usd": total_usd,
-            "holdings": holdings,
-            "token_count": len(holdings),
-            "cached": False
-        }
-        cache.set(cache_key, result, ttl=300)
-        return jsonify(result)
+    # Every price from the oracle's cache - ETH is valued as WETH
+    prices = price_oracle.get_prices([WETH] + token_addresses)
+    eth_price = prices[WETH]
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    holdings = [{
+        "token": "ETH",
+        "balance": eth_balance,
+        "price_usd": eth_price,
+        "value_usd": eth_balance * eth_price if eth_price is not None else None
+    }]
+
+    for symbol, (token_addr, decimals) in KNOWN_TOKENS.items():
+        raw = raw_balances.get(token_addr)
+        if raw is None:
+            continue  # balanceOf reverted
+        balance = raw / (10 ** decimals)
+        if balance > 0.001:
+            price = prices[token_addr.lower()]
+            holdings.append({
+                "token": symbol,
+                "balance": balance,
+                "price_usd": price,
+                "value_usd": balance * price if price is not None else None
+            })
+
+    total_usd = sum(h["value_usd"] for h in holdings if h["value_usd"])
+    return {
+        "address": address,
+        "total_value_usd": total_usd,
+        "holdings": holdings,
+        "token_count": len(holdings),
+        "block_number": block_number
+    }
@@ -1,13 +1,23 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 from web3 import Web3
 import os
-from api.cache.redis_client import cache
+from api.cache.redis_client import cache, CACHE_MISS, CACHE_STALE
 from api.middleware.auth import require_api_key
+from api.services.provider import get_web3
+from api.services.block_time import BlockTimeResolver
+from api.models import Wallet
+from api.services.log_scanner import LogScanner
+from api.services.log_store import INBOUND, OUTBOUND, TransferLogStore, to_transfer, transfer_topics
 
 flows_bp = Blueprint('token_flows', __name__)
-RPC_URL = os.getenv("WEB3_PROVIDER_URI")
-w3 = Web3(Web3.HTTPProvider(RPC_URL))
-TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+w3 = get_web3()
+block_times = BlockTimeResolver(w3)
+scanner = LogScanner(
+    w3,
+    chunk_size=int(os.getenv("LOG_SCAN_CHUNK_SIZE", 5000)),
+    concurrency=int(os.getenv("LOG_SCAN_CONCURRENCY", 8))
+)
+log_store = TransferLogStore(scanner, block_times)
 
 def validate_address(address):
     try:
@@ -23,55 +33,61 @@ def get_token_flows(address):
         return jsonify({"error": "Invalid Ethereum address"}), 400
 
     days = request.args.get('days', 7, type=int)
-    days = max(1, min(days, 30))  # Keep small — RPC log queries are expensive
+    days = max(1, min(days, 365))
 
     cache_key = f"flows:{address.lower()}:{days}d"
-    cached = cache.get(cache_key)
-    if cached:
-        cached["cached"] = True
-        return jsonify(cached)
+    app = current_app._get_current_object()
+
+    def compute():
+        # May run on a background refresh thread - the log store and block-time index need the app context
+        with app.app_context():
+            return build_token_flows(address, days)
 
     try:
-        checksum = Web3.to_checksum_address(address)
-        blocks_back = days * 7200
-        current_block = w3.eth.block_number
-        from_block = current_block - blocks_back
-        address_padded = "0x" + checksum[2:].lower().zfill(64)
+        result, status = cache.get_or_compute(
+            cache_key, compute, ttl=1800, tags=[f"address:{address.lower()}"]
+        )
+        return jsonify({**result, "cached": status != CACHE_MISS, "stale": status == CACHE_STALE})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        inbound = w3.eth.get_logs({
-            "fromBlock": hex(from_block),
-            "toBlock": "latest",
-            "topics": [TRANSFER_TOPIC, None, address_padded]
-        })
+def build_token_flows(address, days):
+    checksum = Web3.to_checksum_address(address)
+    current_block, _ = block_times.head()
+    start_day = block_times.start_date(days)
+    from_block = block_times.period_start(days)
 
-        outbound = w3.eth.get_logs({
-            "fromBlock": hex(from_block),
-            "toBlock": "latest",
-            "topics": [TRANSFER_TOPIC, address_padded, None]
-        })
+    # Tracked wallets are served from the local log store's daily rollups; it
+    # only asks the node for block ranges it has not stored yet
+    if Wallet.query.filter_by(address=checksum).first() is not None:
+        inflows = log_store.get_flow_totals(checksum, INBOUND, start_day, from_block, current_block)
+        outflows = log_store.get_flow_totals(checksum, OUTBOUND, start_day, from_block, current_block)
+    else:
+        inflows = aggregate(fetch_transfers(checksum, INBOUND, from_block, current_block))
+        outflows = aggregate(fetch_transfers(checksum, OUTBOUND, from_block, current_block))
 
-        def aggregate(logs):
-            flows = {}
-            for log in logs:
-                token = log["address"]
-                value = int(log["data"].hex() if hasattr(log["data"], "hex") else log["data"], 16)
-                if token not in flows:
-                    flows[token] = {"token_address": token, "transfer_count": 0, "total_raw": 0}
-                flows[token]["transfer_count"] += 1
-                flows[token]["total_raw"] += value
-            return list(flows.values())
+    return {
+        "address": address,
+        "period_days": days,
+        "from_block": from_block,
+        "inbound_count": sum(flow["transfer_count"] for flow in inflows),
+        "outbound_count": sum(flow["transfer_count"] for flow in outflows),
+        "inflows": inflows,
+        "outflows": outflows
+    }
 
-        result = {
-            "address": address,
-            "period_days": days,
-            "inbound_count": len(inbound),
-            "outbound_count": len(outbound),
-            "inflows": aggregate(inbound),
-            "outflows": aggregate(outbound),
-            "cached": False
-        }
-        cache.set(cache_key, result, ttl=1800)
-        return jsonify(result)
+def fetch_transfers(address, direction, from_block, to_block):
+    # Chunked and parallel - a single getLogs over months of blocks gets rejected
+    logs = scanner.get_logs({"topics": transfer_topics(address, direction)}, from_block, to_block)
+    return [to_transfer(log) for log in logs]
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+def aggregate(transfers):
+    flows = {}
+    for transfer in transfers:
+        token = transfer["token_address"]
+        if token not in flows:
+            flows[token] = {"token_address": token, "transfer_count": 0, "total_raw": 0}
+        flows[token]["transfer_count"] += 1
+        flows[token]["total_raw"] += transfer["value"]
+    return list(flows.values())
@@ -1,3 +1,4 @@
+import atexit
 import os
 from flask import Flask, render_template
 from flask_migrate import Migrate
@@ -18,7 +19,8 @@ from api.analytics.gas import gas_bp
 from api.analytics.token_flows import flows_bp
 
 
-def create_app(config_name='default'):
+def create_app(config_name='default', with_scheduler=True):
+    """with_scheduler=False leaves background jobs to the caller (the monitor worker)"""
     app = Flask(__name__,
                 template_folder='../templates',
                 static_folder='../static')
@@ -66,25 +68,32 @@ def create_app(config_name='default'):
         # Remove this function after first call to avoid overhead
         app.before_request_funcs[None].remove(create_tables)
 
-    # Start background scheduler
-    if not app.config.get('TESTING', False):
-        scheduler = start_scheduler(app)
-        
-        @app.teardown_appcontext
-        def shutdown_scheduler(exception=None):
-            # Don't try to shutdown from within a job execution
-            if scheduler.running:
-                try:
-                    scheduler.shutdown(wait=False)
-                except RuntimeError:
-                    pass  # Ignore if we're in a job thread
+    # Start background scheduler - wallet monitoring too, unless it runs in
+    # its own process (python -m api.workers)
+    if with_scheduler and not app.config.get('TESTING', False):
+        scheduler = start_scheduler(app, monitoring=app.config.get('MONITOR_ENABLED', True))
+        app.extensions['scheduler'] = scheduler
+        # Stop it with the process. A teardown_appcontext hook runs after
+        # every request and would kill the jobs after the first one
+        atexit.register(shutdown_scheduler, scheduler)
     
     return app
 
+def shutdown_scheduler(scheduler):
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+
 # For local development
 if __name__ == '__main__':
     app = create_app()
     app.run(host='0.0.0.0', port=5000)
 else:
-    # For production (Gunicorn) and `flask run` / imports generally
-    app = create_app(os.environ.get('FLASK_ENV', 'development'))
+    # For production (Gunicorn's api.app:app) and `flask run`. Built on first
+    # access, so importing create_app - e.g. from the monitor worker or a
+    # script - doesn't start a second app and its scheduler
+    def __getattr__(name):
+        if name == 'app':
+            global app
+            app = create_app(os.environ.get('FLASK_ENV', 'development'))
+            return app
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,7 +1,44 @@
 import redis
 import json
 import os
-from typing import Optional
+import threading
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+from .local_cache import LocalCache
+
+logger = logging.getLogger(__name__)
+
+# get_or_compute() result status
+CACHE_HIT = "hit"      # Fresh value from the cache
+CACHE_STALE = "stale"  # Past its soft TTL - served while one caller refreshes it
+CACHE_MISS = "miss"    # Computed by this call
+
+# Tag sets outlive every entry they point at; dangling members are harmless
+TAG_TTL_SECONDS = 86400
+
+# Keys deleted per UNLINK call during invalidation
+DELETE_BATCH_SIZE = 500
+
+# Compare-and-delete so a lock is only released by the process holding it
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# In-process L1 in front of Redis. Kept short-lived: it is invalidated over
+# pub/sub, and the TTL bounds staleness if an invalidation message is missed
+L1_MAX_ENTRIES = int(os.getenv("CACHE_L1_MAX_ENTRIES", 2048))
+L1_MAX_BYTES = int(os.getenv("CACHE_L1_MAX_BYTES", 32 * 1024 * 1024))
+L1_TTL_SECONDS = float(os.getenv("CACHE_L1_TTL_SECONDS", 5))
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+SUBSCRIBE_RETRY_SECONDS = 30
 
 class RedisCache:
     def __init__(self):
@@ -15,32 +52,304 @@ class RedisCache:
                 port=int(os.getenv("REDIS_PORT", 6379)),
                 decode_responses=True
             )
+        self.local = LocalCache(L1_MAX_ENTRIES, L1_MAX_BYTES)
+        self.l1_ttl = L1_TTL_SECONDS
+        self._instance_id = uuid.uuid4().hex
+        self._subscriber = None
+        self._subscriber_guard = threading.Lock()
+        self._subscribe_retry_at = 0.0
         self._hits = 0
         self._misses = 0
+        self._stale_hits = 0
+        self._l1_hits = 0
+        self._l2_hits = 0
+        self._l2_misses = 0
+        # Per-process single-flight: key -> [lock, number of users]
+        self._key_locks = {}
+        self._key_locks_guard = threading.Lock()
+        self._refreshing = set()
+        self._invalidations = 0
+        self._invalidation_ms_total = 0.0
+        self._last_invalidation_ms = None
 
     def get(self, key: str) -> Optional[dict]:
+        """Returned values may be shared with the L1 cache - do not mutate them"""
+        value = self._fetch(key)
+        if value is not None:
+            self._hits += 1
+            return value
+        self._misses += 1
+        return None
+
+    def set(self, key: str, value: dict, ttl: int, tags: Iterable[str] = ()):
+        try:
+            self._store(key, json.dumps(value), ttl, tags)
+        except Exception:
+            pass  # If Redis is down, still return data (just uncached)
+
+    def invalidate_tag(self, tag: str) -> int:
+        """Delete every entry written with this tag - O(entries for the tag), no keyspace scan"""
+        started = time.perf_counter()
+        deleted = 0
+        try:
+            tag_key = f"tag:{tag}"
+            deleted = self._delete_batched(self.client.sscan_iter(tag_key, count=DELETE_BATCH_SIZE))
+            self.client.delete(tag_key)
+        except Exception:
+            pass
+        self._record_invalidation(started)
+        return deleted
+
+    def delete_pattern(self, pattern: str) -> int:
+        """Incremental SCAN-based delete for untagged entries - never blocks Redis like KEYS"""
+        started = time.perf_counter()
+        deleted = 0
         try:
-            value = self.client.get(key)
-            if value:
+            deleted = self._delete_batched(self.client.scan_iter(match=pattern, count=DELETE_BATCH_SIZE))
+        except Exception:
+            pass
+        self._record_invalidation(started)
+        return deleted
+
+    def get_or_compute(self, key: str, compute: Callable[[], dict], ttl: int,
+                       stale_ttl: Optional[int] = None, lock_timeout: int = 30,
+                       tags: Iterable[str] = ()) -> Tuple[dict, str]:
+        """
+        Return (value, status) for key, calling compute() only when needed.
+
+        Entries are fresh for `ttl` seconds, then served stale for up to
+        `stale_ttl` more (default: ttl) while a single caller recomputes them
+        in the background. On a miss only one caller per key computes - per
+        process via a local lock, across processes via a Redis lock - and
+        everyone else waits for its result instead of hitting the RPC node.
+        The key is added to each tag's set so invalidate_tag() can find it.
+        """
+        if stale_ttl is None:
+            stale_ttl = ttl
+
+        entry = self._read_entry(key)
+        if entry is not None:
+            if entry["exp"] > time.time():
                 self._hits += 1
-                return json.loads(value)
-            self._misses += 1
-            return None
+                return entry["v"], CACHE_HIT
+            self._stale_hits += 1
+            self._refresh_in_background(key, compute, ttl, stale_ttl, lock_timeout, tags)
+            return entry["v"], CACHE_STALE
+
+        self._misses += 1
+        with self._local_lock(key):
+            # Another thread may have filled it while we waited for the lock
+            entry = self._read_entry(key)
+            if entry is not None:
+                return entry["v"], CACHE_HIT
+
+            token = self._acquire_lock(key, lock_timeout)
+            if token is None:
+                # Another process is computing it - wait for its result
+                entry = self._wait_for_entry(key, lock_timeout)
+                if entry is not None:
+                    return entry["v"], CACHE_HIT
+            try:
+                value = compute()
+                self._write_entry(key, value, ttl, stale_ttl, tags)
+            finally:
+                if token is not None:
+                    self._release_lock(key, token)
+            return value, CACHE_MISS
+
+    def _fetch(self, key: str) -> Optional[Any]:
+        """Decoded value from L1, falling back to Redis (which then fills L1)"""
+        value = self.local.get(key)
+        if value is not None:
+            self._l1_hits += 1
+            return value
+        self._ensure_subscriber()
+        try:
+            raw = self.client.get(key)
         except Exception:
             return None  # If Redis is down, fail gracefully
+        if not raw:
+            self._l2_misses += 1
+            return None
+        self._l2_hits += 1
+        value = json.loads(raw)
+        self.local.set(key, value, len(raw), self.l1_ttl)
+        return value
 
-    def set(self, key: str, value: dict, ttl: int):
+    def _read_entry(self, key: str) -> Optional[dict]:
+        entry = self._fetch(key)
+        # Values written by set() have no envelope - treat them as a miss
+        if not isinstance(entry, dict) or "exp" not in entry or "v" not in entry:
+            return None
+        return entry
+
+    def _write_entry(self, key: str, value: dict, ttl: int, stale_ttl: int, tags: Iterable[str] = ()):
+        entry = {"v": value, "exp": time.time() + ttl}
         try:
-            self.client.setex(key, ttl, json.dumps(value))
+            self._store(key, json.dumps(entry), max(1, ttl + stale_ttl), tags)
         except Exception:
-            pass  # If Redis is down, still return data (just uncached)
+            pass
+
+    def _store(self, key: str, raw: str, ttl: int, tags: Iterable[str]):
+        """SETEX the key and record it in each tag set, in one round trip"""
+        pipe = self.client.pipeline(transaction=False)
+        pipe.setex(key, ttl, raw)
+        for tag in tags:
+            pipe.sadd(f"tag:{tag}", key)
+            pipe.expire(f"tag:{tag}", TAG_TTL_SECONDS)
+        pipe.execute()
+        # Other processes drop their L1 copy; ours gets the new value directly
+        self._publish_invalidation([key])
+        self.local.set(key, json.loads(raw), len(raw), min(self.l1_ttl, ttl))
+
+    def _delete_batched(self, keys: Iterable[str]) -> int:
+        deleted = 0
+        batch = []
+        for key in keys:
+            batch.append(key)
+            if len(batch) >= DELETE_BATCH_SIZE:
+                deleted += self._unlink(batch)
+                batch = []
+        if batch:
+            deleted += self._unlink(batch)
+        return deleted
+
+    def _unlink(self, keys: List[str]) -> int:
+        for key in keys:
+            self.local.delete(key)
+        self._publish_invalidation(keys)
+        return self.client.unlink(*keys)
 
-    def delete_pattern(self, pattern: str):
+    def _publish_invalidation(self, keys: List[str]):
         try:
-            keys = self.client.keys(pattern)
-            if keys:
-                self.client.delete(*keys)
+            self.client.publish(INVALIDATION_CHANNEL, json.dumps({"origin": self._instance_id, "keys": keys}))
+        except Exception:
+            pass  # Peers fall back to their L1 TTL
+
+    def _on_invalidation(self, message: dict):
+        try:
+            payload = json.loads(message["data"])
+        except (TypeError, ValueError, KeyError):
+            return
+        if payload.get("origin") == self._instance_id:
+            return
+        for key in payload.get("keys", ()):
+            self.local.delete(key)
+
+    def _ensure_subscriber(self):
+        """Start the pub/sub listener, restarting it (with a clean L1) if its connection died"""
+        if self._subscriber is not None and self._subscriber.is_alive():
+            return
+        with self._subscriber_guard:
+            now = time.monotonic()
+            if (self._subscriber is not None and self._subscriber.is_alive()) or now < self._subscribe_retry_at:
+                return
+            self._subscribe_retry_at = now + SUBSCRIBE_RETRY_SECONDS
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{INVALIDATION_CHANNEL: self._on_invalidation})
+                self._subscriber = pubsub.run_in_thread(sleep_time=1, daemon=True)
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener unavailable: {e}")
+                return
+            # Messages may have been missed while we were not listening
+            self.local.clear()
+
+    @property
+    def tier_stats(self) -> dict:
+        lookups = self._l1_hits + self._l2_hits + self._l2_misses
+        l2_lookups = self._l2_hits + self._l2_misses
+        return {
+            "l1_hits": self._l1_hits,
+            "l2_hits": self._l2_hits,
+            "l2_misses": self._l2_misses,
+            "l1_hit_ratio": round(self._l1_hits / lookups, 4) if lookups else None,
+            "l2_hit_ratio": round(self._l2_hits / l2_lookups, 4) if l2_lookups else None,
+            "l1_entries": len(self.local),
+            "l1_bytes": self.local.size_bytes
+        }
+
+    def _record_invalidation(self, started: float):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._invalidations += 1
+        self._invalidation_ms_total += elapsed_ms
+        self._last_invalidation_ms = elapsed_ms
+
+    @property
+    def invalidation_stats(self) -> dict:
+        return {
+            "invalidations": self._invalidations,
+            "avg_invalidation_ms": round(self._invalidation_ms_total / self._invalidations, 3) if self._invalidations else None,
+            "last_invalidation_ms": round(self._last_invalidation_ms, 3) if self._last_invalidation_ms is not None else None
+        }
+
+    @contextmanager
+    def _local_lock(self, key: str):
+        with self._key_locks_guard:
+            slot = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            slot[1] += 1
+        try:
+            with slot[0]:
+                yield
+        finally:
+            with self._key_locks_guard:
+                slot[1] -= 1
+                if slot[1] == 0:
+                    del self._key_locks[key]
+
+    def _acquire_lock(self, key: str, timeout: int) -> Optional[str]:
+        token = uuid.uuid4().hex
+        try:
+            if self.client.set(f"lock:{key}", token, nx=True, px=timeout * 1000):
+                return token
+            return None
+        except Exception:
+            return token  # Redis down - compute locally rather than block
+
+    def _release_lock(self, key: str, token: str):
+        try:
+            self.client.eval(RELEASE_LOCK_SCRIPT, 1, f"lock:{key}", token)
         except Exception:
             pass
 
+    def _wait_for_entry(self, key: str, timeout: int) -> Optional[dict]:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            entry = self._read_entry(key)
+            if entry is not None:
+                return entry
+            try:
+                if not self.client.exists(f"lock:{key}"):
+                    return None  # Holder gave up without writing a value
+            except Exception:
+                return None
+            time.sleep(0.05)
+        return None
+
+    def _refresh_in_background(self, key: str, compute: Callable[[], dict], ttl: int,
+                               stale_ttl: int, lock_timeout: int, tags: Iterable[str] = ()):
+        with self._key_locks_guard:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        token = self._acquire_lock(key, lock_timeout)
+        if token is None:
+            # Another process is already refreshing it
+            with self._key_locks_guard:
+                self._refreshing.discard(key)
+            return
+
+        def refresh():
+            try:
+                self._write_entry(key, compute(), ttl, stale_ttl, tags)
+            except Exception as e:
+                logger.warning(f"Background refresh failed for {key}: {e}")
+            finally:
+                self._release_lock(key, token)
+                with self._key_locks_guard:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name=f"cache-refresh:{key}", daemon=True).start()
+
 cache = RedisCache()
@@ -15,9 +15,32 @@ class Config:
     RATELIMIT_STORAGE_URI = "memory://"
     RATELIMIT_DEFAULT = "100 per hour"
     
+    # API key auth
+    API_KEY_CACHE_SIZE = int(os.getenv('API_KEY_CACHE_SIZE', 1024))
+    API_KEY_CACHE_TTL_SECONDS = int(os.getenv('API_KEY_CACHE_TTL_SECONDS', 60))  # Max delay before a revoked key stops working
+    API_KEY_USAGE_FLUSH_SECONDS = int(os.getenv('API_KEY_USAGE_FLUSH_SECONDS', 30))  # last_used_at write batching
+    
     # Background Worker
     SCHEDULER_API_ENABLED = True
-    MONITOR_INTERVAL_SECONDS = 60  # Check wallets every 60 seconds
+    MONITOR_ENABLED = os.getenv('MONITOR_ENABLED', 'true').lower() in ('1', 'true', 'yes')  # false when `python -m api.workers` runs the monitor
+    MONITOR_INTERVAL_SECONDS = 60  # Check wallets every 60 seconds (the shortest per-wallet interval when adaptive)
+    MONITOR_ADAPTIVE = os.getenv('MONITOR_ADAPTIVE', 'true').lower() in ('1', 'true', 'yes')  # Poll each wallet by its own activity
+    MONITOR_TICK_SECONDS = int(os.getenv('MONITOR_TICK_SECONDS', 15))  # How often due wallets are looked for
+    MONITOR_MAX_POLL_SECONDS = int(os.getenv('MONITOR_MAX_POLL_SECONDS', 3600))  # Backoff cap for idle wallets
+    MONITOR_ALERT_POLL_SECONDS = int(os.getenv('MONITOR_ALERT_POLL_SECONDS', 60))  # Backoff cap for wallets with active alerts
+    MONITOR_CONCURRENCY = int(os.getenv('MONITOR_CONCURRENCY', 16))  # Wallets fetched in parallel
+    MONITOR_CYCLE_DEADLINE_SECONDS = int(os.getenv('MONITOR_CYCLE_DEADLINE_SECONDS', 50))  # Keep under the interval
+    SYNC_MAX_PAGES_PER_CYCLE = int(os.getenv('SYNC_MAX_PAGES_PER_CYCLE', 10))  # Transfer pages per wallet per direction
+    SYNC_CONFIRMATIONS = int(os.getenv('SYNC_CONFIRMATIONS', 64))  # Sync cursors trail the head by this many blocks, re-read each cycle
+    GAS_ENRICH_BATCH_SIZE = int(os.getenv('GAS_ENRICH_BATCH_SIZE', 1000))  # Receipts fetched per monitor cycle
+    MONITOR_MODE = os.getenv('MONITOR_MODE', 'poll')  # 'poll' every wallet, or 'blocks' to refresh wallets touched by each new block
+    WEB3_WS_URI = os.getenv('WEB3_WS_URI')  # WebSocket endpoint for newHeads, required by MONITOR_MODE=blocks
+    MONITOR_RECONCILE_SECONDS = int(os.getenv('MONITOR_RECONCILE_SECONDS', 600))  # Full sweep interval in blocks mode
+    MONITOR_MAX_CATCHUP_BLOCKS = int(os.getenv('MONITOR_MAX_CATCHUP_BLOCKS', 32))  # Missed blocks replayed after a reconnect
+    MONITOR_COORDINATION = os.getenv('MONITOR_COORDINATION', 'none')  # 'redis' to split monitoring across workers and hosts
+    MONITOR_SHARDS = int(os.getenv('MONITOR_SHARDS', 16))  # Wallet shards leased out (wallet id % shards); keep above the process count
+    MONITOR_LEASE_TTL_SECONDS = int(os.getenv('MONITOR_LEASE_TTL_SECONDS', 30))  # A dead process's shards are taken over after this
+    PRICE_REFRESH_SECONDS = int(os.getenv('PRICE_REFRESH_SECONDS', 10))  # Hot token prices re-fetched ahead of expiry
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -33,6 +56,7 @@ class TestingConfig(Config):
     SQLALCHEMY_ECHO = False
     WTF_CSRF_ENABLED = False  # Disable CSRF protection in tests
     SCHEDULER_API_ENABLED = False  # Disable background scheduler in tests
+    API_KEY_USAGE_FLUSH_SECONDS = 0  # Write last_used_at synchronously in tests
     WEB3_PROVIDER_URI = 'http://localhost:8545'  # Mock provider for tests
 
 config = {
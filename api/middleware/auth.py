@@ -1,9 +1,128 @@
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
-from flask import request, jsonify
+from flask import request, jsonify, current_app
+from sqlalchemy import update
 from api.models import db
 from api.models.api_key import ApiKey
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
+
+class ApiKeyCache:
+    """
+    TTL-bounded LRU of validated API keys (key -> ApiKey id).
+    A revoked key stops working once its entry expires, i.e. within `ttl` seconds.
+    """
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            key_id, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return key_id
+    
+    def set(self, key, key_id):
+        with self._lock:
+            self._entries[key] = (key_id, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, key=None):
+        """Drop one key (e.g. right after revoking it), or everything"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+class UsageRecorder:
+    """
+    Coalesces last_used_at bumps in memory and writes them in one batched
+    UPDATE every `flush_interval` seconds from a background thread.
+    With flush_interval <= 0 every bump is written immediately.
+    """
+    def __init__(self, app, flush_interval=30):
+        self.app = app
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+    
+    def record(self, key_id):
+        with self._lock:
+            self._pending[key_id] = datetime.utcnow()
+        
+        if self.flush_interval <= 0:
+            self.flush()
+        else:
+            self._ensure_started()
+    
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                if self._thread is None:
+                    # Once per recorder, not per thread restart
+                    atexit.register(self.flush)
+                self._thread = threading.Thread(target=self._run, name='api-key-usage', daemon=True)
+                self._thread.start()
+    
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+    
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        
+        try:
+            with self.app.app_context():
+                db.session.execute(
+                    update(ApiKey),
+                    [{'id': key_id, 'last_used_at': used_at} for key_id, used_at in pending.items()]
+                )
+                db.session.commit()
+        except Exception as e:
+            # last_used_at is informational - don't retry forever
+            logger.error(f"Failed to flush last_used_at for {len(pending)} API keys: {e}")
+
+
+def get_api_key_auth():
+    """Per-app key cache and usage recorder, created on first use"""
+    app = current_app._get_current_object()
+    state = app.extensions.get('api_key_auth')
+    if state is None:
+        state = app.extensions.setdefault('api_key_auth', {
+            'cache': ApiKeyCache(
+                max_size=app.config.get('API_KEY_CACHE_SIZE', 1024),
+                ttl=app.config.get('API_KEY_CACHE_TTL_SECONDS', 60)
+            ),
+            'usage': UsageRecorder(app, flush_interval=app.config.get('API_KEY_USAGE_FLUSH_SECONDS', 30))
+        })
+    return state
+
+
 def require_api_key(f):
     """
     Decorator to require API key authentication for endpoints
@@ -16,15 +135,21 @@ def require_api_key(f):
         if not api_key:
             return jsonify({'error': 'API key required'}), 401
         
-        # Validate API key
-        key_obj = ApiKey.query.filter_by(key=api_key, is_active=True).first()
+        auth = get_api_key_auth()
         
-        if not key_obj:
-            return jsonify({'error': 'Invalid API key'}), 401
+        # Validate API key - hot keys are served from the in-process cache
+        key_id = auth['cache'].get(api_key)
+        if key_id is None:
+            key_obj = ApiKey.query.filter_by(key=api_key, is_active=True).first()
+            
+            if not key_obj:
+                return jsonify({'error': 'Invalid API key'}), 401
+            
+            key_id = key_obj.id
+            auth['cache'].set(api_key, key_id)
         
-        # Update last used timestamp
-        key_obj.last_used_at = datetime.utcnow()
-        db.session.commit()
+        # Update last used timestamp (batched)
+        auth['usage'].record(key_id)
         
         # Call the actual endpoint
         return f(*args, **kwargs)
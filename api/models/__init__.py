@@ -7,5 +7,11 @@ from api.models.wallet import Wallet
 from api.models.transaction import Transaction
 from api.models.alert import Alert
 from api.models.api_key import ApiKey
+from api.models.transfer_log import TransferLog, TransferLogRange
+from api.models.block_timestamp import BlockTimestamp
+from api.models.rollup import DailyGasRollup, DailyFlowRollup
 
-__all__ = ['db', 'Wallet', 'Transaction', 'Alert', 'ApiKey']
+__all__ = [
+    'db', 'Wallet', 'Transaction', 'Alert', 'ApiKey', 'TransferLog', 'TransferLogRange',
+    'BlockTimestamp', 'DailyGasRollup', 'DailyFlowRollup'
+]
@@ -0,0 +1,8 @@
+from api.models.wallet import db
+
+class BlockTimestamp(db.Model):
+    """Sparse (block, timestamp) samples from finalized blocks, used to resolve timestamps to blocks"""
+    __tablename__ = 'block_timestamps'
+    
+    block_number = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    timestamp = db.Column(db.Integer, nullable=False, index=True)  # Unix seconds
@@ -0,0 +1,23 @@
+from api.models.wallet import db
+from api.models.types import Uint256
+
+class DailyGasRollup(db.Model):
+    """Gas paid by a wallet's outgoing transactions per UTC day, from enriched receipts"""
+    __tablename__ = 'daily_gas_rollups'
+    
+    wallet_id = db.Column(db.Integer, db.ForeignKey('wallets.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    tx_count = db.Column(db.Integer, nullable=False, default=0)
+    gas_used = db.Column(db.BigInteger, nullable=False, default=0)
+    gas_fee = db.Column(Uint256, nullable=False, default=0)  # Wei
+
+class DailyFlowRollup(db.Model):
+    """Stored Transfer logs per address, UTC day, token and direction"""
+    __tablename__ = 'daily_flow_rollups'
+    
+    address = db.Column(db.String(42), primary_key=True)  # Lowercase
+    day = db.Column(db.Date, primary_key=True)
+    direction = db.Column(db.String(3), primary_key=True)
+    token_address = db.Column(db.String(42), primary_key=True)
+    transfer_count = db.Column(db.Integer, nullable=False, default=0)
+    total_raw = db.Column(Uint256, nullable=False, default=0)  # Raw token units
@@ -1,8 +1,13 @@
 from datetime import datetime
 from api.models.wallet import db
+from api.models.types import Uint256
 
 class Transaction(db.Model):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # Backs keyset pagination of a wallet's history by (timestamp, id)
+        db.Index('ix_transactions_wallet_id_timestamp', 'wallet_id', 'timestamp', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     wallet_id = db.Column(db.Integer, db.ForeignKey('wallets.id'), nullable=False)
@@ -12,19 +17,26 @@ class Transaction(db.Model):
     from_address = db.Column(db.String(42), index=True)
     to_address = db.Column(db.String(42), index=True)
     value = db.Column(db.String(78))  # Wei as string
-    gas_used = db.Column(db.Integer)
+    gas_used = db.Column(db.Integer)  # From the receipt; None until gas enrichment has run
     gas_price = db.Column(db.String(78))
+    effective_gas_price = db.Column(db.String(78))  # Wei per gas actually paid
+    gas_fee = db.Column(Uint256)  # Wei paid by the wallet (0 if someone else sent the tx)
     status = db.Column(db.Integer)  # 1 = success, 0 = failed
     
-    def to_dict(self):
-        return {
-        'id': self.id,
-        'wallet_id': self.wallet_id,
-        'tx_hash': self.tx_hash,
-        'from_address': self.from_address,
-        'to_address': self.to_address,
-        'value': self.value,
-        'timestamp': self.timestamp.isoformat() if self.timestamp else None,
-        'block_number': self.block_number,
-        'status': 'success' if self.status == 1 else 'failed'
-        }
+    # Fields that can be requested with ?fields=
+    FIELDS = (
+        'id', 'wallet_id', 'tx_hash', 'from_address', 'to_address',
+        'value', 'timestamp', 'block_number', 'status'
+    )
+    
+    def to_dict(self, fields=None):
+        # Only touch requested attributes so load_only() projections don't lazy-load the rest
+        return {field: self._serialize(field) for field in (fields or self.FIELDS)}
+    
+    def _serialize(self, field):
+        value = getattr(self, field)
+        if field == 'timestamp':
+            return value.isoformat() if value else None
+        if field == 'status':
+            return 'success' if value == 1 else 'failed'
+        return value
@@ -0,0 +1,32 @@
+from api.models.wallet import db
+
+class TransferLog(db.Model):
+    """ERC-20 Transfer log touching a tracked wallet, stored once it is finalized"""
+    __tablename__ = 'transfer_logs'
+    __table_args__ = (
+        # Flow queries scan one address/direction over a block range
+        db.UniqueConstraint('address', 'direction', 'block_number', 'log_index',
+                            name='uq_transfer_logs_address_direction_block_log'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    address = db.Column(db.String(42), nullable=False)  # Lowercase
+    direction = db.Column(db.String(3), nullable=False)  # 'in' or 'out'
+    block_number = db.Column(db.Integer, nullable=False)
+    log_index = db.Column(db.Integer, nullable=False)
+    tx_hash = db.Column(db.String(66), nullable=False)
+    token_address = db.Column(db.String(42), nullable=False)
+    value = db.Column(db.String(78), nullable=False)  # Raw token units as string
+
+class TransferLogRange(db.Model):
+    """Block range [from_block, to_block] already fully stored for an address/direction"""
+    __tablename__ = 'transfer_log_ranges'
+    __table_args__ = (
+        db.Index('ix_transfer_log_ranges_address_direction', 'address', 'direction', 'from_block'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    address = db.Column(db.String(42), nullable=False)
+    direction = db.Column(db.String(3), nullable=False)
+    from_block = db.Column(db.Integer, nullable=False)
+    to_block = db.Column(db.Integer, nullable=False)
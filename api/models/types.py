@@ -0,0 +1,23 @@
+from api.models.wallet import db
+
+class Uint256(db.TypeDecorator):
+    """
+    Unsigned integer up to 2**256 - 1, exact on every database. NUMERIC(78, 0)
+    on Postgres; decimal text elsewhere, since SQLite turns integers past
+    int64 into REAL. Always read back as a Python int.
+    """
+    impl = db.Numeric(78, 0)
+    cache_ok = True
+    
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(db.Numeric(78, 0))
+        return dialect.type_descriptor(db.String(78))
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return int(value) if dialect.name == 'postgresql' else str(int(value))
+    
+    def process_result_value(self, value, dialect):
+        return None if value is None else int(value)
@@ -9,6 +9,7 @@ class Wallet(db.Model):
     label = db.Column(db.String(100))
     balance = db.Column(db.String(100), default='0')
     last_monitored = db.Column(db.DateTime)
+    last_synced_block = db.Column(db.Integer)  # Transfers are fully synced up to this block
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -23,6 +24,7 @@ class Wallet(db.Model):
             'label': self.label,
             'balance': self.balance,
             'last_monitored': self.last_monitored.isoformat() if self.last_monitored else None,
+            'last_synced_block': self.last_synced_block,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
     
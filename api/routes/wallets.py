@@ -1,4 +1,10 @@
-from flask import Blueprint, request, jsonify
+import csv
+import io
+import json
+import zlib
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import load_only
 from web3 import Web3
 from api.models import db
 from api.models.wallet import Wallet
@@ -6,10 +12,22 @@ from api.models.transaction import Transaction
 from api.models.alert import Alert
 from api.middleware.auth import require_api_key
 from api.services.web3_service import Web3Service  # ADD THIS LINE
+from api.utils.errors import ValidationError
+from api.utils.pagination import encode_cursor, decode_cursor, parse_datetime
 from datetime import datetime
 
 wallets_bp = Blueprint('wallets', __name__)
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+EXPORT_BATCH_SIZE = 1000    # Rows fetched per round trip from the server-side cursor
+EXPORT_CHUNK_BYTES = 65536  # Buffer output into chunks of roughly this size
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
 def get_web3_service():
     """Lazy initialization of Web3Service - only creates instance when first called"""
     if not hasattr(get_web3_service, '_instance'):
@@ -42,7 +60,10 @@ def register_wallet():
     
     # Get balance from blockchain
     web3_service = get_web3_service()
-    balance = web3_service.get_balance(address)
+    balances, errors = web3_service.get_balances([address])
+    if address in errors:
+        return jsonify({'error': f'Could not fetch balance: {errors[address]}'}), 502
+    balance = balances[address]
     
     # Create new wallet
     wallet = Wallet(
@@ -82,10 +103,53 @@ def list_wallets():
         'count': len(wallets)
     }), 200
 
+def parse_fields(args):
+    """Parse ?fields=a,b,c into a tuple of Transaction fields (None = all)"""
+    if not args.get('fields'):
+        return None
+    fields = tuple(f.strip() for f in args['fields'].split(',') if f.strip())
+    unknown = [f for f in fields if f not in Transaction.FIELDS]
+    if unknown:
+        raise ValidationError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+def filter_transactions(query, args):
+    """Apply ?from_block=&to_block=&since=&until= range filters to a Transaction query"""
+    from_block = args.get('from_block', type=int)
+    to_block = args.get('to_block', type=int)
+    if from_block is not None:
+        query = query.filter(Transaction.block_number >= from_block)
+    if to_block is not None:
+        query = query.filter(Transaction.block_number <= to_block)
+    if args.get('since'):
+        query = query.filter(Transaction.timestamp >= parse_datetime(args['since'], 'since'))
+    if args.get('until'):
+        query = query.filter(Transaction.timestamp < parse_datetime(args['until'], 'until'))
+    return query
+
+def order_transactions(query):
+    """Newest first; (timestamp, id) is the keyset and matches ix_transactions_wallet_id_timestamp"""
+    return query.order_by(Transaction.timestamp.desc().nulls_last(), Transaction.id.desc())
+
+def after_cursor(query, cursor):
+    """Keyset condition: rows strictly after the cursor in (timestamp DESC NULLS LAST, id DESC) order"""
+    timestamp, row_id = decode_cursor(cursor)
+    if timestamp is None:
+        return query.filter(Transaction.timestamp.is_(None), Transaction.id < row_id)
+    return query.filter(or_(
+        Transaction.timestamp < timestamp,
+        and_(Transaction.timestamp == timestamp, Transaction.id < row_id),
+        Transaction.timestamp.is_(None)
+    ))
+
 @wallets_bp.route('/wallets/<address>/transactions', methods=['GET'])
 @require_api_key
 def get_wallet_transactions(address):
-    """Get transactions for a wallet"""
+    """
+    Get transactions for a wallet, newest first, one page at a time.
+    Query params: limit, cursor (next_cursor from the previous page),
+    from_block, to_block, since, until (ISO-8601), fields (comma-separated)
+    """
     if not Web3.is_address(address):
         return jsonify({'error': 'Invalid Ethereum address'}), 400
     
@@ -93,13 +157,111 @@ def get_wallet_transactions(address):
     if not wallet:
         return jsonify({'error': 'Wallet not found'}), 404
     
-    transactions = Transaction.query.filter_by(wallet_id=wallet.id).order_by(Transaction.timestamp.desc()).all()
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    fields = parse_fields(request.args)
+    
+    query = filter_transactions(Transaction.query.filter_by(wallet_id=wallet.id), request.args)
+    if request.args.get('cursor'):
+        query = after_cursor(query, request.args['cursor'])
+    if fields:
+        # id and timestamp are always needed to build the next cursor
+        columns = {'id', 'timestamp', *fields}
+        query = query.options(load_only(*(getattr(Transaction, c) for c in columns)))
+    
+    # Fetch one extra row to know whether there is a next page
+    transactions = order_transactions(query).limit(limit + 1).all()
+    has_more = len(transactions) > limit
+    transactions = transactions[:limit]
+    
+    next_cursor = None
+    if has_more:
+        last = transactions[-1]
+        next_cursor = encode_cursor(last.timestamp, last.id)
     
     return jsonify({
-        'transactions': [tx.to_dict() for tx in transactions],
-        'count': len(transactions)
+        'transactions': [tx.to_dict(fields) for tx in transactions],
+        'count': len(transactions),
+        'next_cursor': next_cursor
     }), 200
 
+@wallets_bp.route('/wallets/<address>/transactions/export', methods=['GET'])
+@require_api_key
+def export_wallet_transactions(address):
+    """
+    Stream a wallet's whole transaction history as NDJSON or CSV.
+    Rows are read in batches from a server-side cursor, so memory use doesn't
+    grow with history size. Query params: format (ndjson|csv), gzip (true to
+    compress on the fly), plus the same range filters and fields as the
+    listing endpoint.
+    """
+    if not Web3.is_address(address):
+        return jsonify({'error': 'Invalid Ethereum address'}), 400
+    
+    wallet = Wallet.query.filter_by(address=address).first()
+    if not wallet:
+        return jsonify({'error': 'Wallet not found'}), 404
+    
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    
+    fields = parse_fields(request.args) or Transaction.FIELDS
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    
+    query = filter_transactions(Transaction.query.filter_by(wallet_id=wallet.id), request.args)
+    query = order_transactions(query).options(load_only(*(getattr(Transaction, f) for f in fields)))
+    rows = query.yield_per(EXPORT_BATCH_SIZE)
+    
+    if export_format == 'csv':
+        body = _csv_chunks(rows, fields)
+    else:
+        body = _ndjson_chunks(rows, fields)
+    
+    headers = {
+        'Content-Disposition': f'attachment; filename="{wallet.address}-transactions.{export_format}"'
+    }
+    if compress:
+        body = _gzip_chunks(body)
+        headers['Content-Encoding'] = 'gzip'
+    
+    return Response(stream_with_context(body), mimetype=EXPORT_FORMATS[export_format], headers=headers)
+
+def _ndjson_chunks(rows, fields):
+    buffer = []
+    size = 0
+    for tx in rows:
+        line = json.dumps(tx.to_dict(fields)) + '\n'
+        buffer.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+def _csv_chunks(rows, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for tx in rows:
+        data = tx.to_dict(fields)
+        writer.writerow([data[field] for field in fields])
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
 @wallets_bp.route('/wallets/<address>/alerts', methods=['POST'])
 @require_api_key
 def create_alert(address):
@@ -0,0 +1,141 @@
+from bisect import bisect_left
+import threading
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from web3 import Web3
+from api.models.wallet import Wallet
+
+# Bloom filter bits per tracked address and bits tested per lookup. At 16
+# bits and 4 probes about 0.2% of untracked addresses get past the filter
+# (and are then rejected by the sorted array)
+BLOOM_BITS_PER_ADDRESS = 16
+BLOOM_PROBES = 4
+
+# Below this many addresses a binary search is cheaper than the filter's bit
+# tests in CPython; around a million it is ~3x slower than filter + search
+BLOOM_MIN_ADDRESSES = 100000
+
+PENDING_CHANGES_KEY = 'tracked_address_changes'
+
+
+def to_bytes(address):
+    """20-byte form of a hex address (any case, with or without 0x)"""
+    address = address[2:] if address[:2] in ('0x', '0X') else address
+    return bytes.fromhex(address)
+
+
+class AddressIndex:
+    """
+    Tracked wallet addresses, for matching chain activity without the DB.
+
+    Addresses are held as a sorted array of 20-byte values, probed with a
+    binary search. Once the index holds bloom_min_addresses or more, a
+    bloom filter in front of it rejects almost every untracked address with
+    a few bit tests. Addresses are keccak output, so their own bytes serve
+    as the filter's hash values.
+
+    Every change builds a new (array, filter) snapshot and swaps it in, so
+    readers on other threads never take a lock. Wallets inserted or deleted
+    through the ORM in this process are applied on commit; reload() picks up
+    changes made by other processes.
+    """
+
+    def __init__(self, addresses=(), bloom_min_addresses=BLOOM_MIN_ADDRESSES,
+                 bloom_bits_per_address=BLOOM_BITS_PER_ADDRESS):
+        self.bloom_min_addresses = bloom_min_addresses
+        self.bloom_bits_per_address = bloom_bits_per_address
+        self._lock = threading.Lock()
+        self._snapshot = self._build(set())
+        self.replace(addresses)
+
+    def __len__(self):
+        return len(self._snapshot[0])
+
+    def __contains__(self, address):
+        return self._contains(to_bytes(address), self._snapshot)
+
+    def replace(self, addresses):
+        """Track exactly these addresses"""
+        with self._lock:
+            self._snapshot = self._build({to_bytes(a) for a in addresses})
+
+    def add(self, *addresses):
+        with self._lock:
+            self._snapshot = self._build(set(self._snapshot[0]) | {to_bytes(a) for a in addresses})
+
+    def remove(self, *addresses):
+        with self._lock:
+            self._snapshot = self._build(set(self._snapshot[0]) - {to_bytes(a) for a in addresses})
+
+    def reload(self):
+        """Rebuild from the wallets table (needs an app context)"""
+        self.replace(address for (address,) in Wallet.query.with_entities(Wallet.address))
+        return len(self)
+
+    def match(self, addresses):
+        """Checksum addresses of the tracked ones among `addresses` (hex strings or 20-byte values)"""
+        snapshot = self._snapshot
+        matched = set()
+        for address in addresses:
+            raw = address if isinstance(address, bytes) else to_bytes(address)
+            if self._contains(raw, snapshot):
+                matched.add(raw)
+        return {Web3.to_checksum_address(raw) for raw in matched}
+
+    def _build(self, raw_addresses):
+        ordered = sorted(raw_addresses)
+        if not self.bloom_bits_per_address or len(ordered) < self.bloom_min_addresses:
+            return ordered, None, 0
+        # Power-of-two size so each probe is a mask over the address bits
+        mask = (1 << (len(ordered) * self.bloom_bits_per_address - 1).bit_length()) - 1
+        bloom = bytearray((mask >> 3) + 1)
+        for raw in ordered:
+            bits = int.from_bytes(raw, 'big')
+            for _ in range(BLOOM_PROBES):
+                bit = bits & mask
+                bloom[bit >> 3] |= 1 << (bit & 7)
+                bits >>= 32
+        return ordered, bytes(bloom), mask
+
+    @staticmethod
+    def _contains(raw, snapshot):
+        ordered, bloom, mask = snapshot
+        if bloom is not None:
+            bits = int.from_bytes(raw, 'big')
+            for _ in range(BLOOM_PROBES):
+                bit = bits & mask
+                if not bloom[bit >> 3] >> (bit & 7) & 1:
+                    return False
+                bits >>= 32
+        i = bisect_left(ordered, raw)
+        return i < len(ordered) and ordered[i] == raw
+
+
+tracked_addresses = AddressIndex()
+
+
+# Keep the index in step with wallet registration and deletion in this
+# process. Changes are staged on the session and applied once they commit.
+@event.listens_for(Wallet, 'after_insert')
+def _stage_insert(mapper, connection, wallet):
+    _pending_changes(wallet).append((tracked_addresses.add, wallet.address))
+
+
+@event.listens_for(Wallet, 'after_delete')
+def _stage_delete(mapper, connection, wallet):
+    _pending_changes(wallet).append((tracked_addresses.remove, wallet.address))
+
+
+def _pending_changes(wallet):
+    return object_session(wallet).info.setdefault(PENDING_CHANGES_KEY, [])
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    for apply, address in session.info.pop(PENDING_CHANGES_KEY, []):
+        apply(address)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop(PENDING_CHANGES_KEY, None)
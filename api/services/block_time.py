@@ -0,0 +1,189 @@
+import bisect
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from api.models import db
+from api.models.block_timestamp import BlockTimestamp
+
+logger = logging.getLogger(__name__)
+
+# Only blocks this far behind the head are persisted - a reorg could still change the rest
+FINALITY_DEPTH = 64
+
+# Roughly one slot; the head is re-read at most this often
+HEAD_TTL_SECONDS = 12
+
+
+class BlockTimeResolver:
+    """
+    Resolve Unix timestamps to block numbers.
+
+    Searches between the closest known samples on either side of the
+    timestamp, interpolating on block time (with a bisection step whenever
+    interpolation stops halving the range). Every header fetched on the way
+    is persisted to block_timestamps once finalized, so lookups near an
+    earlier one need a call or two and repeated lookups need none.
+    """
+
+    def __init__(self, w3, finality_depth=FINALITY_DEPTH, head_ttl=HEAD_TTL_SECONDS):
+        self.w3 = w3
+        self.finality_depth = finality_depth
+        self.head_ttl = head_ttl
+        self._head = None
+        self._head_read_at = 0.0
+        self._head_lock = threading.Lock()
+
+    def head(self):
+        """(block_number, timestamp) of the latest block, cached for head_ttl seconds"""
+        with self._head_lock:
+            if self._head is None or time.monotonic() - self._head_read_at >= self.head_ttl:
+                block = self.w3.eth.get_block('latest')
+                self._head = (block['number'], block['timestamp'])
+                self._head_read_at = time.monotonic()
+            return self._head
+
+    def block_at(self, timestamp):
+        """First block with a timestamp >= timestamp (head + 1 if it is in the future)"""
+        head_number, head_timestamp = self.head()
+        if timestamp > head_timestamp:
+            return head_number + 1
+
+        fetched = {}
+        lo = self._closest_below(timestamp)
+        if lo is None:
+            lo = (0, self._fetch_timestamp(0))
+            fetched[0] = lo[1]
+            if lo[1] >= timestamp:
+                self._remember(fetched, head_number)
+                return 0
+        hi = self._closest_at_or_above(timestamp) or (head_number, head_timestamp)
+
+        halve = False
+        while hi[0] - lo[0] > 1:
+            span = hi[0] - lo[0]
+            if halve:
+                guess = lo[0] + span // 2
+            else:
+                guess = lo[0] + (timestamp - lo[1]) * span // max(1, hi[1] - lo[1])
+            guess = min(max(guess, lo[0] + 1), hi[0] - 1)
+
+            sample = (guess, self._fetch_timestamp(guess))
+            fetched[guess] = sample[1]
+            if sample[1] < timestamp:
+                lo = sample
+            else:
+                hi = sample
+            # Interpolation can creep one block at a time near the answer
+            halve = not halve and (hi[0] - lo[0]) * 2 > span
+
+        self._remember(fetched, head_number)
+        return hi[0]
+
+    def start_date(self, days):
+        """First UTC date of a period made of the last `days` calendar days, today included"""
+        _, head_timestamp = self.head()
+        return _utc_date(head_timestamp) - timedelta(days=days - 1)
+
+    def period_start(self, days):
+        """First block of the last `days` UTC calendar days - aligned so daily rollups line up"""
+        start = self.start_date(days)
+        return self.block_at(_midnight(start))
+
+    def day_boundaries(self, days):
+        """
+        Block ranges of the last `days` UTC calendar days, oldest first, as
+        dicts with date, from_block and to_block. Today's range ends at the head.
+        """
+        head_number, _ = self.head()
+        first_day = self.start_date(days)
+        starts = [first_day + timedelta(days=offset) for offset in range(days)]
+        first_blocks = [self.block_at(_midnight(day)) for day in starts]
+
+        boundaries = []
+        for index, start in enumerate(starts):
+            to_block = first_blocks[index + 1] - 1 if index + 1 < len(starts) else head_number
+            boundaries.append({
+                'date': start.isoformat(),
+                'from_block': first_blocks[index],
+                'to_block': to_block
+            })
+        return boundaries
+
+    def timestamp_of(self, block_number):
+        """Timestamp of a block, from the index when it has been seen before"""
+        sample = db.session.get(BlockTimestamp, block_number)
+        if sample is not None:
+            return sample.timestamp
+        timestamp = self._fetch_timestamp(block_number)
+        self._remember({block_number: timestamp}, self.head()[0])
+        return timestamp
+
+    def dates_for_blocks(self, block_numbers):
+        """Map each block number to the UTC date it was mined on"""
+        if not block_numbers:
+            return {}
+        first_day = _utc_date(self.timestamp_of(min(block_numbers)))
+        last_day = _utc_date(self.timestamp_of(max(block_numbers)))
+
+        days = [first_day]
+        first_blocks = [min(block_numbers)]
+        day = first_day
+        while day < last_day:
+            day += timedelta(days=1)
+            days.append(day)
+            first_blocks.append(self.block_at(_midnight(day)))
+
+        return {
+            number: days[bisect.bisect_right(first_blocks, number) - 1]
+            for number in block_numbers
+        }
+
+    def _fetch_timestamp(self, block_number):
+        return self.w3.eth.get_block(block_number)['timestamp']
+
+    def _closest_below(self, timestamp):
+        sample = BlockTimestamp.query.filter(
+            BlockTimestamp.timestamp < timestamp
+        ).order_by(BlockTimestamp.timestamp.desc(), BlockTimestamp.block_number.desc()).first()
+        return (sample.block_number, sample.timestamp) if sample else None
+
+    def _closest_at_or_above(self, timestamp):
+        sample = BlockTimestamp.query.filter(
+            BlockTimestamp.timestamp >= timestamp
+        ).order_by(BlockTimestamp.timestamp, BlockTimestamp.block_number).first()
+        return (sample.block_number, sample.timestamp) if sample else None
+
+    def _remember(self, samples, head_number):
+        rows = [
+            {'block_number': number, 'timestamp': timestamp}
+            for number, timestamp in samples.items()
+            if number <= head_number - self.finality_depth
+        ]
+        if not rows:
+            return
+        try:
+            dialect = db.engine.dialect.name
+            if dialect == 'postgresql':
+                stmt = postgresql.insert(BlockTimestamp).on_conflict_do_nothing()
+            elif dialect == 'sqlite':
+                stmt = sqlite.insert(BlockTimestamp).on_conflict_do_nothing()
+            else:
+                stmt = insert(BlockTimestamp)
+            db.session.execute(stmt, rows)
+            db.session.commit()
+        except Exception as e:
+            # The index is only an accelerator - the answer is still correct
+            db.session.rollback()
+            logger.warning(f"Could not store block timestamps: {e}")
+
+
+def _utc_date(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).date()
+
+
+def _midnight(day):
+    """Unix timestamp of 00:00 UTC on a date"""
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
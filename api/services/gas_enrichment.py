@@ -0,0 +1,96 @@
+import logging
+from sqlalchemy import update
+from api.models import db
+from api.models.transaction import Transaction
+from api.models.wallet import Wallet
+from api.services.rollups import increment_gas_rollups
+
+logger = logging.getLogger(__name__)
+
+# Receipts fetched per enrichment pass (sent as JSON-RPC batches of RPC_BATCH_SIZE)
+DEFAULT_BATCH_SIZE = 1000
+
+
+def pending_gas_query():
+    """Outgoing transactions whose receipt hasn't been fetched yet"""
+    return db.session.query(
+        Transaction.id, Transaction.tx_hash, Transaction.wallet_id, Transaction.timestamp, Wallet.address
+    ).join(
+        Wallet, Transaction.wallet_id == Wallet.id
+    ).filter(
+        Transaction.effective_gas_price.is_(None),
+        db.func.lower(Transaction.from_address) == db.func.lower(Wallet.address)
+    )
+
+
+def enrich_gas(web3_service, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Backfill gas_used, effective_gas_price, gas_fee and status for up to
+    batch_size outgoing transactions from their receipts, and add them to
+    the wallets' daily gas rollups in the same transaction. Returns the
+    number of rows updated. Commits.
+
+    Transfers only tell us the wallet moved value; for internal transfers
+    someone else may have sent (and paid for) the transaction, so gas_fee
+    is only charged when the receipt's sender is the wallet itself.
+
+    Passes may overlap (block listener and sweep, or several processes).
+    Rows are claimed with a conditional UPDATE before they are written, and
+    only the claimed ones are added to the rollups, so no fee is counted twice.
+    """
+    pending = pending_gas_query().order_by(Transaction.id).limit(batch_size).all()
+    if not pending:
+        return 0
+
+    receipts, errors = web3_service.get_receipts([row.tx_hash for row in pending])
+    if errors:
+        # Left NULL, so they are retried on the next pass
+        logger.warning(f"Could not fetch {len(errors)} receipts, e.g. {next(iter(errors.items()))}")
+
+    updates = []
+    rollups = {}
+    for tx in pending:
+        if tx.tx_hash not in receipts:
+            continue
+        receipt = receipts[tx.tx_hash]
+        if receipt is None:
+            # Unknown to the node - mark as done so it isn't retried forever
+            updates.append({'id': tx.id, 'effective_gas_price': '0'})
+            continue
+        paid_by_wallet = receipt['from'].lower() == tx.address.lower()
+        row = {
+            'id': tx.id,
+            'gas_used': receipt['gas_used'],
+            'effective_gas_price': str(receipt['effective_gas_price']),
+            'gas_fee': receipt['gas_used'] * receipt['effective_gas_price'] if paid_by_wallet else 0
+        }
+        if receipt['status'] is not None:
+            row['status'] = receipt['status']
+        updates.append(row)
+        if tx.timestamp is not None:
+            rollups[tx.id] = {
+                'wallet_id': tx.wallet_id,
+                'day': tx.timestamp.date(),
+                'tx_count': 1,
+                'gas_used': row['gas_used'],
+                'gas_fee': row['gas_fee']
+            }
+
+    if not updates:
+        return 0
+
+    # Claim: a concurrent pass blocks on these rows, then finds them no longer NULL
+    claimed = set(db.session.execute(
+        update(Transaction)
+        .where(Transaction.id.in_([row['id'] for row in updates]), Transaction.effective_gas_price.is_(None))
+        .values(effective_gas_price='')
+        .returning(Transaction.id)
+        .execution_options(synchronize_session=False)
+    ).scalars())
+    updates = [row for row in updates if row['id'] in claimed]
+    if updates:
+        # ORM bulk UPDATE by primary key - one executemany per distinct key set
+        db.session.execute(update(Transaction), updates)
+        increment_gas_rollups([rollups[row['id']] for row in updates if row['id'] in rollups])
+    db.session.commit()
+    return len(updates)
@@ -0,0 +1,216 @@
+import logging
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from api.models import db
+from api.models.transfer_log import TransferLog, TransferLogRange
+from api.services.rollups import flow_totals, increment_flow_rollups
+
+logger = logging.getLogger(__name__)
+
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+
+INBOUND = 'in'
+OUTBOUND = 'out'
+
+# Blocks behind the head treated as final - logs above this can still be reorged
+FINALITY_DEPTH = 64
+
+
+def transfer_topics(address, direction):
+    """getLogs topics for Transfer events into (INBOUND) or out of (OUTBOUND) an address"""
+    padded = "0x" + address[2:].lower().zfill(64)
+    if direction == INBOUND:
+        return [TRANSFER_TOPIC, None, padded]
+    return [TRANSFER_TOPIC, padded, None]
+
+
+def _hex(value):
+    return value.hex() if hasattr(value, 'hex') else value
+
+
+def to_transfer(log):
+    """Flatten a raw Transfer log into the fields flow queries need"""
+    data = _hex(log['data'])
+    data = data[2:] if data.startswith('0x') else data
+    tx_hash = _hex(log['transactionHash'])
+    return {
+        'block_number': log['blockNumber'],
+        'log_index': log['logIndex'],
+        'tx_hash': tx_hash if tx_hash.startswith('0x') else '0x' + tx_hash,
+        'token_address': log['address'],
+        # ERC-721 Transfers carry the token id in a topic and no data
+        'value': int(data[:64], 16) if data else 0
+    }
+
+
+class TransferLogStore:
+    """
+    Local copy of tracked wallets' Transfer logs.
+
+    TransferLogRange records which block ranges are already stored per
+    address and direction, so a query only fetches the uncovered gaps from
+    the node. Only blocks at least finality_depth behind to_block are
+    stored; the unfinalized tail is always fetched live.
+
+    Stored logs are also summed into DailyFlowRollup rows (per UTC day,
+    token and direction) as they are inserted, so flow totals for a period
+    are a range sum over at most one row per day and token.
+    """
+
+    def __init__(self, scanner, block_times, finality_depth=FINALITY_DEPTH):
+        self.scanner = scanner
+        self.block_times = block_times
+        self.finality_depth = finality_depth
+
+    def get_transfers(self, address, direction, from_block, to_block):
+        """Transfers for address in [from_block, to_block], in chain order"""
+        address = address.lower()
+        stored_to, unsaved = self.sync(address, direction, from_block, to_block)
+
+        transfers = []
+        if from_block <= stored_to:
+            transfers = self._load(address, direction, from_block, stored_to) + unsaved
+            if unsaved:
+                transfers.sort(key=lambda t: (t['block_number'], t['log_index']))
+        transfers.extend(self._tail(address, direction, max(from_block, stored_to + 1), to_block))
+        return transfers
+
+    def get_flow_totals(self, address, direction, start_day, from_block, to_block):
+        """
+        Per-token transfer_count/total_raw over [from_block, to_block], where
+        from_block is the first block of start_day. Stored days come from the
+        rollups; only unstored ranges and the unfinalized tail touch the node.
+        """
+        address = address.lower()
+        stored_to, unsaved = self.sync(address, direction, from_block, to_block)
+
+        # Rollups cover every stored day from start_day on, which can run past
+        # this call's stored_to (a previous call saw a later head). Only the
+        # blocks no range covers are fetched live, so none is counted twice
+        totals = flow_totals(address, direction, start_day)
+        tail = []
+        for start, end in self.uncovered(address, direction, max(from_block, stored_to + 1), to_block):
+            tail.extend(self._tail(address, direction, start, end))
+        for transfer in unsaved + tail:
+            token = transfer['token_address']
+            entry = totals.setdefault(token, {"token_address": token, "transfer_count": 0, "total_raw": 0})
+            entry["transfer_count"] += 1
+            entry["total_raw"] += transfer['value']
+        return list(totals.values())
+
+    def sync(self, address, direction, from_block, to_block):
+        """
+        Store the finalized part of [from_block, to_block] that isn't stored yet.
+        Returns (stored_to, unsaved): the last finalized block, and fetched
+        transfers that could not be stored (the caller must count them itself).
+        """
+        stored_to = to_block - self.finality_depth
+        unsaved = []
+        if from_block <= stored_to:
+            for start, end in self.uncovered(address, direction, from_block, stored_to):
+                logs = self.scanner.get_logs({"topics": transfer_topics(address, direction)}, start, end)
+                fetched = [to_transfer(log) for log in logs]
+                if not self._save(address, direction, fetched, start, end):
+                    unsaved.extend(fetched)
+        return stored_to, unsaved
+
+    def _tail(self, address, direction, from_block, to_block):
+        if from_block > to_block:
+            return []
+        logs = self.scanner.get_logs({"topics": transfer_topics(address, direction)}, from_block, to_block)
+        return [to_transfer(log) for log in logs]
+
+    def uncovered(self, address, direction, from_block, to_block):
+        """Sub-ranges of [from_block, to_block] not stored yet"""
+        ranges = TransferLogRange.query.filter(
+            TransferLogRange.address == address,
+            TransferLogRange.direction == direction,
+            TransferLogRange.from_block <= to_block,
+            TransferLogRange.to_block >= from_block
+        ).order_by(TransferLogRange.from_block).all()
+
+        gaps = []
+        cursor = from_block
+        for covered in ranges:
+            if covered.from_block > cursor:
+                gaps.append((cursor, covered.from_block - 1))
+            cursor = max(cursor, covered.to_block + 1)
+        if cursor <= to_block:
+            gaps.append((cursor, to_block))
+        return gaps
+
+    def _load(self, address, direction, from_block, to_block):
+        rows = db.session.query(
+            TransferLog.block_number, TransferLog.log_index, TransferLog.tx_hash,
+            TransferLog.token_address, TransferLog.value
+        ).filter(
+            TransferLog.address == address,
+            TransferLog.direction == direction,
+            TransferLog.block_number.between(from_block, to_block)
+        ).order_by(TransferLog.block_number, TransferLog.log_index)
+        return [
+            {'block_number': block_number, 'log_index': log_index, 'tx_hash': tx_hash,
+             'token_address': token_address, 'value': int(value)}
+            for block_number, log_index, tx_hash, token_address, value in rows
+        ]
+
+    def _save(self, address, direction, transfers, from_block, to_block):
+        """
+        Store a fetched range's logs, add them to the daily rollups and mark
+        the range covered, in one transaction. Returns success.
+        """
+        rows = [
+            {**transfer, 'address': address, 'direction': direction, 'value': str(transfer['value'])}
+            for transfer in transfers
+        ]
+        try:
+            # Resolved before writing anything - the block-time index commits on its own
+            dates = self.block_times.dates_for_blocks({row['block_number'] for row in rows})
+            if rows:
+                inserted = self._insert(rows)
+                increment_flow_rollups([{
+                    'address': address,
+                    'day': dates[row['block_number']],
+                    'direction': direction,
+                    'token_address': row['token_address'],
+                    'transfer_count': 1,
+                    'total_raw': int(row['value'])
+                } for row in inserted])
+            self._add_range(address, direction, from_block, to_block)
+            db.session.commit()
+            return True
+        except Exception as e:
+            # The caller still answers from the fetched logs; the range is retried next time
+            db.session.rollback()
+            logger.warning(f"Could not store transfer logs for {address} [{from_block}, {to_block}]: {e}")
+            return False
+
+    def _insert(self, rows):
+        """Insert log rows, skipping ones already stored; returns the rows actually inserted"""
+        dialect = db.engine.dialect.name
+        if dialect not in ('postgresql', 'sqlite'):
+            db.session.execute(insert(TransferLog), rows)
+            return rows
+
+        insert_ = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert_(TransferLog).on_conflict_do_nothing().returning(
+            TransferLog.block_number, TransferLog.log_index
+        )
+        inserted = {tuple(key) for key in db.session.execute(stmt, rows)}
+        return [row for row in rows if (row['block_number'], row['log_index']) in inserted]
+
+    def _add_range(self, address, direction, from_block, to_block):
+        """Record [from_block, to_block] as covered, merging overlapping or adjacent ranges"""
+        touching = TransferLogRange.query.filter(
+            TransferLogRange.address == address,
+            TransferLogRange.direction == direction,
+            TransferLogRange.from_block <= to_block + 1,
+            TransferLogRange.to_block >= from_block - 1
+        ).all()
+        for covered in touching:
+            from_block = min(from_block, covered.from_block)
+            to_block = max(to_block, covered.to_block)
+            db.session.delete(covered)
+        db.session.add(TransferLogRange(
+            address=address, direction=direction, from_block=from_block, to_block=to_block
+        ))
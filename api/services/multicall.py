@@ -0,0 +1,81 @@
+from eth_abi import encode
+from web3 import Web3
+
+# Multicall3 is deployed at the same address on mainnet and most EVM chains
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+MULTICALL3_ABI = [
+    {"name":"aggregate3","type":"function","stateMutability":"payable",
+     "inputs":[{"name":"calls","type":"tuple[]","components":[
+         {"name":"target","type":"address"},
+         {"name":"allowFailure","type":"bool"},
+         {"name":"callData","type":"bytes"}]}],
+     "outputs":[{"name":"returnData","type":"tuple[]","components":[
+         {"name":"success","type":"bool"},
+         {"name":"returnData","type":"bytes"}]}]},
+]
+
+BALANCE_OF_SELECTOR = bytes.fromhex("70a08231")       # balanceOf(address)
+GET_ETH_BALANCE_SELECTOR = bytes.fromhex("4d2301cc")  # getEthBalance(address)
+
+ETH = "ETH"
+
+
+def _decode_uint(result):
+    success, data = result
+    if not success or len(data) < 32:
+        return None
+    return int.from_bytes(data[:32], 'big')
+
+
+class Multicall:
+    """Aggregates many read-only calls into a single eth_call via Multicall3"""
+
+    def __init__(self, w3, batch_size=500):
+        self.w3 = w3
+        self.contract = w3.eth.contract(address=MULTICALL3_ADDRESS, abi=MULTICALL3_ABI)
+        # Calls per eth_call - keeps huge token lists under the node's gas cap
+        self.batch_size = batch_size
+
+    def aggregate(self, calls, block_identifier='latest'):
+        """
+        Run (target, calldata) calls through aggregate3 with allowFailure set.
+        Returns a list of (success, return_data) in call order.
+        """
+        results = []
+        for start in range(0, len(calls), self.batch_size):
+            chunk = [
+                (Web3.to_checksum_address(target), True, data)
+                for target, data in calls[start:start + self.batch_size]
+            ]
+            results.extend(self.contract.functions.aggregate3(chunk).call(block_identifier=block_identifier))
+        return results
+
+    def get_balances(self, owners, tokens, block_identifier=None):
+        """
+        Read the ETH balance and every token balance for each owner.
+
+        All calls are pinned to one block (the latest, unless given) so the
+        result is consistent even when it spans several eth_calls. Returns
+        (block_number, balances) where balances[owner] maps ETH and each
+        token address to a raw integer balance, or None if the call reverted.
+        """
+        if block_identifier is None:
+            block_identifier = self.w3.eth.block_number
+
+        calls = []
+        for owner in owners:
+            arg = encode(['address'], [Web3.to_checksum_address(owner)])
+            calls.append((MULTICALL3_ADDRESS, GET_ETH_BALANCE_SELECTOR + arg))
+            calls.extend((token, BALANCE_OF_SELECTOR + arg) for token in tokens)
+
+        results = iter(self.aggregate(calls, block_identifier))
+
+        balances = {}
+        for owner in owners:
+            row = {ETH: _decode_uint(next(results))}
+            for token in tokens:
+                row[token] = _decode_uint(next(results))
+            balances[owner] = row
+
+        return block_identifier, balances
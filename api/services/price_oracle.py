@@ -0,0 +1,176 @@
+import json
+import logging
+import os
+import threading
+import time
+import redis
+import requests
+from api.cache.redis_client import cache
+
+logger = logging.getLogger(__name__)
+
+COINGECKO_TOKEN_PRICE_URL = "https://api.coingecko.com/api/v3/simple/token_price/ethereum"
+
+# ETH is priced as WETH, so one token_price call covers every holding
+WETH = "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2"
+
+# Redis hash shared by every process: token address -> {"usd": price, "at": fetched_at}
+SHARED_KEY = "prices:usd"
+
+PRICE_TTL_SECONDS = int(os.getenv("PRICE_TTL_SECONDS", 60))  # Fresh for this long
+PRICE_MAX_STALE_SECONDS = int(os.getenv("PRICE_MAX_STALE_SECONDS", 900))  # Served while refreshing or while CoinGecko is down
+PRICE_HOT_SECONDS = 600  # Tokens read this recently are refreshed ahead of expiry
+PRICE_REFRESH_AHEAD_SECONDS = 15
+
+# Contract addresses per token_price request
+PRICE_BATCH_SIZE = 100
+
+
+class PriceOracle:
+    """
+    USD prices for ERC-20 tokens from CoinGecko's simple/token_price.
+
+    Prices are kept in process and in a Redis hash shared by all workers.
+    A read never waits on CoinGecko for a token it has seen before: prices
+    past their TTL are served while a background thread refreshes them,
+    and refresh_hot() (run by the scheduler) re-fetches recently read
+    tokens shortly before they expire. Only a token's very first read is
+    fetched inline. Every fetch asks for all the tokens it needs in one
+    request per PRICE_BATCH_SIZE addresses.
+    """
+
+    def __init__(self, session=requests, client=None, ttl=PRICE_TTL_SECONDS, max_stale=PRICE_MAX_STALE_SECONDS,
+                 hot_seconds=PRICE_HOT_SECONDS, refresh_ahead=PRICE_REFRESH_AHEAD_SECONDS,
+                 batch_size=PRICE_BATCH_SIZE, timeout=5):
+        self.session = session
+        self.client = client if client is not None else cache.client
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.hot_seconds = hot_seconds
+        self.refresh_ahead = refresh_ahead
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self._prices = {}     # token -> (usd, fetched_at)
+        self._last_read = {}  # token -> time of the last get_prices() asking for it
+        self._attempted = {}  # token -> time of the last fetch asking for it
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get_prices(self, tokens):
+        """{token address (lowercase): USD price or None} for each token"""
+        now = time.time()
+        tokens = list(dict.fromkeys(t.lower() for t in tokens))
+        with self._lock:
+            for token in tokens:
+                self._last_read[token] = now
+
+        known = self._lookup(tokens)
+        cold = [t for t in tokens if t not in known or now - known[t][1] > self.max_stale]
+        # Unpriced tokens (or an unreachable CoinGecko) are retried once per TTL, not per read
+        with self._lock:
+            inline = [t for t in cold if now - self._attempted.get(t, 0) > self.ttl]
+        if inline:
+            known.update(self._fetch(inline))
+
+        expired = [t for t in tokens if t in known and now - known[t][1] > self.ttl and t not in cold]
+        if expired:
+            self._refresh_in_background(expired)
+
+        return {t: known[t][0] if t in known and now - known[t][1] <= self.max_stale else None for t in tokens}
+
+    def eth_price(self):
+        return self.get_prices([WETH])[WETH]
+
+    def refresh_hot(self):
+        """Re-fetch recently read prices that expire within refresh_ahead seconds"""
+        now = time.time()
+        with self._lock:
+            hot = [t for t, read_at in self._last_read.items() if now - read_at <= self.hot_seconds]
+            for token in [t for t in self._last_read if t not in hot]:
+                del self._last_read[token]
+                self._attempted.pop(token, None)
+        known = self._lookup(hot)
+        due = [t for t in hot if t not in known or now - known[t][1] > self.ttl - self.refresh_ahead]
+        if due:
+            self._fetch(due)
+        return len(due)
+
+    def _lookup(self, tokens):
+        """Newest known (usd, fetched_at) per token, from this process or the shared hash"""
+        with self._lock:
+            known = {t: self._prices[t] for t in tokens if t in self._prices}
+        now = time.time()
+        outdated = [t for t in tokens if t not in known or now - known[t][1] > self.ttl]
+        if not outdated:
+            return known
+        try:
+            shared = self.client.hmget(SHARED_KEY, outdated)
+        except redis.RedisError as e:
+            logger.warning(f"Shared price cache unavailable: {e}")
+            return known
+        with self._lock:
+            for token, raw in zip(outdated, shared):
+                if not raw:
+                    continue
+                entry = json.loads(raw)
+                if token not in known or entry["at"] > known[token][1]:
+                    known[token] = self._prices[token] = (entry["usd"], entry["at"])
+        return known
+
+    def _fetch(self, tokens):
+        """Fetch and store prices, one request per batch. Returns {token: (usd, fetched_at)}"""
+        fetched = {}
+        with self._lock:
+            for token in tokens:
+                self._attempted[token] = time.time()
+        for start in range(0, len(tokens), self.batch_size):
+            batch = tokens[start:start + self.batch_size]
+            try:
+                response = self.session.get(
+                    COINGECKO_TOKEN_PRICE_URL,
+                    params={"contract_addresses": ",".join(batch), "vs_currencies": "usd"},
+                    timeout=self.timeout
+                )
+                response.raise_for_status()
+                body = response.json()
+            except (requests.RequestException, ValueError) as e:
+                logger.warning(f"Price fetch failed for {len(batch)} tokens: {e}")
+                continue
+            now = time.time()
+            for token in batch:
+                usd = body.get(token, {}).get("usd")
+                if usd is not None:
+                    fetched[token] = (usd, now)
+        self._store(fetched)
+        return fetched
+
+    def _store(self, prices):
+        if not prices:
+            return
+        with self._lock:
+            self._prices.update(prices)
+        try:
+            self.client.hset(SHARED_KEY, mapping={
+                token: json.dumps({"usd": usd, "at": at}) for token, (usd, at) in prices.items()
+            })
+        except redis.RedisError as e:
+            logger.warning(f"Could not share prices: {e}")
+
+    def _refresh_in_background(self, tokens):
+        with self._lock:
+            tokens = [t for t in tokens if t not in self._refreshing]
+            self._refreshing.update(tokens)
+        if not tokens:
+            return
+
+        def refresh():
+            try:
+                self._fetch(tokens)
+            finally:
+                with self._lock:
+                    self._refreshing.difference_update(tokens)
+
+        threading.Thread(target=refresh, name="price-refresh", daemon=True).start()
+
+
+price_oracle = PriceOracle()
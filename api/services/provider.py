@@ -0,0 +1,61 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import Web3
+from web3.providers.rpc import HTTPProvider
+
+# Keep-alive connections kept per RPC host. Match it to the number of threads
+# calling the node at once (monitor workers + log scanner workers + requests)
+RPC_POOL_SIZE = int(os.getenv('RPC_POOL_SIZE', 32))
+
+# (connect, read) timeouts for every JSON-RPC request
+RPC_CONNECT_TIMEOUT_SECONDS = float(os.getenv('RPC_CONNECT_TIMEOUT_SECONDS', 5))
+RPC_TIMEOUT_SECONDS = float(os.getenv('RPC_TIMEOUT_SECONDS', 30))
+RPC_TIMEOUT = (RPC_CONNECT_TIMEOUT_SECONDS, RPC_TIMEOUT_SECONDS)
+
+_session = None
+_web3_instances = {}
+_lock = threading.Lock()
+
+
+def get_session():
+    """The process-wide requests.Session used for every call to the node"""
+    global _session
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=RPC_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+
+class PooledHTTPProvider(HTTPProvider):
+    """
+    HTTPProvider that posts through get_session(). web3's own session cache
+    is keyed by thread, so every monitor or scanner thread would otherwise
+    open its own connections to the node.
+    """
+
+    def make_request(self, method, params):
+        request_data = self.encode_rpc_request(method, params)
+        response = get_session().post(self.endpoint_uri, data=request_data, **self.get_request_kwargs())
+        response.raise_for_status()
+        return self.decode_rpc_response(response.content)
+
+
+def get_web3(provider_uri=None):
+    """
+    Shared Web3 instance for provider_uri (default: WEB3_PROVIDER_URI).
+    Blueprints, the monitor and Web3Service all reuse the same warm
+    connections to the node.
+    """
+    provider_uri = provider_uri or os.getenv('WEB3_PROVIDER_URI')
+    with _lock:
+        w3 = _web3_instances.get(provider_uri)
+        if w3 is None:
+            w3 = Web3(PooledHTTPProvider(provider_uri, request_kwargs={'timeout': RPC_TIMEOUT}))
+            _web3_instances[provider_uri] = w3
+        return w3
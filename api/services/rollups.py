@@ -0,0 +1,86 @@
+from sqlalchemy.dialects import postgresql
+from api.models import db
+from api.models.rollup import DailyGasRollup, DailyFlowRollup
+
+GAS_KEYS = ('wallet_id', 'day')
+GAS_COUNTERS = ('tx_count', 'gas_used', 'gas_fee')
+
+FLOW_KEYS = ('address', 'day', 'direction', 'token_address')
+FLOW_COUNTERS = ('transfer_count', 'total_raw')
+
+
+def _aggregate(rows, keys, counters):
+    """Sum counters of rows sharing the same key, so each rollup row is touched once"""
+    totals = {}
+    for row in rows:
+        key = tuple(row[k] for k in keys)
+        if key not in totals:
+            totals[key] = {**{k: row[k] for k in keys}, **{c: 0 for c in counters}}
+        for counter in counters:
+            totals[key][counter] += row[counter]
+    return list(totals.values())
+
+
+def _increment(model, keys, counters, rows):
+    """
+    Add rows' counters onto the matching rollup rows, creating missing ones.
+    A single INSERT ... ON CONFLICT DO UPDATE on Postgres. Elsewhere Uint256
+    counters are stored as text, so rows are read and added up in Python.
+    Does not commit.
+    """
+    rows = _aggregate(rows, keys, counters)
+    if not rows:
+        return
+
+    if db.engine.dialect.name == 'postgresql':
+        stmt = postgresql.insert(model)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={c: getattr(model, c) + getattr(stmt.excluded, c) for c in counters}
+        )
+        db.session.execute(stmt, rows)
+        return
+
+    for row in rows:
+        existing = db.session.get(model, tuple(row[k] for k in keys))
+        if existing is None:
+            db.session.add(model(**row))
+        else:
+            for counter in counters:
+                setattr(existing, counter, getattr(existing, counter) + row[counter])
+
+
+def increment_gas_rollups(rows):
+    """rows: dicts with wallet_id, day, tx_count, gas_used and gas_fee"""
+    _increment(DailyGasRollup, GAS_KEYS, GAS_COUNTERS, rows)
+
+
+def increment_flow_rollups(rows):
+    """rows: dicts with address, day, direction, token_address, transfer_count and total_raw"""
+    _increment(DailyFlowRollup, FLOW_KEYS, FLOW_COUNTERS, rows)
+
+
+def gas_by_day(wallet_id, start_day):
+    """Daily gas rollups for a wallet from start_day on, oldest first"""
+    return DailyGasRollup.query.filter(
+        DailyGasRollup.wallet_id == wallet_id,
+        DailyGasRollup.day >= start_day
+    ).order_by(DailyGasRollup.day).all()
+
+
+def flow_totals(address, direction, start_day):
+    """Per-token transfer count and raw total for an address/direction from start_day on"""
+    # Summed in Python - SQL SUM over text counters would go through floats on SQLite
+    rows = db.session.query(
+        DailyFlowRollup.token_address, DailyFlowRollup.transfer_count, DailyFlowRollup.total_raw
+    ).filter(
+        DailyFlowRollup.address == address.lower(),
+        DailyFlowRollup.direction == direction,
+        DailyFlowRollup.day >= start_day
+    )
+    totals = {}
+    for token, count, total in rows:
+        entry = totals.setdefault(token, {"token_address": token, "transfer_count": 0, "total_raw": 0})
+        entry["transfer_count"] += count
+        entry["total_raw"] += total
+    return totals
@@ -0,0 +1,122 @@
+import logging
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from api.models import db
+from api.models.transaction import Transaction
+
+logger = logging.getLogger(__name__)
+
+# Batches at least this big go through COPY on Postgres
+COPY_THRESHOLD = 5000
+
+# Max hashes per IN (...) lookup on databases without ON CONFLICT
+LOOKUP_CHUNK_SIZE = 500
+
+COLUMNS = [
+    'wallet_id', 'tx_hash', 'block_number', 'timestamp', 'from_address',
+    'to_address', 'value', 'gas_used', 'gas_price', 'status'
+]
+
+
+def _to_rows(wallet_id, transactions):
+    """Map formatted transfers to Transaction rows, dropping duplicate hashes within the batch"""
+    rows = {}
+    for tx in transactions:
+        if tx['hash'] in rows:
+            continue
+        rows[tx['hash']] = {
+            'wallet_id': wallet_id,
+            'tx_hash': tx['hash'],
+            'block_number': tx['block_number'],
+            'timestamp': tx['timestamp'],
+            'from_address': tx['from_address'],
+            'to_address': tx['to_address'],
+            'value': tx['value'],
+            'gas_used': tx['gas_used'],
+            'gas_price': tx['gas_price'],
+            'status': tx['status']
+        }
+    return list(rows.values())
+
+
+def bulk_insert_transactions(wallet_id, transactions, copy_threshold=COPY_THRESHOLD):
+    """
+    Insert a batch of transfers for a wallet, skipping hashes that are already
+    stored, in a constant number of statements instead of one query per row.
+
+    Uses INSERT ... ON CONFLICT DO NOTHING on Postgres and SQLite (and COPY
+    into a staging table for large Postgres batches), or one set-based hash
+    lookup elsewhere. Returns the hashes actually inserted. Does not commit.
+    """
+    rows = _to_rows(wallet_id, transactions)
+    if not rows:
+        return []
+
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == 'postgresql' and len(rows) >= copy_threshold:
+        inserted = _copy_insert(rows)
+        if inserted is not None:
+            return inserted
+
+    if dialect in ('postgresql', 'sqlite'):
+        dialect_insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = (
+            dialect_insert(Transaction)
+            .on_conflict_do_nothing(index_elements=['tx_hash'])
+            .returning(Transaction.tx_hash)
+        )
+        return list(db.session.scalars(stmt, rows))
+
+    return _lookup_insert(rows)
+
+
+def _lookup_insert(rows):
+    """Portable path: one IN (...) query per chunk to find existing hashes, then executemany"""
+    hashes = [row['tx_hash'] for row in rows]
+    existing = set()
+    for start in range(0, len(hashes), LOOKUP_CHUNK_SIZE):
+        chunk = hashes[start:start + LOOKUP_CHUNK_SIZE]
+        existing.update(db.session.scalars(
+            select(Transaction.tx_hash).where(Transaction.tx_hash.in_(chunk))
+        ))
+
+    new_rows = [row for row in rows if row['tx_hash'] not in existing]
+    if new_rows:
+        db.session.execute(insert(Transaction), new_rows)
+    return [row['tx_hash'] for row in new_rows]
+
+
+def _copy_insert(rows):
+    """
+    Postgres bulk path: COPY the batch into a temp staging table, then move it
+    into transactions with a single INSERT ... SELECT ... ON CONFLICT DO NOTHING.
+    Returns None if the driver doesn't support COPY (caller falls back).
+    """
+    connection = db.session.connection()
+    driver_connection = connection.connection.driver_connection
+
+    with driver_connection.cursor() as cursor:
+        if not hasattr(cursor, 'copy'):
+            return None  # psycopg2 and friends - use the ON CONFLICT path
+
+        columns = ', '.join(COLUMNS)
+        cursor.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS transactions_staging "
+            "(LIKE transactions INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+        )
+        cursor.execute("TRUNCATE transactions_staging")
+
+        with cursor.copy(f"COPY transactions_staging ({columns}) FROM STDIN") as copy:
+            for row in rows:
+                copy.write_row([row[column] for column in COLUMNS])
+
+        cursor.execute(
+            f"INSERT INTO transactions ({columns}) "
+            f"SELECT {columns} FROM transactions_staging "
+            f"ON CONFLICT (tx_hash) DO NOTHING RETURNING tx_hash"
+        )
+        inserted = [row[0] for row in cursor.fetchall()]
+
+    logger.info(f"COPY-ingested {len(inserted)}/{len(rows)} transactions")
+    return inserted
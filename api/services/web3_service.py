@@ -1,13 +1,29 @@
-from web3 import Web3
 from datetime import datetime
 import os
+import re
 import requests
 import time
+from api.services.provider import RPC_TIMEOUT, get_session, get_web3
+
+# Node error messages for a batch rejected because of its size, e.g.
+# "Batch size too large", "batch limit exceeded", "too many requests in batch"
+BATCH_TOO_LARGE = re.compile(r'batch.*(too large|too big|limit|exceed|size)|too many.*batch', re.IGNORECASE)
+
+class RPCError(Exception):
+    """Error returned by the node for a single JSON-RPC call"""
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
 
 class Web3Service:
     def __init__(self):
         provider_uri = os.getenv('WEB3_PROVIDER_URI')
-        self.w3 = Web3(Web3.HTTPProvider(provider_uri))
+        self.w3 = get_web3(provider_uri)
+        self.session = get_session()  # Pooled keep-alive connections shared with every Web3 instance
+        
+        # Max calls packed into one JSON-RPC batch payload
+        self.batch_size = max(1, int(os.getenv('RPC_BATCH_SIZE', 250)))
         
         # Extract Alchemy API key from provider URI
         # Format: https://eth-mainnet.g.alchemy.com/v2/YOUR-API-KEY
@@ -22,6 +38,146 @@ class Web3Service:
         balance_eth = self.w3.from_wei(balance_wei, 'ether')
         return float(balance_eth)
     
+    def get_balances(self, addresses, block_identifier='latest'):
+        """
+        Get ETH balances for many addresses with JSON-RPC batch requests.
+        
+        Returns (balances, errors): balances maps address -> balance in ETH,
+        errors maps address -> error message for every address that could not
+        be fetched. A failed chunk only fails the addresses it contained.
+        """
+        if not isinstance(block_identifier, str):
+            block_identifier = hex(block_identifier)
+        
+        calls = [('eth_getBalance', [address, block_identifier]) for address in addresses]
+        
+        balances = {}
+        errors = {}
+        for address, (result, error) in zip(addresses, self.batch_request(calls)):
+            if error is not None:
+                errors[address] = str(error)
+                continue
+            try:
+                balances[address] = float(self.w3.from_wei(int(result, 16), 'ether'))
+            except (TypeError, ValueError):
+                errors[address] = f"Unexpected eth_getBalance result: {result!r}"
+        
+        return balances, errors
+    
+    def batch_request(self, calls):
+        """
+        Send (method, params) calls as JSON-RPC batches of at most batch_size.
+        
+        Returns a list of (result, error) tuples in the same order as calls,
+        where error is an RPCError (or None on success).
+        """
+        results = []
+        for start in range(0, len(calls), self.batch_size):
+            results.extend(self._send_batch(calls[start:start + self.batch_size]))
+        return results
+    
+    def _send_batch(self, calls):
+        """Send one batch payload, splitting it if the node rejects the batch as a whole"""
+        payload = [
+            {"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+            for i, (method, params) in enumerate(calls)
+        ]
+        
+        try:
+            response = self.session.post(
+                self.alchemy_url,
+                json=payload,
+                headers={"Content-Type": "application/json"},
+                timeout=RPC_TIMEOUT
+            )
+        except requests.RequestException as e:
+            # Node unreachable - no point retrying smaller batches
+            error = RPCError(f"Batch request failed: {e}")
+            return [(None, error)] * len(calls)
+        
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        
+        if response.status_code != 200 or not isinstance(body, list):
+            error = body.get('error') if isinstance(body, dict) else None
+            if isinstance(error, dict):
+                error = RPCError(error.get('message', 'Unknown error'), error.get('code'))
+            else:
+                error = RPCError(error or f"HTTP {response.status_code}")
+            
+            # Only a batch rejected for its size gets smaller; a rate limit,
+            # auth failure or node error would just be repeated per half
+            if len(calls) > 1 and self._batch_too_large(response.status_code, error):
+                middle = len(calls) // 2
+                return self._send_batch(calls[:middle]) + self._send_batch(calls[middle:])
+            return [(None, error)] * len(calls)
+        
+        # Responses may come back in any order - match them up by id
+        by_id = {item.get('id'): item for item in body if isinstance(item, dict)}
+        
+        results = []
+        for i in range(len(calls)):
+            item = by_id.get(i)
+            if item is None:
+                results.append((None, RPCError("No response for batch item")))
+            elif item.get('error'):
+                error = item['error']
+                results.append((None, RPCError(error.get('message', 'Unknown error'), error.get('code'))))
+            else:
+                results.append((item.get('result'), None))
+        return results
+    
+    @staticmethod
+    def _batch_too_large(status_code, error):
+        """413, or a batch-size complaint in a 200/400 error body"""
+        if status_code == 413:
+            return True
+        return status_code in (200, 400) and bool(BATCH_TOO_LARGE.search(error.message))
+    
+    def get_receipts(self, tx_hashes):
+        """
+        Fetch receipts for many transactions with batched eth_getTransactionReceipt.
+        
+        Returns (receipts, errors): receipts maps hash -> dict with from,
+        gas_used, effective_gas_price and status (ints), or None if the node
+        doesn't know the transaction; errors maps hash -> error message.
+        """
+        calls = [('eth_getTransactionReceipt', [tx_hash]) for tx_hash in tx_hashes]
+        
+        receipts = {}
+        errors = {}
+        for tx_hash, (result, error) in zip(tx_hashes, self.batch_request(calls)):
+            if error is not None:
+                errors[tx_hash] = str(error)
+                continue
+            if result is None:
+                receipts[tx_hash] = None
+                continue
+            try:
+                receipts[tx_hash] = {
+                    'from': result['from'],
+                    'gas_used': int(result['gasUsed'], 16),
+                    # Pre-London receipts from some nodes lack effectiveGasPrice
+                    'effective_gas_price': int(result['effectiveGasPrice'], 16) if result.get('effectiveGasPrice') else None,
+                    'status': int(result['status'], 16) if result.get('status') else None
+                }
+            except (KeyError, TypeError, ValueError):
+                errors[tx_hash] = f"Unexpected receipt: {result!r}"
+        
+        # Legacy receipts without effectiveGasPrice paid the transaction's gasPrice
+        missing = [h for h, receipt in receipts.items() if receipt and receipt['effective_gas_price'] is None]
+        calls = [('eth_getTransactionByHash', [tx_hash]) for tx_hash in missing]
+        for tx_hash, (result, error) in zip(missing, self.batch_request(calls)):
+            if error is None and result and result.get('gasPrice'):
+                receipts[tx_hash]['effective_gas_price'] = int(result['gasPrice'], 16)
+            else:
+                del receipts[tx_hash]
+                errors[tx_hash] = str(error or "No gas price for transaction")
+        
+        return receipts, errors
+    
     def get_transaction_count(self, address):
         """Get number of transactions (nonce)"""
         return self.w3.eth.get_transaction_count(address)
@@ -44,95 +200,83 @@ class Web3Service:
             'status': receipt['status']
         }
     
-    def get_transactions(self, address, max_count=50):
+    def get_transfers(self, address, from_block=0, to_block=None, max_pages=None):
         """
-        Get transaction history for an address using Alchemy's enhanced API
-        Uses alchemy_getAssetTransfers which is available on free tier
+        Get every external/internal transfer to or from an address in a block
+        range, following Alchemy pageKey pagination (oldest first).
+        
+        Returns (transactions, synced_through) where synced_through is the last
+        block whose transfers were all fetched. It is below to_block when
+        max_pages cut the walk short, so the caller can resume from there.
+        Errors are raised rather than swallowed so cursors never skip ahead.
         """
-        try:
-            # Use Alchemy's getAssetTransfers method
-            # This includes both incoming and outgoing ETH transfers
-            
-            # Get transactions TO this address (incoming)
-            incoming_params = {
-                "jsonrpc": "2.0",
-                "id": 1,
-                "method": "alchemy_getAssetTransfers",
-                "params": [{
-                    "fromBlock": "0x0",
-                    "toAddress": address,
-                    "category": ["external", "internal"],
-                    "maxCount": hex(max_count // 2),  # Split limit between incoming/outgoing
-                    "order": "desc"
-                }]
-            }
-            
-            # Get transactions FROM this address (outgoing)
-            outgoing_params = {
-                "jsonrpc": "2.0",
-                "id": 2,
-                "method": "alchemy_getAssetTransfers",
-                "params": [{
-                    "fromBlock": "0x0",
-                    "fromAddress": address,
-                    "category": ["external", "internal"],
-                    "maxCount": hex(max_count // 2),
-                    "order": "desc"
-                }]
-            }
-            
-            # Make API calls
-            headers = {"Content-Type": "application/json"}
-            
-            incoming_response = requests.post(
-                self.alchemy_url,
-                json=incoming_params,
-                headers=headers,
-                timeout=10
-            )
-            
-            outgoing_response = requests.post(
+        if to_block is None:
+            to_block = self.get_latest_block_number()
+        
+        incoming, incoming_synced = self._get_asset_transfers(
+            {"toAddress": address}, from_block, to_block, max_pages
+        )
+        outgoing, outgoing_synced = self._get_asset_transfers(
+            {"fromAddress": address}, from_block, to_block, max_pages
+        )
+        
+        # Remove duplicates (self-transfers show up in both directions)
+        seen_hashes = set()
+        transactions = []
+        for transfer in incoming + outgoing:
+            tx = self._format_alchemy_transfer(transfer)
+            if tx['hash'] not in seen_hashes:
+                seen_hashes.add(tx['hash'])
+                transactions.append(tx)
+        
+        transactions.sort(key=lambda x: x['block_number'])
+        
+        return transactions, min(incoming_synced, outgoing_synced)
+    
+    def _get_asset_transfers(self, address_filter, from_block, to_block, max_pages=None):
+        """Walk alchemy_getAssetTransfers pages for one direction; returns (raw transfers, synced_through)"""
+        params = {
+            "fromBlock": hex(from_block),
+            "toBlock": hex(to_block),
+            "category": ["external", "internal"],
+            "maxCount": hex(1000),  # Alchemy's page size limit
+            "order": "asc",
+            "withMetadata": True,
+            **address_filter
+        }
+        
+        transfers = []
+        pages = 0
+        while True:
+            response = self.session.post(
                 self.alchemy_url,
-                json=outgoing_params,
-                headers=headers,
-                timeout=10
+                json={"jsonrpc": "2.0", "id": 1, "method": "alchemy_getAssetTransfers", "params": [params]},
+                headers={"Content-Type": "application/json"},
+                timeout=RPC_TIMEOUT
             )
+            response.raise_for_status()
+            data = response.json()
             
-            transactions = []
-            
-            # Process incoming transactions
-            if incoming_response.status_code == 200:
-                incoming_data = incoming_response.json()
-                if 'result' in incoming_data:
-                    result = incoming_data['result']
-                    if result and 'transfers' in result and result['transfers']:
-                        for transfer in result['transfers']:
-                            transactions.append(self._format_alchemy_transfer(transfer))
-            
-            # Process outgoing transactions
-            if outgoing_response.status_code == 200:
-                outgoing_data = outgoing_response.json()
-                if 'result' in outgoing_data:
-                    result = outgoing_data['result']
-                    if result and 'transfers' in result and result['transfers']:
-                        for transfer in result['transfers']:
-                            transactions.append(self._format_alchemy_transfer(transfer))
+            if data.get('error'):
+                raise RPCError(data['error'].get('message', 'Unknown error'), data['error'].get('code'))
             
-            # Remove duplicates and sort by block number (descending)
-            seen_hashes = set()
-            unique_transactions = []
-            for tx in transactions:
-                if tx['hash'] not in seen_hashes:
-                    seen_hashes.add(tx['hash'])
-                    unique_transactions.append(tx)
+            result = data.get('result') or {}
+            transfers.extend(result.get('transfers') or [])
+            pages += 1
             
-            unique_transactions.sort(key=lambda x: x['block_number'], reverse=True)
+            page_key = result.get('pageKey')
+            if not page_key:
+                return transfers, to_block
             
-            return unique_transactions[:max_count]
+            if max_pages and pages >= max_pages:
+                # The last block seen may continue on the next page. If that is
+                # still the first block, keep paging past the budget - stopping
+                # now would sync nothing and hit the same wall next cycle
+                last_block = int(transfers[-1]['blockNum'], 16)
+                if last_block > from_block:
+                    return transfers, last_block - 1
             
-        except Exception as e:
-            print(f"Error fetching transactions from Alchemy: {e}")
-            return []
+            params["pageKey"] = page_key
     
     def _format_alchemy_transfer(self, transfer):
         """Format Alchemy transfer data to our standard format"""
@@ -164,8 +308,8 @@ class Web3Service:
             'from_address': transfer.get('from', ''),
             'to_address': transfer.get('to', ''),
             'value': value,
-            'gas_used': 0,  # Alchemy doesn't provide this in transfers
-            'gas_price': '0',
+            'gas_used': None,  # Not in transfers - backfilled from receipts by gas enrichment
+            'gas_price': None,
             'status': 1  # Assume success if it's in the transfer list
         }
     
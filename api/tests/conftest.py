@@ -0,0 +1,13 @@
+import pytest
+from api.app import create_app
+from api.models import db
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,49 @@
+import os
+import pytest
+from web3 import Web3
+from api.models.wallet import db, Wallet
+from api.services.address_index import AddressIndex, tracked_addresses
+
+def random_addresses(n):
+    return ['0x' + os.urandom(20).hex() for _ in range(n)]
+
+@pytest.mark.parametrize('bloom_min_addresses', [1, 10 ** 6])
+def test_match_finds_exactly_the_tracked_addresses(bloom_min_addresses):
+    tracked = random_addresses(500)
+    others = random_addresses(5000)
+    index = AddressIndex(tracked, bloom_min_addresses=bloom_min_addresses)
+
+    assert len(index) == 500
+    assert index.match(others + tracked[:10]) == {Web3.to_checksum_address(a) for a in tracked[:10]}
+    assert tracked[42].upper().replace('0X', '0x') in index
+
+def test_add_and_remove():
+    alice, bob = random_addresses(2)
+    index = AddressIndex([alice])
+
+    index.add(bob)
+    assert bob in index
+    index.remove(alice)
+    assert alice not in index and len(index) == 1
+
+def test_index_follows_committed_wallet_changes(app):
+    alice, bob = (Web3.to_checksum_address(a) for a in random_addresses(2))
+    tracked_addresses.replace([])
+
+    db.session.add(Wallet(address=alice))
+    db.session.commit()
+    assert alice in tracked_addresses
+
+    db.session.add(Wallet(address=bob))
+    db.session.flush()
+    db.session.rollback()
+    assert bob not in tracked_addresses
+
+    db.session.delete(Wallet.query.filter_by(address=alice).first())
+    db.session.commit()
+    assert alice not in tracked_addresses
+
+    db.session.add(Wallet(address=bob))
+    db.session.commit()
+    tracked_addresses.replace([])
+    assert tracked_addresses.reload() == 1 and bob in tracked_addresses
@@ -0,0 +1,73 @@
+import pytest
+from web3 import Web3
+from api.models.wallet import db, Wallet
+from api.services.log_store import TRANSFER_TOPIC
+from api.workers.block_listener import BlockListener
+from unittest.mock import MagicMock
+
+TRACKED = "0x" + "a1" * 20
+TOKEN_HOLDER = "0x" + "b2" * 20
+IDLE = "0x" + "c3" * 20
+STRANGER = "0x" + "d4" * 20
+
+@pytest.fixture(autouse=True)
+def wallets(app):
+    for address in (TRACKED, TOKEN_HOLDER, IDLE):
+        db.session.add(Wallet(address=Web3.to_checksum_address(address), balance='0'))
+    db.session.commit()
+
+def make_node(calls):
+    """batch_request stand-in: blocks with one tx each, one Transfer log per range"""
+    def batch_request(batch):
+        calls.append(batch)
+        results = []
+        for method, params in batch:
+            if method == 'eth_getBlockByNumber':
+                results.append(({'number': params[0], 'transactions': [{'from': TRACKED, 'to': None}]}, None))
+            else:
+                topic = lambda address: '0x' + '0' * 24 + address[2:]
+                results.append(([{'topics': [TRANSFER_TOPIC, topic(STRANGER), topic(TOKEN_HOLDER)]}], None))
+        return results
+    return batch_request
+
+def make_listener(app, calls, **kwargs):
+    monitor = MagicMock()
+    monitor.web3_service.batch_request.side_effect = make_node(calls)
+    monitor.refresh_wallets.side_effect = lambda addresses, head: {'updated': len(addresses)}
+    return BlockListener(app, monitor, 'ws://node.test', **kwargs)
+
+def test_only_wallets_touched_by_the_block_are_refreshed(app):
+    calls = []
+    listener = make_listener(app, calls)
+
+    touched = listener.handle_head({'number': hex(100), 'hash': '0x01'})
+
+    assert touched == {Web3.to_checksum_address(TRACKED), Web3.to_checksum_address(TOKEN_HOLDER)}
+    listener.monitor.refresh_wallets.assert_called_once_with(sorted(touched), 100)
+    assert len(calls) == 1  # Block and logs in one batch
+    assert listener.last_block == 100
+
+def test_missed_blocks_are_replayed_up_to_the_catchup_limit(app):
+    calls = []
+    listener = make_listener(app, calls, max_catchup_blocks=3)
+    listener.last_block = 100
+
+    listener.handle_head({'number': hex(102), 'hash': '0x02'})
+    assert [params[0] for method, params in calls[0][:-1]] == [hex(101), hex(102)]
+
+    listener.handle_head({'number': hex(110), 'hash': '0x03'})
+    assert [params[0] for method, params in calls[1][:-1]] == [hex(108), hex(109), hex(110)]
+
+def test_failed_block_is_retried_with_the_next_head(app):
+    calls = []
+    listener = make_listener(app, calls)
+    listener.last_block = 100
+    listener.monitor.web3_service.batch_request.side_effect = Exception("node down")
+
+    with pytest.raises(Exception):
+        listener.handle_head({'number': hex(101), 'hash': '0x04'})
+    assert listener.last_block == 100
+
+    listener.monitor.web3_service.batch_request.side_effect = make_node(calls)
+    listener.handle_head({'number': hex(102), 'hash': '0x05'})
+    assert [params[0] for method, params in calls[0][:-1]] == [hex(101), hex(102)]
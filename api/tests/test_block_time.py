@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+from api.models import BlockTimestamp
+from api.services.block_time import BlockTimeResolver
+
+class FakeEth:
+    """Pre-merge style block times (13-15s) followed by 12s slots"""
+    def __init__(self, head=20000):
+        self.timestamps = [1_600_000_000]
+        for number in range(1, head + 1):
+            self.timestamps.append(self.timestamps[-1] + (13 + number % 3 if number < 10000 else 12))
+        self.calls = 0
+    
+    def get_block(self, identifier):
+        self.calls += 1
+        number = len(self.timestamps) - 1 if identifier == 'latest' else identifier
+        return {'number': number, 'timestamp': self.timestamps[number]}
+    
+    def first_block_at(self, timestamp):
+        return next(n for n, ts in enumerate(self.timestamps) if ts >= timestamp)
+
+def test_block_at_is_exact_and_reuses_samples(app):
+    eth = FakeEth()
+    resolver = BlockTimeResolver(SimpleNamespace(eth=eth))
+    
+    for timestamp in (eth.timestamps[0] + 1, eth.timestamps[5000] - 5, eth.timestamps[15000], eth.timestamps[19000] + 3):
+        assert resolver.block_at(timestamp) == eth.first_block_at(timestamp)
+    assert BlockTimestamp.query.count() > 0
+    
+    # The bracketing samples are stored, so a repeat costs no RPC calls
+    eth.calls = 0
+    assert resolver.block_at(eth.timestamps[15000]) == 15000
+    assert eth.calls == 0
+
+def test_day_boundaries_cover_consecutive_days(app):
+    eth = FakeEth()
+    resolver = BlockTimeResolver(SimpleNamespace(eth=eth))
+    
+    days = resolver.day_boundaries(2)
+    
+    assert len(days) == 2
+    assert days[0]['to_block'] + 1 == days[1]['from_block']
+    assert days[1]['to_block'] == 20000
+    midnight = eth.timestamps[20000] - eth.timestamps[20000] % 86400
+    assert days[1]['from_block'] == eth.first_block_at(midnight)
+    assert days[0]['from_block'] == eth.first_block_at(midnight - 86400)
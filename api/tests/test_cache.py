@@ -0,0 +1,178 @@
+import fnmatch
+import threading
+import time
+from api.cache.local_cache import LocalCache
+from api.cache.redis_client import RedisCache, CACHE_HIT, CACHE_MISS, CACHE_STALE
+
+class FakeRedis:
+    """Just enough of the redis client API for RedisCache, backed by a dict"""
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+        self.subscribers = {}
+        self.gets = 0
+    
+    def get(self, key):
+        self.gets += 1
+        return self.data.get(key)
+    
+    def publish(self, channel, message):
+        for handler in self.subscribers.get(channel, ()):
+            handler({"type": "message", "channel": channel, "data": message})
+    
+    def pubsub(self, ignore_subscribe_messages=False):
+        client = self
+        class PubSub:
+            def subscribe(self, **handlers):
+                for channel, handler in handlers.items():
+                    client.subscribers.setdefault(channel, []).append(handler)
+            def run_in_thread(self, sleep_time=0, daemon=False):
+                class Listener:
+                    def is_alive(self):
+                        return True
+                return Listener()
+        return PubSub()
+    
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+    
+    def set(self, key, value, nx=False, px=None):
+        with self.lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value
+            return True
+    
+    def exists(self, key):
+        return int(key in self.data)
+    
+    def eval(self, script, numkeys, key, token):
+        with self.lock:
+            if self.data.get(key) == token:
+                del self.data[key]
+    
+    def sadd(self, key, member):
+        self.data.setdefault(key, set()).add(member)
+    
+    def expire(self, key, ttl):
+        pass
+    
+    def sscan_iter(self, key, count=None):
+        return iter(list(self.data.get(key, ())))
+    
+    def scan_iter(self, match=None, count=None):
+        return iter([k for k in list(self.data) if fnmatch.fnmatch(k, match)])
+    
+    def unlink(self, *keys):
+        return sum(1 for k in keys if self.data.pop(k, None) is not None)
+    
+    delete = unlink
+    
+    def pipeline(self, transaction=True):
+        client = self
+        class Pipeline:
+            def __getattr__(self, name):
+                return getattr(client, name)
+            def execute(self):
+                pass
+        return Pipeline()
+
+def make_cache(client=None):
+    cache = RedisCache()
+    cache.client = client or FakeRedis()
+    return cache
+
+def test_get_or_compute_single_flight():
+    cache = make_cache()
+    calls = []
+    
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"value": 42}
+    
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute, ttl=60)))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    
+    assert len(calls) == 1
+    assert all(value == {"value": 42} for value, _ in results)
+    assert sorted(status for _, status in results).count(CACHE_MISS) == 1
+
+def test_get_or_compute_serves_stale_while_refreshing():
+    cache = make_cache()
+    cache.get_or_compute("k", lambda: {"n": 1}, ttl=0)
+    
+    refreshed = threading.Event()
+    def compute():
+        refreshed.set()
+        return {"n": 2}
+    
+    value, status = cache.get_or_compute("k", compute, ttl=60, stale_ttl=60)
+    assert (value, status) == ({"n": 1}, CACHE_STALE)
+    
+    assert refreshed.wait(1)
+    deadline = time.time() + 1
+    while cache.get_or_compute("k", compute, ttl=60)[1] != CACHE_HIT and time.time() < deadline:
+        time.sleep(0.01)
+    assert cache.get_or_compute("k", compute, ttl=60) == ({"n": 2}, CACHE_HIT)
+
+def test_invalidate_tag_removes_only_tagged_entries():
+    cache = make_cache()
+    tag = "address:0xabc"
+    cache.get_or_compute("portfolio:0xabc", lambda: {"a": 1}, ttl=60, tags=[tag])
+    cache.get_or_compute("gas:0xabc:30d", lambda: {"b": 2}, ttl=60, tags=[tag])
+    cache.set("flows:0xabc:7d", {"c": 3}, ttl=60)
+    cache.set("portfolio:0xdef", {"d": 4}, ttl=60, tags=["address:0xdef"])
+    
+    assert cache.invalidate_tag(tag) == 2
+    assert "tag:" + tag not in cache.client.data
+    assert cache.get("flows:0xabc:7d") == {"c": 3}
+    
+    # Untagged leftovers go through the SCAN-based fallback
+    assert cache.delete_pattern("flows:0xabc*") == 1
+    assert cache.get("portfolio:0xdef") == {"d": 4}
+    assert cache.invalidation_stats["invalidations"] == 2
+
+def test_l1_serves_repeat_reads_without_redis():
+    cache = make_cache()
+    cache.set("portfolio:0xabc", {"a": 1}, ttl=60)
+    
+    for _ in range(5):
+        assert cache.get("portfolio:0xabc") == {"a": 1}
+    assert cache.client.gets == 0
+    assert cache.tier_stats["l1_hits"] == 5
+
+def test_l1_invalidated_across_processes():
+    client = FakeRedis()
+    writer, reader = make_cache(client), make_cache(client)
+    tag = "address:0xabc"
+    writer.set("portfolio:0xabc", {"a": 1}, ttl=60, tags=[tag])
+    assert reader.get("portfolio:0xabc") == {"a": 1}
+    assert reader.tier_stats["l2_hits"] == 1
+    
+    writer.set("portfolio:0xabc", {"a": 2}, ttl=60, tags=[tag])
+    assert reader.get("portfolio:0xabc") == {"a": 2}
+    
+    writer.invalidate_tag(tag)
+    assert reader.get("portfolio:0xabc") is None
+    assert reader.tier_stats["l2_misses"] == 1
+
+def test_local_cache_bounded_by_entries_and_bytes():
+    local = LocalCache(max_entries=2, max_bytes=100)
+    local.set("a", 1, size=10, ttl=60)
+    local.set("b", 2, size=10, ttl=60)
+    local.get("a")
+    local.set("c", 3, size=10, ttl=60)
+    assert local.get("b") is None  # Least recently used goes first
+    
+    local.set("d", 4, size=95, ttl=60)
+    assert len(local) == 1 and local.size_bytes == 95
+    local.set("e", 5, size=101, ttl=60)
+    assert local.get("e") is None
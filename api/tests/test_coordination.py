@@ -0,0 +1,110 @@
+from api.workers.coordination import ShardLeases, RELEASE_LEASE_SCRIPT
+
+class FakeRedis:
+    """Just enough of the redis client API for ShardLeases; keys never expire on their own"""
+    def __init__(self):
+        self.values = {}
+        self.members = {}
+
+    def set(self, key, value, nx=False, px=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    def eval(self, script, numkeys, key, owner, *args):
+        if self.values.get(key) != owner:
+            return 0
+        if script == RELEASE_LEASE_SCRIPT:
+            del self.values[key]
+        return 1
+
+    def zrem(self, key, member):
+        self.members.pop(member, None)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def expire_owner(self, owner):
+        """Simulate a dead process: its leases and heartbeat time out"""
+        self.values = {k: v for k, v in self.values.items() if v != owner}
+        self.members.pop(owner, None)
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.results = []
+
+    def zadd(self, key, mapping):
+        self.client.members.update(mapping)
+
+    def zremrangebyscore(self, key, low, high):
+        for member in [m for m, at in self.client.members.items() if at <= high]:
+            del self.client.members[member]
+
+    def zcard(self, key):
+        self.results.append(len(self.client.members))
+
+    def execute(self):
+        return [None, None] + self.results
+
+def test_shards_are_split_evenly_and_never_shared():
+    client = FakeRedis()
+    a, b = ShardLeases(client, shards=16), ShardLeases(client, shards=16)
+
+    a.heartbeat()
+    assert len(a.owned) == 16  # Alone, it takes everything
+
+    b.heartbeat()  # Joins: fair share is 8, but a still holds every shard
+    a.heartbeat()  # a hands back its surplus
+    b.heartbeat()
+    assert len(a.owned) == len(b.owned) == 8
+    assert not a.owned & b.owned
+    assert all(a.owns(wallet_id) != b.owns(wallet_id) for wallet_id in range(100))
+    assert a.is_leader != b.is_leader
+
+def test_dead_process_shards_are_taken_over():
+    client = FakeRedis()
+    a, b = ShardLeases(client, shards=4), ShardLeases(client, shards=4)
+    for leases in (a, b, a, b):
+        leases.heartbeat()
+
+    client.expire_owner(a.owner)
+    b.heartbeat()
+    assert b.owned == {0, 1, 2, 3}
+
+def test_lost_lease_is_dropped_on_renewal():
+    client = FakeRedis()
+    a = ShardLeases(client, shards=2)
+    a.heartbeat()
+
+    client.values["monitor:shard:1"] = "someone-else"
+    a.heartbeat()
+    assert a.owned == {0}
+
+def test_release_all_frees_shards_for_others():
+    client = FakeRedis()
+    a, b = ShardLeases(client, shards=4), ShardLeases(client, shards=4)
+    a.heartbeat()
+    a.release_all()
+
+    assert a.owner not in client.members
+    b.heartbeat()
+    assert b.owned == {0, 1, 2, 3}
+
+def test_surplus_is_handed_back_only_after_the_cycle():
+    client = FakeRedis()
+    a, b = ShardLeases(client, shards=4), ShardLeases(client, shards=4)
+    a.heartbeat()
+
+    with a.holding():
+        b.heartbeat()
+        a.heartbeat()  # Over its fair share, but a cycle may still write these wallets
+        assert a.owned == {0, 1, 2, 3}
+        b.heartbeat()
+        assert not b.owned
+
+    assert len(a.owned) == 2
+    b.heartbeat()
+    assert len(b.owned) == 2
+    assert not a.owned & b.owned
@@ -0,0 +1,68 @@
+import pytest
+from datetime import date, datetime
+from api.analytics.gas import build_tracked_gas_spent
+from api.models import db, Transaction, Wallet
+from api.services.gas_enrichment import enrich_gas
+from unittest.mock import MagicMock
+
+ADDRESS = "0x" + "a1" * 20
+OTHER = "0x" + "b2" * 20
+
+@pytest.fixture
+def wallet(app):
+    wallet = Wallet(address=ADDRESS, balance='0')
+    db.session.add(wallet)
+    db.session.flush()
+    for i, (sender, block) in enumerate([(ADDRESS, 100), (ADDRESS, 200), ("0x" + ADDRESS[2:].upper(), 300), (OTHER, 400)]):
+        db.session.add(Transaction(
+            wallet_id=wallet.id, tx_hash=f"0x{i:064x}", block_number=block, timestamp=datetime(2024, 5, 1 + i, 12),
+            from_address=sender, to_address=OTHER, value='1.0', status=1
+        ))
+    db.session.commit()
+    return wallet
+
+def test_enrich_gas_backfills_outgoing_transactions(wallet):
+    service = MagicMock()
+    service.get_receipts.side_effect = lambda hashes: ({
+        hashes[0]: {'from': ADDRESS, 'gas_used': 21000, 'effective_gas_price': 10 ** 9, 'status': 1},
+        # Internal transfer out of the wallet inside someone else's transaction
+        hashes[1]: {'from': OTHER, 'gas_used': 50000, 'effective_gas_price': 10 ** 9, 'status': 0},
+    }, {hashes[2]: "timeout"})
+    
+    assert enrich_gas(service) == 2
+    requested = service.get_receipts.call_args[0][0]
+    assert len(requested) == 3  # Incoming transaction is skipped
+    
+    summary = build_tracked_gas_spent(wallet, 30, date(2024, 5, 1), from_block=0, current_block=500)
+    assert summary["total_transactions_sent"] == 2
+    assert summary["total_gas_used"] == 71000
+    assert summary["total_eth_spent"] == pytest.approx(21000 * 10 ** 9 / 1e18)
+    assert [day["date"] for day in summary["daily_breakdown"]] == ["2024-05-01", "2024-05-02"]
+    assert summary["pending_receipts"] == 1
+    
+    # Days before the period start are outside the range sum
+    later = build_tracked_gas_spent(wallet, 30, date(2024, 5, 2), from_block=0, current_block=500)
+    assert later["total_gas_used"] == 50000
+    assert db.session.get(Transaction, 2).status == 0
+    
+    # Only the failed receipt is retried
+    service.get_receipts.side_effect = lambda hashes: ({}, {})
+    enrich_gas(service)
+    assert service.get_receipts.call_args[0][0] == [requested[2]]
+
+def test_overlapping_passes_count_gas_once(wallet):
+    def receipts_after_other_pass(hashes):
+        # Another pass (block listener, sweep, other process) enriches the same rows meanwhile
+        db.session.execute(
+            Transaction.__table__.update().where(Transaction.id == 1).values(effective_gas_price='1', gas_used=1, gas_fee=1)
+        )
+        db.session.commit()
+        return {h: {'from': ADDRESS, 'gas_used': 21000, 'effective_gas_price': 10 ** 9, 'status': 1} for h in hashes}, {}
+    service = MagicMock()
+    service.get_receipts.side_effect = receipts_after_other_pass
+    
+    assert enrich_gas(service) == 2  # Rows 2 and 3; row 1 was claimed by the other pass
+    
+    summary = build_tracked_gas_spent(wallet, 30, date(2024, 5, 1), from_block=0, current_block=500)
+    assert summary["total_transactions_sent"] == 2
+    assert db.session.get(Transaction, 1).gas_used == 1
@@ -0,0 +1,48 @@
+import threading
+import pytest
+from types import SimpleNamespace
+from api.services.log_scanner import LogScanner, is_too_many_results
+
+class FakeEth:
+    """getLogs over one log per block, rejecting ranges wider than max_range"""
+    def __init__(self, max_range):
+        self.max_range = max_range
+        self.calls = []
+        self.lock = threading.Lock()
+    
+    def get_logs(self, params):
+        start, end = params["fromBlock"], params["toBlock"]
+        with self.lock:
+            self.calls.append((start, end))
+        if end - start + 1 > self.max_range:
+            raise ValueError({"code": -32005, "message": "query returned more than 10000 results"})
+        return [{"blockNumber": n, "logIndex": 0} for n in range(start, end + 1)]
+
+def test_scanner_bisects_oversized_chunks():
+    eth = FakeEth(max_range=300)
+    scanner = LogScanner(SimpleNamespace(eth=eth), chunk_size=1000, concurrency=4)
+    
+    logs = scanner.get_logs({"topics": []}, 100, 5099)
+    
+    assert [log["blockNumber"] for log in logs] == list(range(100, 5100))
+    assert any(end - start + 1 > 300 for start, end in eth.calls)
+
+def test_scanner_grows_chunk_after_success():
+    eth = FakeEth(max_range=10 ** 6)
+    scanner = LogScanner(SimpleNamespace(eth=eth), chunk_size=100, max_chunk=1600, concurrency=1)
+    
+    scanner.get_logs({"topics": []}, 0, 9999)
+    
+    sizes = [end - start + 1 for start, end in eth.calls]
+    assert sizes[:5] == [100, 200, 400, 800, 1600]
+    assert max(sizes) == 1600
+
+def test_scanner_raises_other_errors():
+    class BrokenEth:
+        def get_logs(self, params):
+            raise ValueError({"code": -32000, "message": "invalid topic"})
+    
+    scanner = LogScanner(SimpleNamespace(eth=BrokenEth()), chunk_size=100)
+    with pytest.raises(ValueError):
+        scanner.get_logs({"topics": []}, 0, 1000)
+    assert not is_too_many_results(ValueError({"code": -32000, "message": "invalid topic"}))
@@ -0,0 +1,87 @@
+from datetime import date, timedelta
+from api.models import db, DailyFlowRollup, TransferLog, TransferLogRange
+from api.services.log_store import INBOUND, TransferLogStore
+from api.services.rollups import flow_totals, increment_flow_rollups
+
+ADDRESS = "0x" + "ab" * 20
+
+class FakeScanner:
+    """One inbound transfer of 1 unit every 10 blocks"""
+    def __init__(self):
+        self.calls = []
+    
+    def get_logs(self, filter_params, from_block, to_block):
+        self.calls.append((from_block, to_block))
+        return [{
+            'address': '0x' + 'cd' * 20,
+            'blockNumber': block,
+            'logIndex': 0,
+            'transactionHash': '0x' + f"{block:064x}",
+            'data': '0x' + f"{1:064x}"
+        } for block in range(from_block, to_block + 1) if block % 10 == 0]
+
+class FakeBlockTimes:
+    """A new UTC day every 1000 blocks"""
+    def dates_for_blocks(self, block_numbers):
+        return {n: date(2024, 1, 1) + timedelta(days=n // 1000) for n in block_numbers}
+
+def test_log_store_fetches_only_uncovered_ranges(app):
+    scanner = FakeScanner()
+    store = TransferLogStore(scanner, FakeBlockTimes(), finality_depth=64)
+    
+    first = store.get_transfers(ADDRESS, INBOUND, 1000, 2000)
+    assert scanner.calls == [(1000, 1936), (1937, 2000)]
+    assert len(first) == 101
+    
+    # Wider window later: only the older gap and the new tail hit the node
+    scanner.calls.clear()
+    second = store.get_transfers(ADDRESS, INBOUND, 500, 2100)
+    assert scanner.calls == [(500, 999), (1937, 2036), (2037, 2100)]
+    assert [t['block_number'] for t in second] == list(range(500, 2101, 10))
+    
+    ranges = TransferLogRange.query.all()
+    assert [(r.from_block, r.to_block) for r in ranges] == [(500, 2036)]
+    assert TransferLog.query.count() == 154
+    
+    # Covered range: only the unfinalized tail is fetched live
+    scanner.calls.clear()
+    store.get_transfers(ADDRESS, INBOUND, 600, 2100)
+    assert scanner.calls == [(2037, 2100)]
+
+def test_flow_totals_sum_daily_rollups(app):
+    scanner = FakeScanner()
+    store = TransferLogStore(scanner, FakeBlockTimes(), finality_depth=64)
+    
+    totals = store.get_flow_totals(ADDRESS, INBOUND, date(2024, 1, 2), 1000, 3099)
+    assert totals == [{"token_address": "0x" + "cd" * 20, "transfer_count": 210, "total_raw": 210}]
+    # Blocks 1000-2999 map to two days, 3000-3035 to a third; the tail isn't stored
+    assert DailyFlowRollup.query.count() == 3
+    assert sum(r.transfer_count for r in DailyFlowRollup.query) == 204
+    
+    # A shorter period only sums the later days, without touching stored ranges
+    scanner.calls.clear()
+    totals = store.get_flow_totals(ADDRESS, INBOUND, date(2024, 1, 4), 3000, 3099)
+    assert totals[0]["transfer_count"] == 10
+    assert scanner.calls == [(3036, 3099)]
+
+def test_flow_totals_skip_blocks_stored_past_finality(app):
+    scanner = FakeScanner()
+    store = TransferLogStore(scanner, FakeBlockTimes(), finality_depth=64)
+    store.get_flow_totals(ADDRESS, INBOUND, date(2024, 1, 4), 3000, 3199)  # Stores up to 3135
+    
+    # A worker with a slightly older head: its unfinalized tail is partly stored already
+    scanner.calls.clear()
+    totals = store.get_flow_totals(ADDRESS, INBOUND, date(2024, 1, 4), 3000, 3150)
+    assert totals[0]["transfer_count"] == 16
+    assert scanner.calls == [(3136, 3150)]
+
+def test_flow_rollups_stay_exact_above_int64(app):
+    row = {'address': ADDRESS, 'day': date(2024, 1, 1), 'direction': INBOUND, 'token_address': '0x' + 'cd' * 20, 'transfer_count': 1}
+    increment_flow_rollups([{**row, 'total_raw': 1234567890123456789012345}])
+    db.session.commit()
+    increment_flow_rollups([{**row, 'total_raw': 1}])
+    increment_flow_rollups([{**row, 'day': date(2024, 1, 2), 'total_raw': 2 ** 255}])
+    db.session.commit()
+    
+    totals = flow_totals(ADDRESS, INBOUND, date(2024, 1, 1))
+    assert totals['0x' + 'cd' * 20] == {"token_address": '0x' + 'cd' * 20, "transfer_count": 3, "total_raw": 1234567890123456789012346 + 2 ** 255}
@@ -0,0 +1,197 @@
+import time
+import pytest
+from api.models.wallet import db, Wallet
+from api.models.transaction import Transaction
+from api.workers.monitor import WalletMonitor
+from unittest.mock import patch, MagicMock
+
+@pytest.fixture
+def wallets(app):
+    addresses = [f"0x{i:040x}" for i in range(1, 6)]
+    for address in addresses:
+        db.session.add(Wallet(address=address, balance='0'))
+    db.session.commit()
+    return addresses
+
+def make_monitor(service, **kwargs):
+    with patch('api.workers.monitor.Web3Service', return_value=service):
+        return WalletMonitor(**kwargs)
+
+def test_monitor_cycle_updates_all_wallets(wallets):
+    service = MagicMock()
+    service.get_balances.side_effect = lambda addresses, block: ({a: 1.5 for a in addresses}, {})
+    service.get_latest_block_number.return_value = 120
+    service.get_transfers.side_effect = lambda address, from_block, to_block, max_pages: ([{
+        'hash': f"0x{address[2:]}{'0' * 24}",
+        'block_number': 100,
+        'timestamp': None,
+        'from_address': address,
+        'to_address': '0x' + 'f' * 40,
+        'value': '1.0',
+        'gas_used': 0,
+        'gas_price': '0',
+        'status': 1
+    }], to_block)
+    
+    stats = make_monitor(service, concurrency=3).monitor_all_wallets()
+    
+    assert stats['updated'] == len(wallets)
+    assert stats['failed'] == 0 and stats['timed_out'] == 0
+    assert 'duration_seconds' in stats
+    assert all(w.balance == '1.5' and w.last_monitored for w in Wallet.query.all())
+    assert all(w.last_synced_block == 120 - 64 for w in Wallet.query.all())  # Confirmations behind the head
+    assert Transaction.query.count() == len(wallets)
+
+def test_monitor_cycle_respects_deadline(wallets):
+    service = MagicMock()
+    service.get_latest_block_number.return_value = 100
+    service.get_balances.side_effect = lambda addresses, block: ({a: 2.0 for a in addresses}, {})
+    
+    def slow_transfers(address, from_block, to_block, max_pages):
+        if address == wallets[0]:
+            time.sleep(1)
+        return [], to_block
+    service.get_transfers.side_effect = slow_transfers
+    
+    stats = make_monitor(service, concurrency=5, cycle_deadline=0.3).monitor_all_wallets()
+    
+    assert stats['timed_out'] == 1
+    assert stats['updated'] == len(wallets) - 1
+    assert Wallet.query.filter_by(address=wallets[0]).first().balance == '0'
+
+def test_monitor_keeps_balance_when_batch_item_fails(wallets):
+    service = MagicMock()
+    service.get_latest_block_number.return_value = 100
+    service.get_transfers.return_value = ([], 100)
+    service.get_balances.side_effect = lambda addresses, block: (
+        {a: 3.0 for a in addresses[1:]}, {addresses[0]: 'header not found'}
+    )
+    
+    stats = make_monitor(service).monitor_all_wallets()
+    
+    assert stats['updated'] == len(wallets)
+    assert Wallet.query.filter_by(address=wallets[0]).first().balance == '0'
+    assert Wallet.query.filter_by(address=wallets[1]).first().balance == '3.0'
+
+def test_monitor_resumes_from_sync_cursor(wallets):
+    service = MagicMock()
+    service.get_latest_block_number.return_value = 500
+    service.get_balances.side_effect = lambda addresses, block: ({}, {})
+    # Backfill cut short by the page budget: only synced through block 300
+    service.get_transfers.return_value = ([], 300)
+    monitor = make_monitor(service, max_pages=2, confirmations=0)
+    
+    monitor.monitor_all_wallets()
+    service.get_transfers.assert_any_call(wallets[0], 0, 500, max_pages=2)
+    
+    service.get_transfers.reset_mock()
+    service.get_transfers.return_value = ([], 500)
+    monitor.monitor_all_wallets()
+    service.get_transfers.assert_any_call(wallets[0], 301, 500, max_pages=2)
+    assert Wallet.query.filter_by(address=wallets[0]).first().last_synced_block == 500
+
+def test_cursor_trails_head_so_recent_blocks_are_reread(wallets):
+    service = MagicMock()
+    service.get_latest_block_number.return_value = 500
+    service.get_balances.side_effect = lambda addresses, block: ({}, {})
+    service.get_transfers.side_effect = lambda address, from_block, to_block, max_pages: ([], to_block)
+    monitor = make_monitor(service, confirmations=10)
+    
+    monitor.refresh_wallets(wallets[:1], 500)
+    assert Wallet.query.filter_by(address=wallets[0]).first().last_synced_block == 490
+    
+    # Next head: blocks 491-500 may have been reorged or not indexed yet, so they are read again
+    monitor.refresh_wallets(wallets[:1], 501)
+    service.get_transfers.assert_called_with(wallets[0], 491, 501, max_pages=10)
+    
+    # Re-read transfers that are already stored are not a change
+    service.get_transfers.side_effect = lambda address, from_block, to_block, max_pages: ([make_tx(495)], to_block)
+    wallet = Wallet.query.filter_by(address=wallets[0]).first()
+    assert monitor.apply_wallet_data(wallet, monitor.fetch_wallet_data(wallet.address, wallet.last_synced_block, 502))
+    assert not monitor.apply_wallet_data(wallet, monitor.fetch_wallet_data(wallet.address, wallet.last_synced_block, 503))
+
+def make_tx(n, address='0x' + '1' * 40):
+    return {
+        'hash': f"0x{n:064x}",
+        'block_number': n,
+        'timestamp': None,
+        'from_address': address,
+        'to_address': '0x' + 'f' * 40,
+        'value': '1.0',
+        'gas_used': 0,
+        'gas_price': '0',
+        'status': 1
+    }
+
+def test_bulk_insert_skips_existing_hashes(wallets):
+    from api.services.transaction_store import bulk_insert_transactions, _lookup_insert, _to_rows
+    
+    wallet = Wallet.query.first()
+    assert len(bulk_insert_transactions(wallet.id, [make_tx(1), make_tx(2)])) == 2
+    db.session.commit()
+    
+    inserted = bulk_insert_transactions(wallet.id, [make_tx(2), make_tx(3), make_tx(3)])
+    assert inserted == [make_tx(3)['hash']]
+    
+    # Portable path used on databases without ON CONFLICT
+    assert _lookup_insert(_to_rows(wallet.id, [make_tx(1), make_tx(4)])) == [make_tx(4)['hash']]
+    db.session.commit()
+    assert Transaction.query.count() == 4
+
+def test_refresh_wallets_only_touches_given_wallets(wallets):
+    service = MagicMock()
+    service.get_transfers.return_value = ([], 200)
+    service.get_balances.side_effect = lambda addresses, block: ({a: 4.0 for a in addresses}, {})
+    
+    stats = make_monitor(service).refresh_wallets(wallets[:2], 200)
+    
+    assert stats['wallets'] == 2 and stats['updated'] == 2
+    service.get_latest_block_number.assert_not_called()
+    assert [w.address for w in Wallet.query.filter_by(balance='4.0')] == wallets[:2]
+
+def test_monitor_due_wallets_backs_off_idle_wallets(wallets):
+    from api.workers.poll_schedule import PollSchedule
+    
+    service = MagicMock()
+    service.get_latest_block_number.return_value = 300
+    service.get_transfers.side_effect = lambda address, from_block, to_block, max_pages: (
+        [make_tx(300, address)] if address == wallets[0] else [], to_block
+    )
+    service.get_balances.side_effect = lambda addresses, block: ({a: 0.0 for a in addresses}, {})
+    monitor = make_monitor(service)
+    schedule = PollSchedule(min_interval=60, max_interval=3600, alert_interval=60)
+    
+    stats = monitor.monitor_due_wallets(schedule)
+    
+    assert stats['wallets'] == len(wallets)
+    assert schedule.interval(wallets[0]) == 60
+    assert all(schedule.interval(address) == 120 for address in wallets[1:])
+    assert monitor.monitor_due_wallets(schedule) is None  # Nothing due yet
+
+def test_sharded_monitor_only_checks_its_own_wallets(wallets):
+    service = MagicMock()
+    service.get_latest_block_number.return_value = 100
+    service.get_transfers.return_value = ([], 100)
+    service.get_balances.side_effect = lambda addresses, block: ({a: 5.0 for a in addresses}, {})
+    leases = MagicMock(shards=2, owned={1}, is_leader=False)
+    
+    with patch('api.workers.monitor.enrich_gas') as enrich_gas:
+        stats = make_monitor(service, leases=leases).monitor_all_wallets()
+    
+    assert stats['wallets'] == 3  # Ids 1, 3 and 5
+    assert all((w.balance == '5.0') == (w.id % 2 == 1) for w in Wallet.query.all())
+    enrich_gas.assert_not_called()  # Gas backfill is left to the leader
+
+def test_wallet_whose_lease_lapsed_mid_cycle_is_not_written(wallets):
+    service = MagicMock()
+    service.get_latest_block_number.return_value = 100
+    service.get_transfers.return_value = ([], 100)
+    service.get_balances.side_effect = lambda addresses, block: ({a: 5.0 for a in addresses}, {})
+    leases = MagicMock(shards=2, owned={1}, is_leader=False)
+    leases.owns.return_value = False  # Expired while the data was being fetched
+    
+    stats = make_monitor(service, leases=leases).monitor_all_wallets()
+    
+    assert stats['failed'] == 3
+    assert all(w.balance != '5.0' for w in Wallet.query.all())
+    leases.holding.assert_called_once()
@@ -0,0 +1,57 @@
+from api.workers.poll_schedule import PollSchedule
+
+def make_schedule():
+    return PollSchedule(min_interval=60, max_interval=480, alert_interval=120)
+
+def test_idle_wallets_back_off_and_active_ones_reset():
+    schedule = make_schedule()
+    schedule.sync(['cold'], now=0)
+    assert schedule.pop_due(now=0) == ['cold']
+
+    now = 0
+    for _ in range(5):
+        schedule.record('cold', changed=False, now=now)
+        now += schedule.interval('cold')
+    assert schedule.interval('cold') == 480
+
+    schedule.record('cold', changed=True, now=now)
+    assert schedule.interval('cold') == 60
+
+def test_only_due_wallets_are_popped_most_overdue_first():
+    schedule = make_schedule()
+    schedule.sync(['a', 'b', 'c'], now=0)
+    schedule.pop_due(now=0)
+    schedule.record('a', changed=False, now=0)   # Due at 120
+    schedule.record('b', changed=True, now=0)    # Due at 60
+    schedule.record('c', changed=False, now=30)  # Due at 150
+
+    assert schedule.pop_due(now=59) == []
+    assert schedule.pop_due(now=130) == ['b', 'a']
+    assert schedule.pop_due(now=130) == []  # Popped wallets wait for record()/retry()
+
+    schedule.retry('b', now=130)  # Failed: keeps its 60s interval instead of being due right away
+    assert schedule.pop_due(now=189) == ['c']
+    assert schedule.pop_due(now=190) == ['b']
+    assert schedule.interval('b') == 60
+
+def test_alerted_wallets_are_capped_and_pulled_in():
+    schedule = make_schedule()
+    schedule.sync(['a', 'b'], now=0)
+    schedule.pop_due(now=0)
+    for _ in range(4):
+        schedule.record('a', changed=False, now=0)
+        schedule.record('b', changed=False, now=0)
+    assert schedule.interval('a') == 480
+
+    schedule.sync(['a', 'b'], alerted={'a'}, now=0)
+    assert schedule.pop_due(now=120) == ['a']
+    schedule.record('a', changed=False, now=120)
+    assert schedule.interval('a') == 120
+
+def test_sync_adds_new_and_drops_removed_wallets():
+    schedule = make_schedule()
+    schedule.sync(['a', 'b'], now=0)
+    schedule.sync(['b', 'c'], now=10)
+
+    assert len(schedule) == 2
+    assert schedule.pop_due(now=10) == ['b', 'c']
@@ -0,0 +1,51 @@
+import pytest
+from eth_abi import decode, encode
+from web3 import Web3
+from web3.providers import BaseProvider
+from unittest.mock import patch
+from api.analytics import portfolio
+from api.services.multicall import Multicall, ETH, GET_ETH_BALANCE_SELECTOR
+
+OWNER = "0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045"
+USDC = "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48"
+DAI = "0x6B175474E89094C44Da98b954EedeAC495271d0F"
+
+class FakeMulticallNode(BaseProvider):
+    """Answers aggregate3 eth_calls from {(ETH or token, owner): balance}; missing entries revert"""
+    def __init__(self, balances):
+        self.balances = balances
+        self.calls = []
+    
+    def make_request(self, method, params):
+        if method == 'eth_chainId':
+            return {'jsonrpc': '2.0', 'id': 1, 'result': '0x1'}
+        data = bytes.fromhex(params[0]['data'][2:])
+        self.calls.append(params)
+        (calls,) = decode(['(address,bool,bytes)[]'], data[4:])
+        results = []
+        for target, allow_failure, calldata in calls:
+            assert allow_failure
+            owner = Web3.to_checksum_address(decode(['address'], calldata[4:])[0])
+            key = ETH if calldata[:4] == GET_ETH_BALANCE_SELECTOR else Web3.to_checksum_address(target)
+            balance = self.balances.get((key, owner))
+            results.append((True, encode(['uint256'], [balance])) if balance is not None else (False, b''))
+        return {'jsonrpc': '2.0', 'id': 1, 'result': '0x' + encode(['(bool,bytes)[]'], [results]).hex()}
+
+def test_multicall_reads_balances_pinned_to_one_block():
+    node = FakeMulticallNode({(ETH, OWNER): 2 * 10 ** 18, (USDC, OWNER): 5 * 10 ** 6})
+    multicall = Multicall(Web3(node), batch_size=2)
+    
+    block_number, balances = multicall.get_balances([OWNER], [USDC, DAI], block_identifier=100)
+    assert block_number == 100
+    assert balances[OWNER] == {ETH: 2 * 10 ** 18, USDC: 5 * 10 ** 6, DAI: None}
+    assert len(node.calls) == 2
+    assert all(params[1] == hex(100) for params in node.calls)
+
+def test_failed_eth_balance_is_not_reported_as_zero():
+    tokens = [token for token, _ in portfolio.KNOWN_TOKENS.values()]
+    balances = {OWNER: {ETH: None, **{token: 0 for token in tokens}}}
+    prices = {token.lower(): 1.0 for token in tokens}
+    with patch.object(portfolio.multicall, 'get_balances', return_value=(100, balances)), \
+            patch.object(portfolio.price_oracle, 'get_prices', return_value=prices):
+        with pytest.raises(RuntimeError):
+            portfolio.build_portfolio(OWNER)
@@ -0,0 +1,95 @@
+import threading
+import time
+from api.services.price_oracle import PriceOracle, SHARED_KEY
+
+USDC = "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48"
+DAI = "0x6B175474E89094C44Da98b954EedeAC495271d0F"
+
+class FakeRedis:
+    def __init__(self):
+        self.hashes = {}
+
+    def hmget(self, key, fields):
+        return [self.hashes.get(key, {}).get(f) for f in fields]
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(mapping)
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+class FakeCoinGecko:
+    """simple/token_price stand-in; records the addresses of every request"""
+    def __init__(self, prices):
+        self.prices = prices
+        self.requests = []
+        self.fetched = threading.Event()
+
+    def get(self, url, params=None, timeout=None):
+        tokens = params["contract_addresses"].split(",")
+        self.requests.append(tokens)
+        self.fetched.set()
+        return FakeResponse({t: {"usd": self.prices[t]} for t in tokens if t in self.prices})
+
+def make_oracle(session, client=None, **kwargs):
+    return PriceOracle(session=session, client=client if client is not None else FakeRedis(), **kwargs)
+
+def test_all_tokens_fetched_in_one_request_then_served_from_cache():
+    session = FakeCoinGecko({USDC.lower(): 1.0, DAI.lower(): 0.999})
+    oracle = make_oracle(session)
+
+    assert oracle.get_prices([USDC, DAI]) == {USDC.lower(): 1.0, DAI.lower(): 0.999}
+    assert session.requests == [[USDC.lower(), DAI.lower()]]
+
+    oracle.get_prices([USDC, DAI])
+    assert len(session.requests) == 1
+
+def test_unpriced_token_is_not_refetched_on_every_read():
+    session = FakeCoinGecko({})
+    oracle = make_oracle(session)
+
+    assert oracle.get_prices([USDC]) == {USDC.lower(): None}
+    oracle.get_prices([USDC])
+    assert len(session.requests) == 1
+
+def test_expired_price_is_served_while_refreshing_in_background():
+    session = FakeCoinGecko({USDC.lower(): 1.01})
+    oracle = make_oracle(session, ttl=60)
+    oracle._prices[USDC.lower()] = (1.0, time.time() - 120)
+
+    assert oracle.get_prices([USDC]) == {USDC.lower(): 1.0}
+    assert session.fetched.wait(timeout=2)
+    deadline = time.time() + 2
+    while oracle._refreshing and time.time() < deadline:
+        time.sleep(0.01)
+    assert oracle.get_prices([USDC]) == {USDC.lower(): 1.01}
+
+def test_refresh_hot_only_fetches_recently_read_tokens_near_expiry():
+    session = FakeCoinGecko({USDC.lower(): 1.0, DAI.lower(): 1.0})
+    oracle = make_oracle(session, ttl=60, refresh_ahead=15, hot_seconds=600)
+    oracle.get_prices([USDC, DAI])
+    session.requests.clear()
+
+    assert oracle.refresh_hot() == 0
+
+    oracle._prices[USDC.lower()] = (1.0, time.time() - 50)  # Expires in 10s
+    oracle._last_read[DAI.lower()] = time.time() - 3600     # No longer hot
+    assert oracle.refresh_hot() == 1
+    assert session.requests == [[USDC.lower()]]
+
+def test_prices_are_shared_between_processes():
+    client = FakeRedis()
+    session = FakeCoinGecko({USDC.lower(): 1.0})
+    make_oracle(session, client).get_prices([USDC])
+
+    other = make_oracle(session, client)
+    assert other.get_prices([USDC]) == {USDC.lower(): 1.0}
+    assert len(session.requests) == 1
+    assert USDC.lower() in client.hashes[SHARED_KEY]
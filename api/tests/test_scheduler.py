@@ -0,0 +1,55 @@
+import pytest
+from api.app import create_app
+from api.workers.scheduler import start_scheduler
+from unittest.mock import patch
+
+@pytest.fixture
+def app(app):
+    app.config['MONITOR_ADAPTIVE'] = False
+    return app
+
+def job_ids(scheduler):
+    try:
+        return sorted(job.id for job in scheduler.get_jobs())
+    finally:
+        scheduler.shutdown(wait=False)
+
+def test_web_process_without_monitoring_keeps_price_refresh(app):
+    with patch('api.workers.scheduler.WalletMonitor') as monitor:
+        assert job_ids(start_scheduler(app, monitoring=False)) == ['price_refresh']
+    monitor.assert_not_called()
+
+def test_monitor_worker_runs_only_monitoring(app):
+    with patch('api.workers.scheduler.WalletMonitor'):
+        assert job_ids(start_scheduler(app, price_refresh=False)) == ['wallet_monitor']
+
+def test_worker_cli_overrides():
+    from api.workers.__main__ import parse_args
+    
+    args = parse_args(['--mode', 'blocks', '--concurrency', '64'])
+    assert args.mode == 'blocks' and args.concurrency == 64
+
+def test_price_refresh_survives_requests():
+    from api.config import TestingConfig
+    
+    # A web app with its scheduler running, but no monitor (no node here)
+    with patch.object(TestingConfig, 'TESTING', False), patch.object(TestingConfig, 'MONITOR_ENABLED', False):
+        app = create_app('testing')
+    scheduler = app.extensions['scheduler']
+    try:
+        client = app.test_client()
+        client.get('/health')
+        client.get('/health')
+        
+        assert scheduler.running
+        assert [job.id for job in scheduler.get_jobs()] == ['price_refresh']
+    finally:
+        scheduler.shutdown(wait=False)
+
+def test_worker_app_starts_no_web_scheduler():
+    from api.config import TestingConfig
+    
+    with patch.object(TestingConfig, 'TESTING', False), patch('api.app.start_scheduler') as start:
+        app = create_app('testing', with_scheduler=False)
+    start.assert_not_called()
+    assert 'scheduler' not in app.extensions
@@ -42,14 +42,14 @@ def test_register_wallet(mock_web3_service_class, mock_is_address, client, api_k
     
     # Create a mock instance
     mock_service_instance = MagicMock()
-    mock_service_instance.get_balance.return_value = 1000000000000000000  # 1 ETH
+    mock_service_instance.get_balances.side_effect = lambda addresses: ({a: 1.0 for a in addresses}, {})  # 1 ETH
     
     # Make the class constructor return our mock instance
     mock_web3_service_class.return_value = mock_service_instance
     
     # Use the Ethereum address from the test
     response = client.post('/api/v1/wallets', json={
-        'address': '0x742d35Cc6634C0532925a3b844Bc9e7595f0bEb',
+        'address': '0x742D35CC6634c0532925A3b844BC9E7595F0BEb0',
         'label': 'Test Wallet'
     }, headers={'X-API-Key': api_key})
     
@@ -70,3 +70,110 @@ def test_register_invalid_address(mock_web3_service_class, client, api_key):
     assert response.status_code == 400
     assert 'Invalid Ethereum address' in response.json['error']
 
+
+def test_api_key_cached_until_invalidated(app, client, api_key):
+    from api.middleware.auth import get_api_key_auth
+    
+    response = client.get('/api/v1/wallets', headers={'X-API-Key': api_key})
+    assert response.status_code == 200
+    assert ApiKey.query.filter_by(key=api_key).first().last_used_at is not None
+    
+    # Revoked keys keep working from cache until their entry expires
+    ApiKey.query.filter_by(key=api_key).first().is_active = False
+    db.session.commit()
+    assert client.get('/api/v1/wallets', headers={'X-API-Key': api_key}).status_code == 200
+    
+    get_api_key_auth()['cache'].invalidate(api_key)
+    assert client.get('/api/v1/wallets', headers={'X-API-Key': api_key}).status_code == 401
+
+def test_api_key_usage_flushed_in_batches(app, api_key):
+    from api.middleware.auth import UsageRecorder
+    
+    key = ApiKey.query.filter_by(key=api_key).first()
+    recorder = UsageRecorder(app, flush_interval=3600)
+    recorder._ensure_started = lambda: None  # flush by hand
+    recorder.record(key.id)
+    recorder.record(key.id)
+    assert db.session.get(ApiKey, key.id).last_used_at is None
+    
+    recorder.flush()
+    db.session.expire_all()
+    assert db.session.get(ApiKey, key.id).last_used_at is not None
+
+def test_api_key_usage_flush_registered_at_exit_once(app):
+    from api.middleware.auth import UsageRecorder
+    
+    recorder = UsageRecorder(app, flush_interval=3600)
+    recorder._run = lambda: None  # Thread exits at once, so every record() restarts it
+    with patch('api.middleware.auth.atexit.register') as register:
+        for key_id in range(3):
+            recorder.record(key_id)
+            recorder._thread.join()
+    
+    register.assert_called_once_with(recorder.flush)
+
+def test_wallet_transactions_keyset_pagination(app, client, api_key):
+    from datetime import datetime, timedelta
+    from api.models.transaction import Transaction
+    
+    address = '0x' + 'a' * 40
+    wallet = Wallet(address=address)
+    db.session.add(wallet)
+    db.session.flush()
+    start = datetime(2024, 1, 1)
+    for i in range(5):
+        # Two rows share each timestamp so the id tie-breaker matters
+        db.session.add(Transaction(
+            wallet_id=wallet.id, tx_hash=f"0x{i:064x}", block_number=100 + i,
+            timestamp=start + timedelta(hours=i // 2), value='1.0', status=1
+        ))
+    db.session.commit()
+    
+    headers = {'X-API-Key': api_key}
+    seen = []
+    cursor = None
+    while True:
+        url = f'/api/v1/wallets/{address}/transactions?limit=2&fields=tx_hash,block_number'
+        if cursor:
+            url += f'&cursor={cursor}'
+        body = client.get(url, headers=headers).json
+        seen.extend(tx['block_number'] for tx in body['transactions'])
+        assert all(set(tx) == {'tx_hash', 'block_number'} for tx in body['transactions'])
+        cursor = body['next_cursor']
+        if not cursor:
+            break
+    
+    assert seen == [104, 103, 102, 101, 100]
+    
+    body = client.get(f'/api/v1/wallets/{address}/transactions?from_block=101&to_block=102', headers=headers).json
+    assert [tx['block_number'] for tx in body['transactions']] == [102, 101]
+    
+    response = client.get(f'/api/v1/wallets/{address}/transactions?fields=nope', headers=headers)
+    assert response.status_code == 400
+
+def test_export_wallet_transactions_streams_ndjson_and_gzip_csv(app, client, api_key):
+    import csv
+    import gzip
+    import io
+    import json
+    from api.models.transaction import Transaction
+    
+    address = '0x' + 'b' * 40
+    wallet = Wallet(address=address)
+    db.session.add(wallet)
+    db.session.flush()
+    for i in range(3):
+        db.session.add(Transaction(wallet_id=wallet.id, tx_hash=f"0x{i:064x}", block_number=i, value='1.0', status=1))
+    db.session.commit()
+    headers = {'X-API-Key': api_key}
+    
+    response = client.get(f'/api/v1/wallets/{address}/transactions/export?fields=tx_hash,block_number', headers=headers)
+    assert response.status_code == 200
+    assert response.is_streamed
+    rows = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert sorted(row['block_number'] for row in rows) == [0, 1, 2]
+    
+    response = client.get(f'/api/v1/wallets/{address}/transactions/export?format=csv&gzip=true', headers=headers)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    reader = csv.DictReader(io.StringIO(gzip.decompress(response.data).decode()))
+    assert len(list(reader)) == 3
@@ -0,0 +1,85 @@
+from api.services.provider import RPC_TIMEOUT, get_web3
+from api.services.web3_service import Web3Service
+from unittest.mock import patch, MagicMock
+
+def test_batch_request_maps_per_item_errors():
+    service = Web3Service.__new__(Web3Service)
+    service.alchemy_url = 'http://localhost:8545'
+    service.batch_size = 2
+    
+    def fake_post(url, json, headers, timeout):
+        response = MagicMock(status_code=200)
+        response.json.return_value = [
+            {'jsonrpc': '2.0', 'id': item['id'], 'error': {'code': -32000, 'message': 'boom'}}
+            if item['params'][0] == 'bad' else
+            {'jsonrpc': '2.0', 'id': item['id'], 'result': '0x1'}
+            for item in reversed(json)
+        ]
+        return response
+    
+    service.session = MagicMock()
+    service.session.post.side_effect = fake_post
+    results = service.batch_request([('eth_getBalance', [a, 'latest']) for a in ['a', 'bad', 'c']])
+    
+    assert service.session.post.call_count == 2
+    assert results[0] == ('0x1', None) and results[2] == ('0x1', None)
+    assert results[1][0] is None and results[1][1].code == -32000
+
+def test_shared_web3_posts_through_pooled_session():
+    w3 = get_web3('http://node.test')
+    assert get_web3('http://node.test') is w3
+    
+    session = MagicMock()
+    session.post.return_value.content = b'{"jsonrpc": "2.0", "id": 0, "result": "0x10"}'
+    with patch('api.services.provider.get_session', return_value=session):
+        assert w3.eth.block_number == 16
+    
+    url = session.post.call_args.args[0]
+    assert url == 'http://node.test'
+    assert session.post.call_args.kwargs['timeout'] == RPC_TIMEOUT
+
+def make_service(responses):
+    """Service whose node answers each batch POST with the next (status, body)"""
+    service = Web3Service.__new__(Web3Service)
+    service.alchemy_url = 'http://localhost:8545'
+    service.batch_size = 4
+    service.session = MagicMock()
+    
+    def fake_post(url, json, headers, timeout):
+        status, body = responses(json)
+        response = MagicMock(status_code=status)
+        response.json.return_value = body
+        return response
+    
+    service.session.post.side_effect = fake_post
+    return service
+
+def test_batch_split_only_when_too_large():
+    def node(batch):
+        if len(batch) > 1:
+            return 200, {'jsonrpc': '2.0', 'id': None, 'error': {'code': -32600, 'message': 'Batch size too large'}}
+        return 200, [{'jsonrpc': '2.0', 'id': batch[0]['id'], 'result': '0x1'}]
+    
+    service = make_service(node)
+    results = service.batch_request([('eth_blockNumber', [])] * 4)
+    assert results == [('0x1', None)] * 4
+    assert service.session.post.call_count == 7  # 4, 2, 1, 1, 2, 1, 1
+
+def test_rate_limited_batch_fails_without_splitting():
+    service = make_service(lambda batch: (429, {'error': {'code': 429, 'message': 'Too many requests'}}))
+    results = service.batch_request([('eth_blockNumber', [])] * 4)
+    
+    assert service.session.post.call_count == 1
+    assert all(result is None and error.code == 429 for result, error in results)
+
+def test_asset_transfers_page_past_budget_inside_first_block():
+    # Three pages of block 100, then block 101
+    pages = [['0x64'], ['0x64'], ['0x64'], ['0x65'], ['0x66']]
+    service = make_service(lambda request: (200, {'result': {
+        'transfers': [{'blockNum': block} for block in pages.pop(0)],
+        'pageKey': 'next' if pages else None
+    }}))
+    
+    transfers, synced_through = service._get_asset_transfers({'fromAddress': '0xabc'}, 100, 200, max_pages=2)
+    assert len(transfers) == 4
+    assert synced_through == 100
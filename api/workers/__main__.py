@@ -0,0 +1,54 @@
+"""
+Standalone wallet monitor: python -m api.workers [--mode poll|blocks] [--concurrency N]
+
+Runs the monitoring jobs the web app would otherwise start in-process,
+against the same config, models and services. Start the web app with
+MONITOR_ENABLED=false next to it so wallets aren't monitored twice.
+"""
+import argparse
+import logging
+import os
+import signal
+import threading
+from api.app import create_app
+from api.models import db
+from api.workers.scheduler import start_scheduler
+
+logger = logging.getLogger(__name__)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m api.workers', description='Run wallet monitoring outside the web process')
+    parser.add_argument('--mode', choices=('poll', 'blocks'), help='Overrides MONITOR_MODE')
+    parser.add_argument('--concurrency', type=int, help='Overrides MONITOR_CONCURRENCY')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    # setup_logging() only wires up app.logger; the monitor logs through module loggers
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    
+    # Same config, models and services as the web app, without its scheduler
+    app = create_app(os.environ.get('FLASK_ENV', 'development'), with_scheduler=False)
+    if args.mode:
+        app.config['MONITOR_MODE'] = args.mode
+    if args.concurrency:
+        app.config['MONITOR_CONCURRENCY'] = args.concurrency
+
+    # The worker may start before the web app has ever served a request
+    with app.app_context():
+        db.create_all()
+
+    stopping = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stopping.set())
+
+    # Price refresh follows what portfolio requests read, so it stays in the web app
+    scheduler = start_scheduler(app, price_refresh=False)
+    logger.info("Monitor worker running")
+
+    stopping.wait()
+    logger.info("Monitor worker stopping - letting the running cycle finish")
+    scheduler.shutdown(wait=True)
+
+if __name__ == '__main__':
+    main()
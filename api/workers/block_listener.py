@@ -0,0 +1,147 @@
+import json
+import logging
+import threading
+import time
+from websockets.sync.client import connect
+from api.services.address_index import tracked_addresses
+from api.services.log_store import TRANSFER_TOPIC
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ADDRESS_REFRESH_SECONDS = 30
+DEFAULT_MAX_CATCHUP_BLOCKS = 32
+DEFAULT_IDLE_TIMEOUT_SECONDS = 60  # No new head for this long means the subscription is dead
+MAX_RECONNECT_DELAY_SECONDS = 60
+
+class BlockListener:
+    """
+    Event-driven wallet monitoring: subscribes to newHeads over a WebSocket
+    and, for each new block, refreshes only the tracked wallets the block
+    touched.
+
+    A wallet counts as touched when it is the sender or recipient of one of
+    the block's transactions, or appears as `from`/`to` in one of its
+    Transfer logs. The block and its logs are read over HTTP in a single
+    JSON-RPC batch; the WebSocket only carries headers.
+
+    Internal ETH transfers (value moved by a contract call) don't show up in
+    either, and blocks beyond max_catchup_blocks after a reconnect are
+    skipped - the scheduler's slower reconciliation sweep picks those up.
+    """
+
+    def __init__(self, app, monitor, ws_uri, address_refresh_seconds=DEFAULT_ADDRESS_REFRESH_SECONDS,
+                 max_catchup_blocks=DEFAULT_MAX_CATCHUP_BLOCKS, idle_timeout=DEFAULT_IDLE_TIMEOUT_SECONDS,
+                 index=tracked_addresses):
+        self.app = app
+        self.monitor = monitor
+        self.ws_uri = ws_uri
+        self.index = index
+        self.address_refresh_seconds = address_refresh_seconds
+        self.max_catchup_blocks = max(1, max_catchup_blocks)
+        self.idle_timeout = idle_timeout
+        self.last_block = None
+        self.subscribed = False
+        self._reloaded_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='block-listener', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        """Listen until stopped, reconnecting with exponential backoff"""
+        delay = 1
+        while not self._stop.is_set():
+            self.subscribed = False
+            try:
+                self.listen()
+            except Exception as e:
+                if self.subscribed:
+                    delay = 1
+                logger.warning(f"newHeads subscription lost: {e} - reconnecting in {delay}s")
+                self._stop.wait(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY_SECONDS)
+
+    def listen(self):
+        with connect(self.ws_uri, open_timeout=10, close_timeout=5) as ws:
+            ws.send(json.dumps({"jsonrpc": "2.0", "id": 1, "method": "eth_subscribe", "params": ["newHeads"]}))
+            reply = json.loads(ws.recv(timeout=self.idle_timeout))
+            if reply.get('error'):
+                raise ConnectionError(f"eth_subscribe failed: {reply['error']}")
+            self.subscribed = True
+            logger.info(f"Subscribed to newHeads on {self.ws_uri.split('/v2/')[0]}")
+
+            while not self._stop.is_set():
+                message = json.loads(ws.recv(timeout=self.idle_timeout))
+                if message.get('method') != 'eth_subscription':
+                    continue
+                try:
+                    self.handle_head(message['params']['result'])
+                except Exception as e:
+                    # last_block stays put, so the next head retries these blocks
+                    logger.error(f"Error processing new head: {e}")
+
+    def handle_head(self, header):
+        """Refresh the wallets touched since the last processed block, up to this head"""
+        head = int(header['number'], 16)
+        if self.last_block is None or head <= self.last_block:
+            # First head, or a reorg back to an already processed height
+            first = head
+        else:
+            first = max(self.last_block + 1, head - self.max_catchup_blocks + 1)
+            if first > self.last_block + 1:
+                logger.warning(
+                    f"Skipped blocks {self.last_block + 1}-{first - 1} after a gap; "
+                    f"the reconciliation sweep will cover them"
+                )
+
+        with self.app.app_context():
+            self.reload_index()
+            touched = self.index.match(self.touched_addresses(first, head))
+            if touched:
+                stats = self.monitor.refresh_wallets(sorted(touched), head)
+                logger.info(f"Block {head}: refreshed {stats['updated']}/{len(touched)} touched wallets")
+
+        self.last_block = head
+        return touched
+
+    def reload_index(self):
+        """
+        Rebuild the tracked-address index from the DB every
+        address_refresh_seconds. Registrations in this process reach the
+        index on commit; this picks up the ones made by other processes.
+        """
+        if self._reloaded_at is None or time.monotonic() - self._reloaded_at > self.address_refresh_seconds:
+            self.index.reload()
+            self._reloaded_at = time.monotonic()
+
+    def touched_addresses(self, first, last):
+        """Addresses sending or receiving anything in blocks first..last"""
+        service = self.monitor.web3_service
+        calls = [('eth_getBlockByNumber', [hex(number), True]) for number in range(first, last + 1)]
+        calls.append(('eth_getLogs', [{'fromBlock': hex(first), 'toBlock': hex(last), 'topics': [TRANSFER_TOPIC]}]))
+
+        results = service.batch_request(calls)
+        for result, error in results:
+            if error is not None:
+                raise error
+
+        addresses = set()
+        for block, _ in results[:-1]:
+            for tx in (block or {}).get('transactions', []):
+                addresses.add(tx['from'])
+                if tx.get('to'):
+                    addresses.add(tx['to'])
+
+        logs, _ = results[-1]
+        for log in logs:
+            # ERC-20 and ERC-721 both index from/to as topics 1 and 2
+            if len(log['topics']) >= 3:
+                addresses.add(log['topics'][1][-40:])
+                addresses.add(log['topics'][2][-40:])
+        return addresses
@@ -0,0 +1,168 @@
+import logging
+import math
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+import redis
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARDS = 16
+DEFAULT_LEASE_TTL_SECONDS = 30
+
+SHARD_KEY = "monitor:shard:{shard}"
+MEMBERS_KEY = "monitor:members"
+
+# Extend / drop a lease only while we still hold it
+RENEW_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+class ShardLeases:
+    """
+    Splits monitoring between every process running a scheduler, across
+    gunicorn workers and hosts, so each wallet is monitored by exactly one.
+
+    Wallets are divided into `shards` by wallet id (id % shards). Each shard
+    is a Redis key holding its owner with a TTL; heartbeat() renews the
+    shards this process holds and claims free ones, and must run well within
+    the TTL. Live processes register in a sorted set, so each one takes at
+    most its fair share - ceil(shards / processes) - and hands surplus
+    shards back when others join. A process that dies stops renewing; its
+    shards expire and are picked up by the rest.
+
+    If Redis can't be reached, shards are kept only until their last lease
+    would have expired, so two processes never own the same shard.
+
+    Monitor cycles run inside holding(). Surplus shards are not handed back
+    while a cycle holds them, only once it ends, so another process never
+    picks up a wallet that a running cycle is still writing.
+    """
+
+    def __init__(self, client, shards=DEFAULT_SHARDS, ttl=DEFAULT_LEASE_TTL_SECONDS):
+        self.client = client
+        self.shards = max(1, shards)
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._expires = {}  # shard -> monotonic time our lease runs out
+        self._lock = threading.Lock()
+        self._holds = 0
+        self._surplus = set()  # Shards to hand back once no cycle holds them
+
+    @property
+    def owned(self):
+        now = time.monotonic()
+        with self._lock:
+            return {shard for shard, expires in self._expires.items() if expires > now}
+
+    def owns(self, wallet_id):
+        return wallet_id % self.shards in self.owned
+
+    @property
+    def is_leader(self):
+        """Holder of shard 0 also runs the work that isn't split per wallet"""
+        return 0 in self.owned
+
+    def heartbeat(self):
+        """Renew held shards, then claim or release shards to reach a fair share"""
+        started = time.monotonic()
+        try:
+            fair_share = math.ceil(self.shards / self._register_member())
+            renewed = {shard for shard in self.owned if self._renew(shard)}
+            with self._lock:
+                self._expires = {shard: started + self.ttl for shard in renewed}
+
+            surplus = sorted(renewed)[fair_share:]
+            with self._lock:
+                # A running cycle may still write these shards' wallets; holding() hands them back
+                deferred = bool(self._holds)
+                self._surplus = set(surplus) if deferred else set()
+            if deferred:
+                surplus = []
+            for shard in surplus:
+                self._release(shard)
+            claimed = set()
+            if len(renewed) < fair_share:
+                claimed = self._claim(fair_share - len(renewed), started)
+        except redis.RedisError as e:
+            logger.warning(f"Monitor shard heartbeat failed, keeping leases until they expire: {e}")
+            return self.owned
+
+        if surplus or claimed:
+            logger.info(f"Monitor shards: claimed {sorted(claimed)}, released {surplus}, own {sorted(self.owned)}")
+        return self.owned
+
+    @contextmanager
+    def holding(self):
+        """Keep every owned shard (renewing, not releasing) until the block exits"""
+        with self._lock:
+            self._holds += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._holds -= 1
+                surplus = set() if self._holds else self._surplus
+                if not self._holds:
+                    self._surplus = set()
+            for shard in sorted(surplus):
+                try:
+                    self._release(shard)
+                except redis.RedisError:
+                    pass  # It expires on its own
+
+    def release_all(self):
+        for shard in self.owned:
+            try:
+                self._release(shard)
+            except redis.RedisError:
+                pass
+        try:
+            self.client.zrem(MEMBERS_KEY, self.owner)
+        except redis.RedisError:
+            pass
+
+    def _register_member(self):
+        """Heartbeat into the members set; returns the number of live members"""
+        now = time.time()
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zadd(MEMBERS_KEY, {self.owner: now})
+        pipe.zremrangebyscore(MEMBERS_KEY, '-inf', now - self.ttl)
+        pipe.zcard(MEMBERS_KEY)
+        return max(1, pipe.execute()[-1])
+
+    def _claim(self, wanted, started):
+        # Start at an owner-specific offset so processes don't all race for the same shards
+        offset = hash(self.owner) % self.shards
+        claimed = set()
+        for i in range(self.shards):
+            if len(claimed) >= wanted:
+                break
+            shard = (offset + i) % self.shards
+            if shard in self.owned:
+                continue
+            if self.client.set(SHARD_KEY.format(shard=shard), self.owner, nx=True, px=int(self.ttl * 1000)):
+                claimed.add(shard)
+                with self._lock:
+                    self._expires[shard] = started + self.ttl
+        return claimed
+
+    def _renew(self, shard):
+        return bool(self.client.eval(RENEW_LEASE_SCRIPT, 1, SHARD_KEY.format(shard=shard), self.owner, int(self.ttl * 1000)))
+
+    def _release(self, shard):
+        with self._lock:
+            self._expires.pop(shard, None)
+        self.client.eval(RELEASE_LEASE_SCRIPT, 1, SHARD_KEY.format(shard=shard), self.owner)
@@ -1,93 +1,264 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from datetime import datetime, timezone
 import logging
+import threading
+import time
+from contextlib import nullcontext
 from api.models import db
 from api.models.wallet import Wallet
-from api.models.transaction import Transaction
 from api.services.web3_service import Web3Service
+from api.services.transaction_store import bulk_insert_transactions
+from api.services.gas_enrichment import enrich_gas, DEFAULT_BATCH_SIZE as DEFAULT_GAS_BATCH_SIZE
+from api.services.log_store import FINALITY_DEPTH
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_CONCURRENCY = 16
+DEFAULT_CYCLE_DEADLINE_SECONDS = 50
+DEFAULT_MAX_PAGES = 10
+DEFAULT_CONFIRMATIONS = FINALITY_DEPTH
+
 class WalletMonitor:
-    def __init__(self):
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, cycle_deadline=DEFAULT_CYCLE_DEADLINE_SECONDS,
+                 max_pages=DEFAULT_MAX_PAGES, gas_batch_size=DEFAULT_GAS_BATCH_SIZE, leases=None,
+                 confirmations=DEFAULT_CONFIRMATIONS):
         self.web3_service = Web3Service()
+        self.concurrency = max(1, concurrency)
+        self.cycle_deadline = cycle_deadline
+        # Caps transfer pages fetched per wallet per cycle so a first-time
+        # backfill of a busy wallet is spread over several cycles
+        self.max_pages = max_pages
+        # Sync cursors stay this many blocks behind the head; the blocks above
+        # are re-read every cycle in case of a reorg or a lagging indexer
+        self.confirmations = confirmations
+        # Receipts fetched per cycle to backfill gas on outgoing transactions
+        self.gas_batch_size = gas_batch_size
+        self.last_cycle = None
+        # ShardLeases when several processes share the monitoring; None monitors every wallet
+        self.leases = leases
+        # The polling sweep and the block listener run on different threads;
+        # one cycle at a time keeps their sync cursors from racing
+        self._cycle_lock = threading.Lock()
     
     def monitor_all_wallets(self):
         """Check all registered wallets for updates"""
         logger.info("Starting wallet monitoring cycle")
+        with self._cycle_lock, self._holding_shards():
+            return self._run_cycle(self._owned(Wallet.query.all()))
+    
+    def refresh_wallets(self, addresses, head=None):
+        """Check only the given wallets, e.g. the ones a new block touched"""
+        if not addresses:
+            return None
+        with self._cycle_lock, self._holding_shards():
+            return self._run_cycle(self._owned(Wallet.query.filter(Wallet.address.in_(addresses)).all()), head)
+    
+    def monitor_due_wallets(self, schedule):
+        """
+        Check only the wallets a PollSchedule says are due, most overdue
+        first, then reschedule each by whether anything changed.
+        """
+        from api.models.alert import Alert
         
-        wallets = Wallet.query.all()
-        
-        for wallet in wallets:
+        with self._cycle_lock, self._holding_shards():
+            addresses = [row.address for row in self._owned(Wallet.query.with_entities(Wallet.id, Wallet.address))]
+            alerted = Wallet.query.join(Alert).filter(Alert.is_active.is_(True)).with_entities(Wallet.address)
+            schedule.sync(addresses, {address for (address,) in alerted.distinct()})
+            
+            due = schedule.pop_due()
+            outcomes = {}
             try:
-                self.check_wallet(wallet)
-            except Exception as e:
-                logger.error(f"Error monitoring wallet {wallet.address}: {e}")
+                if not due:
+                    return None
+                logger.info(f"Starting wallet monitoring cycle - {len(due)}/{len(addresses)} wallets due")
+                order = {address: i for i, address in enumerate(due)}
+                wallets = sorted(Wallet.query.filter(Wallet.address.in_(due)).all(), key=lambda w: order[w.address])
+                return self._run_cycle(wallets, outcomes=outcomes)
+            finally:
+                for address in due:
+                    if address in outcomes:
+                        schedule.record(address, outcomes[address])
+                    else:
+                        schedule.retry(address)
+    
+    def _holding_shards(self):
+        """Keep this process's shards for the whole cycle; surplus is handed back after it"""
+        return nullcontext() if self.leases is None else self.leases.holding()
+    
+    def _owned(self, wallets):
+        """The wallets (anything with an id) this process is responsible for"""
+        if self.leases is None:
+            return list(wallets)
+        owned, shards = self.leases.owned, self.leases.shards
+        return [wallet for wallet in wallets if wallet.id % shards in owned]
+    
+    def _run_cycle(self, wallets, head=None, outcomes=None):
+        """
+        Chain data is fetched for many wallets at once on a bounded thread
+        pool; results are written to the DB from this thread only, so the
+        workers never touch the SQLAlchemy session.
+        
+        outcomes, if given, is filled with address -> whether the wallet
+        changed, for every wallet that was updated.
+        """
+        started = time.monotonic()
+        stats = {'wallets': len(wallets), 'updated': 0, 'failed': 0, 'timed_out': 0, 'gas_enriched': 0}
+        
+        # One head per cycle: every wallet syncs up to the same block
+        if head is None:
+            head = self.web3_service.get_latest_block_number()
+        
+        # All balances in a handful of JSON-RPC batches instead of one call per wallet
+        balances = self.fetch_balances([wallet.address for wallet in wallets], head)
+        
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='wallet-monitor')
+        futures = {
+            executor.submit(self.fetch_wallet_data, wallet.address, wallet.last_synced_block, head): wallet
+            for wallet in wallets
+        }
+        
+        try:
+            for future in as_completed(futures, timeout=self.cycle_deadline):
+                wallet = futures[future]
+                try:
+                    data = future.result()
+                    data['balance'] = balances.get(wallet.address)
+                    if self.leases is not None and not self.leases.owns(wallet.id):
+                        # The lease expired mid-cycle (e.g. Redis was unreachable) and may be another process's now
+                        stats['failed'] += 1
+                        logger.warning(f"Lost the shard lease for wallet {wallet.address}, skipping its update")
+                        continue
+                    changed = self.apply_wallet_data(wallet, data)
+                    if outcomes is not None:
+                        outcomes[wallet.address] = changed
+                    stats['updated'] += 1
+                except Exception as e:
+                    db.session.rollback()
+                    stats['failed'] += 1
+                    logger.error(f"Error monitoring wallet {wallet.address}: {e}")
+        except FuturesTimeoutError:
+            stats['timed_out'] = len(wallets) - stats['updated'] - stats['failed']
+            logger.warning(
+                f"Monitoring cycle hit its {self.cycle_deadline}s deadline - "
+                f"{stats['timed_out']} wallets deferred to the next cycle"
+            )
+        finally:
+            # Don't wait for in-flight RPC calls past the deadline
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        # Spend what's left of the deadline on receipts for newly stored
+        # transactions - one process does this when the monitoring is sharded
+        if time.monotonic() - started < self.cycle_deadline and (self.leases is None or self.leases.is_leader):
+            stats['gas_enriched'] = self.backfill_gas()
         
-        logger.info(f"Completed monitoring {len(wallets)} wallets")
+        stats['duration_seconds'] = round(time.monotonic() - started, 3)
+        self.last_cycle = stats
+        
+        logger.info(
+            f"Completed monitoring {stats['updated']}/{stats['wallets']} wallets "
+            f"in {stats['duration_seconds']}s (failed: {stats['failed']}, "
+            f"timed out: {stats['timed_out']}, gas enriched: {stats['gas_enriched']}, "
+            f"concurrency: {self.concurrency})"
+        )
+        return stats
+    
+    def backfill_gas(self):
+        """Fill in receipt gas data for one batch of outgoing transactions"""
+        try:
+            return enrich_gas(self.web3_service, self.gas_batch_size)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error enriching transaction gas: {e}")
+            return 0
+    
+    def fetch_balances(self, addresses, block_identifier='latest'):
+        """Batch-fetch balances (ETH) for many addresses; failed addresses are left out"""
+        if not addresses:
+            return {}
+        
+        balances, errors = self.web3_service.get_balances(addresses, block_identifier)
+        if errors:
+            logger.error(f"Failed to fetch balances for {len(errors)} wallets, e.g. {next(iter(errors.items()))}")
+        return balances
+    
+    def fetch_wallet_data(self, address, last_synced_block=None, head=None):
+        """
+        Fetch transfers since the wallet's sync cursor (no DB access - runs on
+        worker threads). A wallet without a cursor is backfilled from genesis.
+        Transfers are read up to the head, but the returned cursor never
+        passes head - confirmations.
+        """
+        from_block = 0 if last_synced_block is None else last_synced_block + 1
+        if head is None:
+            head = self.web3_service.get_latest_block_number()
+        
+        if head is not None and from_block > head:
+            return {'transactions': [], 'synced_through': last_synced_block}
+        
+        transactions, synced_through = self.web3_service.get_transfers(
+            address, from_block, head, max_pages=self.max_pages
+        )
+        return {'transactions': transactions, 'synced_through': min(synced_through, head - self.confirmations)}
     
     def check_wallet(self, wallet):
         """Check a single wallet for new transactions"""
-        # Get current balance (now returns float in ETH)
-        current_balance = self.web3_service.get_balance(wallet.address)
+        head = self.web3_service.get_latest_block_number()
+        data = self.fetch_wallet_data(wallet.address, wallet.last_synced_block, head)
+        data['balance'] = self.fetch_balances([wallet.address], head).get(wallet.address)
+        self.apply_wallet_data(wallet, data)
+    
+    def apply_wallet_data(self, wallet, data):
+        """Write fetched chain data for a wallet to the DB; returns True if anything changed"""
+        # Current balance (float in ETH), None if it couldn't be fetched this cycle
+        current_balance = data.get('balance')
         old_balance = float(wallet.balance) if wallet.balance else 0.0
+        changed = False
         
         # Update balance if changed
-        if current_balance != old_balance:
+        if current_balance is not None and current_balance != old_balance:
+            changed = True
             logger.info(f"Balance changed for {wallet.address}: {old_balance} ETH -> {current_balance} ETH")
             wallet.balance = str(current_balance)
             
             # Check alerts
             self.check_alerts(wallet, current_balance)
         
-        # Fetch and store recent transactions
-        self.sync_transactions(wallet)
+        # Store new transactions, then move the cursor past them. Blocks
+        # above the cursor are fetched again, so only inserted rows are news
+        inserted = self.sync_transactions(wallet, data['transactions'])
+        if inserted is not None:
+            changed = changed or inserted > 0
+            wallet.last_synced_block = data['synced_through']
         
         # Update last monitored timestamp
         wallet.last_monitored = datetime.now(timezone.utc)
         db.session.commit()
+        return changed
     
-    def sync_transactions(self, wallet):
-        """Sync transaction history for a wallet"""
+    def sync_transactions(self, wallet, transactions=None):
+        """Sync transaction history for a wallet; returns the number of new rows, None on failure"""
         try:
-            # Fetch transactions from blockchain
-            transactions = self.web3_service.get_transactions(wallet.address)
+            # Fetch new transfers from blockchain unless the caller already has them
+            if transactions is None:
+                data = self.fetch_wallet_data(wallet.address, wallet.last_synced_block)
+                transactions = data['transactions']
+                wallet.last_synced_block = data['synced_through']
             
             if not transactions:
-                logger.info(f"No transactions found for {wallet.address}")
-                return
+                logger.info(f"No new transactions for {wallet.address}")
+                return 0
             
-            # Store new transactions
-            for tx_data in transactions:
-                # Check if transaction already exists
-                existing = Transaction.query.filter_by(
-                    tx_hash=tx_data['hash']  # Use tx_hash to match your model
-                ).first()
-                
-                if existing:
-                    continue  # Skip if already stored
-                
-                # Create new transaction record
-                transaction = Transaction(
-                    wallet_id=wallet.id,
-                    tx_hash=tx_data['hash'],  # Use tx_hash field name
-                    block_number=tx_data['block_number'],
-                    timestamp=tx_data['timestamp'],
-                    from_address=tx_data['from_address'],
-                    to_address=tx_data['to_address'],
-                    value=tx_data['value'],
-                    gas_used=tx_data['gas_used'],
-                    gas_price=tx_data['gas_price'],
-                    status=tx_data['status']
-                )
-                
-                db.session.add(transaction)
+            # Store new transactions - one set-based insert for the whole batch
+            inserted = bulk_insert_transactions(wallet.id, transactions)
             
             db.session.commit()
-            logger.info(f"Synced transactions for {wallet.address}")
+            logger.info(f"Synced {len(inserted)} new of {len(transactions)} transactions for {wallet.address}")
+            return len(inserted)
             
         except Exception as e:
             logger.error(f"Error syncing transactions for {wallet.address}: {e}")
             db.session.rollback()
+            return None
     
     def check_alerts(self, wallet, current_balance):
         """Check if any alerts should trigger"""
@@ -0,0 +1,95 @@
+import heapq
+import time
+
+DEFAULT_BACKOFF = 2.0
+
+class PollSchedule:
+    """
+    Per-wallet next-check times, so a monitor cycle only polls wallets that
+    are due instead of every registered wallet.
+
+    A wallet that changed (new transfers or a new balance) is checked again
+    after min_interval. Each check that finds nothing doubles its interval,
+    up to max_interval - or up to alert_interval while it has active alerts,
+    so alerting wallets are never polled less often than that. A wallet
+    whose check failed keeps its interval.
+
+    Due times live in a heap of (due_at, address) entries. Rescheduling
+    pushes a new entry instead of updating the old one; entries whose due
+    time no longer matches the wallet's are skipped when popped.
+    """
+
+    def __init__(self, min_interval, max_interval, alert_interval, backoff=DEFAULT_BACKOFF):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.alert_interval = max(min_interval, alert_interval)
+        self.backoff = backoff
+        self._heap = []
+        self._due_at = {}     # address -> next check time
+        self._interval = {}   # address -> current polling interval
+        self._alerted = set()
+
+    def __len__(self):
+        return len(self._due_at)
+
+    def sync(self, addresses, alerted=(), now=None):
+        """
+        Track exactly `addresses`: new wallets are due immediately, removed
+        ones are dropped. Wallets in `alerted` are pulled in to at most
+        alert_interval from now.
+        """
+        now = time.time() if now is None else now
+        addresses = set(addresses)
+        for address in set(self._due_at) - addresses:
+            del self._due_at[address]
+            del self._interval[address]
+        for address in addresses - set(self._due_at):
+            self._interval[address] = self.min_interval
+            self._schedule(address, now)
+
+        self._alerted = set(alerted) & addresses
+        for address in self._alerted:
+            self._interval[address] = min(self._interval[address], self.alert_interval)
+            due_at = self._due_at[address]
+            if due_at is not None and due_at > now + self.alert_interval:
+                self._schedule(address, now + self.alert_interval)
+
+    def pop_due(self, now=None):
+        """Addresses due by `now`, most overdue first. They stay unscheduled until record()ed"""
+        now = time.time() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due_at, address = heapq.heappop(self._heap)
+            if self._due_at.get(address) == due_at:
+                self._due_at[address] = None
+                due.append(address)
+        return due
+
+    def record(self, address, changed, now=None):
+        """Schedule the next check of a polled wallet"""
+        if address not in self._interval:
+            return
+        now = time.time() if now is None else now
+        if changed:
+            interval = self.min_interval
+        else:
+            cap = self.alert_interval if address in self._alerted else self.max_interval
+            interval = min(self._interval[address] * self.backoff, cap)
+        self._interval[address] = interval
+        self._schedule(address, now + interval)
+
+    def retry(self, address, now=None):
+        """
+        Wallet wasn't polled after all (deadline, error) - try again after its
+        current interval, so a failing wallet isn't retried on every tick
+        """
+        if address in self._interval:
+            now = time.time() if now is None else now
+            self._schedule(address, now + self._interval[address])
+
+    def interval(self, address):
+        return self._interval.get(address)
+
+    def _schedule(self, address, due_at):
+        self._due_at[address] = due_at
+        heapq.heappush(self._heap, (due_at, address))
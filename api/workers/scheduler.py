@@ -1,28 +1,118 @@
+import atexit
 from apscheduler.schedulers.background import BackgroundScheduler
+from api.cache.redis_client import cache
 from api.workers.monitor import WalletMonitor
+from api.workers.block_listener import BlockListener
+from api.workers.poll_schedule import PollSchedule
+from api.workers.coordination import ShardLeases
+from api.services.price_oracle import price_oracle
 import logging
 
 logger = logging.getLogger(__name__)
 
-def start_scheduler(app):
-    """Start background monitoring scheduler"""
-    scheduler = BackgroundScheduler()
-    monitor = WalletMonitor()
+def schedule_monitoring(app, scheduler):
+    """Add the wallet monitoring jobs to scheduler; returns (mode, monitor job interval)"""
+    leases = None
+    if app.config.get('MONITOR_COORDINATION', 'none') == 'redis':
+        # Every gunicorn worker / container runs this scheduler; shard leases
+        # make sure each wallet is still monitored by exactly one of them
+        leases = ShardLeases(
+            cache.client,
+            shards=app.config.get('MONITOR_SHARDS', 16),
+            ttl=app.config.get('MONITOR_LEASE_TTL_SECONDS', 30)
+        )
+        leases.heartbeat()
+        atexit.register(leases.release_all)
+        scheduler.add_job(
+            func=leases.heartbeat,
+            trigger='interval',
+            seconds=max(1, leases.ttl // 3),
+            id='monitor_leases',
+            name='Renew monitor shard leases',
+            replace_existing=True
+        )
+    
+    monitor = WalletMonitor(
+        concurrency=app.config.get('MONITOR_CONCURRENCY', 16),
+        cycle_deadline=app.config.get('MONITOR_CYCLE_DEADLINE_SECONDS', 50),
+        max_pages=app.config.get('SYNC_MAX_PAGES_PER_CYCLE', 10),
+        gas_batch_size=app.config.get('GAS_ENRICH_BATCH_SIZE', 1000),
+        confirmations=app.config.get('SYNC_CONFIRMATIONS', 64),
+        leases=leases
+    )
     
     # Schedule monitoring every 60 seconds
     interval = app.config.get('MONITOR_INTERVAL_SECONDS', 60)
     
-    scheduler.add_job(
-        func=lambda: monitor_with_context(app, monitor),
-        trigger='interval',
-        seconds=interval,
-        id='wallet_monitor',
-        name='Monitor all wallets',
-        replace_existing=True
-    )
+    mode = app.config.get('MONITOR_MODE', 'poll')
+    if mode == 'blocks':
+        ws_uri = app.config.get('WEB3_WS_URI')
+        if ws_uri:
+            BlockListener(
+                app, monitor, ws_uri,
+                max_catchup_blocks=app.config.get('MONITOR_MAX_CATCHUP_BLOCKS', 32)
+            ).start()
+            # New blocks drive monitoring; the full sweep only reconciles what
+            # the listener can't see (internal transfers, long disconnects)
+            interval = app.config.get('MONITOR_RECONCILE_SECONDS', 600)
+        else:
+            logger.warning("MONITOR_MODE=blocks needs WEB3_WS_URI - falling back to polling")
+            mode = 'poll'
+    
+    if mode == 'poll' and app.config.get('MONITOR_ADAPTIVE', True):
+        # Each wallet is polled on its own interval: busy ones every
+        # MONITOR_INTERVAL_SECONDS, idle ones backing off to MONITOR_MAX_POLL_SECONDS
+        schedule = PollSchedule(
+            min_interval=interval,
+            max_interval=app.config.get('MONITOR_MAX_POLL_SECONDS', 3600),
+            alert_interval=app.config.get('MONITOR_ALERT_POLL_SECONDS', 60)
+        )
+        interval = app.config.get('MONITOR_TICK_SECONDS', 15)
+        scheduler.add_job(
+            func=lambda: monitor_due_with_context(app, monitor, schedule),
+            trigger='interval',
+            seconds=interval,
+            id='wallet_monitor',
+            name='Monitor due wallets',
+            coalesce=True,
+            replace_existing=True
+        )
+        mode = 'adaptive poll'
+    else:
+        scheduler.add_job(
+            func=lambda: monitor_with_context(app, monitor),
+            trigger='interval',
+            seconds=interval,
+            id='wallet_monitor',
+            name='Monitor all wallets',
+            replace_existing=True
+        )
+    
+    return mode, interval
+
+def start_scheduler(app, monitoring=True, price_refresh=True):
+    """Start background monitoring scheduler"""
+    scheduler = BackgroundScheduler()
+    
+    if monitoring:
+        mode, interval = schedule_monitoring(app, scheduler)
+        logger.info(f"Wallet monitoring in {mode} mode, monitor job every {interval} seconds")
+    else:
+        logger.info("Wallet monitoring disabled in this process (MONITOR_ENABLED=false)")
+    
+    if price_refresh:
+        # Keep prices of recently valued tokens fresh so portfolio reads never wait on CoinGecko
+        scheduler.add_job(
+            func=price_oracle.refresh_hot,
+            trigger='interval',
+            seconds=app.config.get('PRICE_REFRESH_SECONDS', 10),
+            id='price_refresh',
+            name='Refresh hot token prices',
+            replace_existing=True
+        )
     
     scheduler.start()
-    logger.info(f"Scheduler started - monitoring every {interval} seconds")
+    logger.info("Scheduler started")
     
     return scheduler
 
@@ -30,3 +120,8 @@ def monitor_with_context(app, monitor):
     """Run monitor within Flask app context"""
     with app.app_context():
         monitor.monitor_all_wallets()
+
+def monitor_due_with_context(app, monitor, schedule):
+    """Run the due-wallets cycle within Flask app context"""
+    with app.app_context():
+        monitor.monitor_due_wallets(schedule)